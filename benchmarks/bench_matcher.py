@@ -0,0 +1,94 @@
+"""
+キーワード照合のベンチマーク。
+config.yml の辞書に合成キーワードを足して数千語まで増やし、合成レビューに対する
+照合速度 (reviews/s) を 変更前の総当たり / scan / aho-corasick / auto で比較する。
+
+使い方 (リポジトリ直下で):
+    python benchmarks/bench_matcher.py [--reviews 5000] [--sizes 0,200,1000,3000,10000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import yaml
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src'))
+
+from keyword_matcher import KeywordMatcher  # noqa: E402
+
+CONFIG_FILE = os.path.join(ROOT_DIR, 'config', 'config.yml')
+# 合成キーワード・合成レビューに使う文字 (ひらがな・カタカナと、レビューに多い漢字)
+CHARS = ([chr(c) for c in range(0x3041, 0x3094)] + [chr(c) for c in range(0x30A1, 0x30F5)]
+         + list('部屋犬広料金汚清掃食事温泉庭走写真高安宿泊朝夕散歩'))
+
+
+def legacy_categories(text, score_mapping, all_categories):
+    """変更前の calculate_score の内側のループ (カテゴリ x キーワードの総当たり)"""
+    found = set()
+    for category, keywords in all_categories.items():
+        if category in found: continue
+        for keyword in keywords:
+            if keyword in text:
+                if score_mapping.get(category) is None: continue
+                found.add(category)
+                break
+    return found
+
+
+def grow_dictionary(config, extra, rng):
+    """config.yml の各カテゴリに合成キーワードを均等に足した (fatal_risks, wow_factors) を返す"""
+    fatal = {category: list(keywords) for category, keywords in config['fatal_risks'].items()}
+    wow = {category: list(keywords) for category, keywords in config['wow_factors'].items()}
+    lists = list(fatal.values()) + list(wow.values())
+    for i in range(extra):
+        lists[i % len(lists)].append(''.join(rng.choice(CHARS) for _ in range(rng.randint(3, 7))))
+    return fatal, wow
+
+
+def make_reviews(config, count, rng):
+    """合成レビュー (約150文字、ときどき辞書のキーワードを含む)"""
+    keywords = [k for d in (config['fatal_risks'], config['wow_factors']) for ks in d.values() for k in ks]
+    reviews = []
+    for _ in range(count):
+        words = [''.join(rng.choice(CHARS) for _ in range(rng.randint(2, 8))) for _ in range(25)]
+        if rng.random() < 0.5: words.insert(rng.randrange(len(words)), rng.choice(keywords))
+        reviews.append(''.join(words)[:150])
+    return reviews
+
+
+def measure(func, reviews):
+    started = time.perf_counter()
+    for text in reviews: func(text)
+    return len(reviews) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="キーワード照合の速度比較")
+    parser.add_argument('--reviews', type=int, default=5000, help="合成レビューの件数")
+    parser.add_argument('--sizes', default='0,200,1000,3000,10000', help="config.yml に足す合成キーワード数 (カンマ区切り)")
+    args = parser.parse_args()
+
+    with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    rng = random.Random(0)
+    reviews = make_reviews(config, args.reviews, rng)
+    scores = config['scores']
+
+    print(f"合成レビュー{len(reviews)}件 (reviews/s, 大きいほど速い)")
+    print(f"{'キーワード数':>10}{'変更前':>10}{'scan':>10}{'aho-corasick':>14}{'auto':>16}")
+    for extra in (int(size) for size in args.sizes.split(',')):
+        fatal, wow = grow_dictionary(config, extra, rng)
+        all_categories = {**fatal, **wow}
+        keyword_count = sum(len(keywords) for keywords in all_categories.values())
+        matchers = {backend: KeywordMatcher(scores, fatal, wow, backend) for backend in ('scan', 'aho-corasick', 'auto')}
+        legacy = measure(lambda text: legacy_categories(text, scores, all_categories), reviews)
+        rates = {backend: measure(matcher.match, reviews) for backend, matcher in matchers.items()}
+        print(f"{keyword_count:>10}{legacy:>10.0f}{rates['scan']:>10.0f}{rates['aho-corasick']:>14.0f}"
+              f"{rates['auto']:>10.0f} ({matchers['auto'].backend})")
+
+
+if __name__ == '__main__':
+    main()
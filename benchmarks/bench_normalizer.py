@@ -0,0 +1,83 @@
+"""
+ホテル名の正規化のベンチマーク。
+合成したマスターリスト (接頭辞・記号・半角/全角の混在、重複あり) を
+変更前の normalize_name / 変換表版 normalize_name / normalize_names (キャッシュ無し・初回・2回目) で正規化し、
+所要時間 (names/s) を比較する。全ての結果が変更前と一致することも確認する。
+
+使い方 (リポジトリ直下で):
+    python benchmarks/bench_normalizer.py [--names 20000] [--unique 5000]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+import mojimoji
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src'))
+
+from name_normalizer import PREFIX_SUFFIX_REGEX, normalize_name, normalize_names  # noqa: E402
+
+PREFIXES = ['', '', 'ホテル', '那須温泉　', 'ペンション　', 'ペットと泊まれる宿　', 'Ｈｏｔｅｌ ', '旅館']
+SUFFIXES = ['', '', '（旧名：源泉の宿）', ' inn', '★', '～ペット可～', 'リゾート', '　別館']
+CHARS = list('森湖畔犬山荘ゆうわんこ那須日光鬼怒川ラフォーレエピナールＡＢＣabc１２3・＆')
+
+
+def legacy_normalize_name(name):
+    """変更前 (v3.2) の normalize_name"""
+    if not name: return ""
+    normalized = mojimoji.han_to_zen(name, kana=True, ascii=True, digit=True).lower()
+    normalized = re.sub(r'[（\(][^（）()]*[）\)]', '', normalized)
+    symbols_to_remove = '・＆～★＊！？／♪☆　・＆~★*!?/♪☆-' + ' ' + '’' + '\'' + '-'
+    normalized = ''.join(c for c in normalized if c not in symbols_to_remove)
+    normalized = re.sub(r'\s+', '', normalized)
+    for _ in range(3):
+        prev_normalized = normalized
+        normalized = PREFIX_SUFFIX_REGEX.sub('', normalized)
+        if normalized == prev_normalized: break
+    return mojimoji.zen_to_han(normalized, ascii=True, digit=True, kana=False)
+
+
+def make_names(count, unique, rng):
+    """合成したホテル名 (unique 種類の名前を count 件に水増し。同じホテルが複数サイトに載る状況)"""
+    distinct = [rng.choice(PREFIXES) + ''.join(rng.choice(CHARS) for _ in range(rng.randint(3, 10))) + rng.choice(SUFFIXES)
+                for _ in range(unique)]
+    return [rng.choice(distinct) for _ in range(count)]
+
+
+def measure(func, names):
+    started = time.perf_counter()
+    result = func(names)
+    return len(names) / (time.perf_counter() - started), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ホテル名の正規化の速度比較")
+    parser.add_argument('--names', type=int, default=20000, help="名前の件数")
+    parser.add_argument('--unique', type=int, default=5000, help="そのうちの異なる名前の数")
+    args = parser.parse_args()
+
+    names = make_names(args.names, args.unique, random.Random(0))
+    expected = [legacy_normalize_name(name) for name in names]
+    with tempfile.TemporaryDirectory() as work_dir:
+        cache_path = os.path.join(work_dir, 'name_cache.json')
+        cases = [
+            ('変更前 (1件ずつ)', lambda ns: [legacy_normalize_name(n) for n in ns]),
+            ('変換表版 (1件ずつ)', lambda ns: [normalize_name(n) for n in ns]),
+            ('一括 (キャッシュ無し)', lambda ns: normalize_names(ns, None)),
+            ('一括 (キャッシュ初回)', lambda ns: normalize_names(ns, cache_path)),
+            ('一括 (キャッシュ2回目)', lambda ns: normalize_names(ns, cache_path)),
+        ]
+        print(f"名前 {len(names)}件 (異なる名前 {len(set(names))}件, names/s, 大きいほど速い)")
+        for label, func in cases:
+            rate, result = measure(func, names)
+            assert result == expected, f"{label} の結果が変更前と一致しません"
+            print(f"{label:<20}{rate:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
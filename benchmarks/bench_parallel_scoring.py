@@ -0,0 +1,92 @@
+"""
+並列スコア計算のベンチマーク。
+合成レビューDB (一部に巨大なホテルを含む) を一時ディレクトリに作り、score_analyzer.main を
+--full --workers 1..N で実行して所要時間と速度向上率を比較する。結果が逐次計算と一致することも確認する。
+照合キャッシュは無効にして、毎回全レビューを照合する。
+
+使い方 (リポジトリ直下で):
+    python benchmarks/bench_parallel_scoring.py [--hotels 300] [--reviews 150] [--max-workers 8]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import yaml
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src'))
+
+import review_store  # noqa: E402
+import score_analyzer  # noqa: E402
+
+CONFIG_FILE = os.path.join(ROOT_DIR, 'config', 'config.yml')
+CHARS = [chr(c) for c in range(0x3041, 0x3094)] + list('部屋犬広料金汚清掃食事温泉庭走写真高安宿泊朝夕散歩')
+
+
+def build_store(store_dir, hotels, reviews_per_hotel, rng):
+    """合成レビューDB。10軒に1軒は平均の20倍のレビューを持つ (1軒が最後まで残る状況を作る)"""
+    with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    keywords = [k for d in (config['fatal_risks'], config['wow_factors']) for ks in d.values() for k in ks]
+    store = review_store.ReviewStore(store_dir)
+    total = 0
+    for h in range(hotels):
+        count = rng.randint(0, reviews_per_hotel * 2) * (20 if h % 10 == 0 else 1)
+        reviews = []
+        for _ in range(count):
+            text = ''.join(rng.choice(CHARS) for _ in range(150))
+            if rng.random() < 0.4: text += rng.choice(keywords)
+            reviews.append({'date': (date.today() - timedelta(days=rng.randint(0, 1500))).isoformat(), 'text': text})
+        store[f"rakuten_{h}"] = {'hotel_name': f"ホテル{h}番", 'source': 'rakuten', 'url': '',
+                                 'last_updated': '2025-10-01T00:00:00', 'reviews': reviews}
+        total += count
+    store.flush()
+    return total
+
+
+def run_analyzer(workers):
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        score_analyzer.main(['--full', '--workers', str(workers)])
+    elapsed = time.perf_counter() - started
+    with open(score_analyzer.OUTPUT_FILE, 'r', encoding='utf-8') as f:
+        return elapsed, f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="並列スコア計算の速度比較")
+    parser.add_argument('--hotels', type=int, default=300, help="合成ホテル数")
+    parser.add_argument('--reviews', type=int, default=150, help="1軒あたりの平均レビュー数")
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1, help="試すプロセス数の上限")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        total = build_store(os.path.join(work_dir, 'store'), args.hotels, args.reviews, random.Random(0))
+        score_analyzer.STORE_DIR = os.path.join(work_dir, 'store')
+        score_analyzer.INPUT_FILE = None
+        score_analyzer.CONFIG_FILE = CONFIG_FILE
+        score_analyzer.OUTPUT_FILE = os.path.join(work_dir, 'analysis_results.json')
+        score_analyzer.STATE_FILE = os.path.join(work_dir, 'analysis_state.json.gz')
+        score_analyzer.MATCH_CACHE_FILE = None
+        score_analyzer.HISTORY_FILE = os.path.join(work_dir, 'score_history.json')
+        score_analyzer.ENTITY_MAP_FILE = os.path.join(work_dir, 'hotel_id_map.json')
+        score_analyzer.NAME_CACHE_FILE = os.path.join(work_dir, 'name_cache.json')
+
+        print(f"合成レビュー {total}件 / {args.hotels}軒 (CPU {os.cpu_count()}コア)")
+        print(f"{'プロセス数':>8}{'秒':>10}{'速度向上':>10}")
+        baseline, expected = run_analyzer(1)
+        print(f"{1:>8}{baseline:>10.2f}{1.0:>10.2f}")
+        for workers in range(2, args.max_workers + 1):
+            elapsed, output = run_analyzer(workers)
+            assert output == expected, f"{workers}プロセスの結果が逐次計算と一致しません"
+            print(f"{workers:>8}{elapsed:>10.2f}{baseline / elapsed:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
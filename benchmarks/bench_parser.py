@@ -0,0 +1,81 @@
+"""
+HTML抽出バックエンドのベンチマーク。
+tests/fixtures の保存済みページを各バックエンドで繰り返し解析し、1秒あたりの解析ページ数を表示する。
+
+使い方 (リポジトリ直下で):
+    python benchmarks/bench_parser.py [--seconds 2]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src'))
+
+from bs4 import BeautifulSoup  # noqa: E402
+import page_parser  # noqa: E402
+from review_scraper import parse_review_page  # noqa: E402
+from rakuten_master_builder import extract_hotels as extract_rakuten_hotels  # noqa: E402
+from jalan_master_builder import extract_hotels as extract_jalan_hotels  # noqa: E402
+
+FIXTURE_DIR = os.path.join(ROOT_DIR, 'tests', 'fixtures')
+SEARCH_URL = 'https://search.travel.rakuten.co.jp/ds/undated/search?f_page=1'
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name), 'rb') as f:
+        return f.read()
+
+
+def legacy_jalan_review_parse(content):
+    """変更前の方式: 全体を一度解析して '件' を確認し、CP932 指定でもう一度解析する"""
+    temp_soup = BeautifulSoup(content, 'html.parser')
+    encoding_to_use = None if '件' in temp_soup.get_text() else 'CP932'
+    soup = BeautifulSoup(content, 'html.parser', from_encoding=encoding_to_use)
+    return soup.select('div.jlnpc-kuchikomiCassette__contWrap')
+
+
+def build_cases(backend):
+    rakuten_review = load_fixture('rakuten_review.html')
+    jalan_review = load_fixture('jalan_kuchikomi.html')
+    rakuten_search = load_fixture('rakuten_search.html')
+    jalan_search = load_fixture('jalan_search.html')
+    return {
+        '楽天 レビュー': lambda: parse_review_page(rakuten_review, 'rakuten', 1, backend=backend),
+        'じゃらん クチコミ (CP932)': lambda: parse_review_page(jalan_review, 'jalan', 1, backend=backend),
+        '楽天 検索結果': lambda: extract_rakuten_hotels(rakuten_search, SEARCH_URL, backend=backend),
+        'じゃらん 検索結果 (CP932)': lambda: extract_jalan_hotels(jalan_search, backend=backend),
+    }
+
+
+def measure(func, seconds):
+    func()  # ウォームアップ
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        func()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTML抽出バックエンドのベンチマーク")
+    parser.add_argument('--seconds', type=float, default=2.0, help="1ケースあたりの計測時間(秒)")
+    args = parser.parse_args()
+
+    print(f"{'ケース':<28}{'バックエンド':<14}{'ページ/秒':>10}")
+    print("-" * 54)
+    jalan_review = load_fixture('jalan_kuchikomi.html')
+    rate = measure(lambda: legacy_jalan_review_parse(jalan_review), args.seconds)
+    print(f"{'じゃらん クチコミ (従来の二重解析)':<22}{'html.parser':<14}{rate:>10.1f}")
+
+    for backend_name in ['html.parser', 'lxml']:
+        backend = page_parser.get_backend(backend_name)
+        for case_name, func in build_cases(backend).items():
+            rate = measure(func, args.seconds)
+            print(f"{case_name:<24}{backend_name:<14}{rate:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
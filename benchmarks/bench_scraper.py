@@ -0,0 +1,164 @@
+"""
+スクレイパーのスループット計測 (ネットワーク不要)。
+tests/stub_server.py の代替サーバーを起動し、review_scraper の各モードとマスター生成を
+子プロセスで実行して、hotels/s・pages/s・解析時間・最大メモリ (RSS) を表示する。
+async モードの同時通信数は review_scraper.ASYNC_FETCH_THREADS (既定32) が上限になる (通信はスレッドで実行するため)。
+
+使い方 (リポジトリ直下で):
+    python benchmarks/bench_scraper.py [--hotels 100] [--latency 0.02] [--error-rate 0.0] [--modes async,pool,builders]
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'tests'))
+
+from stub_server import StubServer, StubSites  # noqa: E402
+
+MODES = ['async', 'pool', 'builders']
+
+
+def make_sites(hotels):
+    return StubSites(rakuten_hotels=hotels, jalan_hotels=hotels)
+
+
+def timed(func, total):
+    """
+    func のCPU時間を total (プロセス間で共有する multiprocessing.Value) に積算するラッパー。
+    スレッドごとのCPU時間で測るため、GILの待ち時間は含まない。
+    """
+    def wrapper(*args, **kwargs):
+        started = time.thread_time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with total.get_lock():
+                total.value += time.thread_time() - started
+    return wrapper
+
+
+def peak_rss_mb():
+    """自プロセスと子プロセス (Poolの作業員) のうち大きい方の最大RSS (MB)"""
+    peak_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak_kb / 1024
+
+
+def write_master_csv(path, urls):
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        f.write('hotel_name,url\n')
+        for i, url in enumerate(urls):
+            f.write(f'hotel{i},{url}\n')
+
+
+def run_review_scraper(mode, sites, workdir, rate, parse_total):
+    import http_cache
+    import rate_control
+    import review_scraper
+
+    rakuten_csv = os.path.join(workdir, 'rakuten.csv')
+    jalan_csv = os.path.join(workdir, 'jalan.csv')
+    write_master_csv(rakuten_csv, [StubServer.rakuten_review_url(i) for i in sites.rakuten_ids])
+    write_master_csv(jalan_csv, [StubServer.jalan_review_url(i) for i in sites.jalan_ids])
+
+    review_scraper.RAKUTEN_MASTER_FILE = rakuten_csv
+    review_scraper.JALAN_MASTER_FILE = jalan_csv
+    review_scraper.STORE_DIR = os.path.join(workdir, 'store')
+    review_scraper.DATA_FILE = os.path.join(workdir, 'legacy.json')
+    review_scraper.JOURNAL_FILE = os.path.join(workdir, 'journal.jsonl')
+    review_scraper.REQUESTS_PER_SECOND = rate
+    http_cache.CACHE_DIR = os.path.join(workdir, 'cache')
+    for host in rate_control.HOST_RATE_LIMITS: rate_control.HOST_RATE_LIMITS[host] = rate
+    review_scraper.parse_review_page = timed(review_scraper.parse_review_page, parse_total)
+
+    review_scraper.main(['--mode', mode, '--full'])
+    return len(sites.rakuten_ids) + len(sites.jalan_ids)
+
+
+def run_builders(sites, workdir, rate, parse_total):
+    import http_cache
+    import jalan_master_builder
+    import rakuten_master_builder
+    import rate_control
+
+    http_cache.CACHE_DIR = os.path.join(workdir, 'cache')
+    for host in rate_control.HOST_RATE_LIMITS: rate_control.HOST_RATE_LIMITS[host] = rate
+    for module, url in ((rakuten_master_builder, StubServer.rakuten_search_url()),
+                        (jalan_master_builder, StubServer.jalan_search_url())):
+        url_list = os.path.join(workdir, module.__name__ + '.txt')
+        with open(url_list, 'w', encoding='utf-8') as f:
+            f.write(url + '\n')
+        module.URL_LIST_FILE = url_list
+        module.OUTPUT_FILE = os.path.join(workdir, module.__name__ + '.csv')
+        module.INDEX_FILE = os.path.join(workdir, module.__name__ + '.json')
+        module.extract_hotels = timed(module.extract_hotels, parse_total)
+        module.main()
+    return len(sites.rakuten_ids) + len(sites.jalan_ids)
+
+
+def child_main(args):
+    """子プロセス側: 1モードを実行し、計測結果をJSONで1行出力する"""
+    sites = make_sites(args.hotels)
+    parse_total = multiprocessing.Value('d', 0.0) # fork した Pool の作業員とも共有される
+    with tempfile.TemporaryDirectory() as workdir:
+        started = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            if args.child == 'builders':
+                hotels = run_builders(sites, workdir, args.rate, parse_total)
+            else:
+                hotels = run_review_scraper(args.child, sites, workdir, args.rate, parse_total)
+        elapsed = time.perf_counter() - started
+    print(json.dumps({'hotels': hotels, 'seconds': elapsed, 'parse_seconds': parse_total.value, 'peak_rss_mb': peak_rss_mb()}))
+
+
+def run_mode(mode, server, args):
+    before = server.stats['requests']
+    env = dict(os.environ, SCRAPER_HOST_OVERRIDES=server.host_overrides_env())
+    command = [sys.executable, os.path.abspath(__file__), '--child', mode,
+               '--hotels', str(args.hotels), '--rate', str(args.rate)]
+    completed = subprocess.run(command, env=env, cwd=os.path.join(ROOT_DIR, 'src'),
+                               capture_output=True, text=True, check=True)
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['pages'] = server.stats['requests'] - before
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="代替サーバーを使ったスクレイパーのスループット計測")
+    parser.add_argument('--hotels', type=int, default=100, help="各サイトのホテル数")
+    parser.add_argument('--latency', type=float, default=0.02, help="代替サーバーの応答遅延（秒）")
+    parser.add_argument('--jitter', type=float, default=0.0, help="応答遅延に足すランダムな揺らぎの上限（秒）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="503 を返す確率")
+    parser.add_argument('--rate', type=float, default=1000.0, help="ホスト別のリクエストレート上限 (req/s)")
+    parser.add_argument('--modes', default=','.join(MODES), help="計測するモード (カンマ区切り)")
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child_main(args)
+        return
+
+    server = StubServer(make_sites(args.hotels), latency=args.latency, jitter=args.jitter,
+                        error_rate=args.error_rate, retry_after=0).start()
+    print(f"代替サーバー: {server.base_url} (ホテル{args.hotels}件 x 2サイト, 遅延{args.latency}秒, エラー率{args.error_rate})")
+    print(f"{'モード':<10}{'ホテル':>8}{'ページ':>8}{'秒':>9}{'hotels/s':>11}{'pages/s':>10}{'解析CPU秒':>9}{'最大RSS(MB)':>13}")
+    try:
+        for mode in args.modes.split(','):
+            r = run_mode(mode, server, args)
+            print(f"{mode:<10}{r['hotels']:>8}{r['pages']:>8}{r['seconds']:>9.2f}{r['hotels'] / r['seconds']:>11.1f}"
+                  f"{r['pages'] / r['seconds']:>10.1f}{r['parse_seconds']:>9.2f}{r['peak_rss_mb']:>13.1f}")
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+ストリーミング分析のメモリ使用量のベンチマーク。
+合成レビューDB (既定で100万件) を一時ディレクトリに作り、score_analyzer.main を
+通常の分析とストリーミング分析 (--stream) で、全件の分析と差分の無い2回目の分析の両方について実行し、
+所要時間と最大RSS (ru_maxrss) を比較する。各実行は別プロセスで行い、結果が一致することも確認する。
+照合キャッシュは無効にして、全件の分析では毎回全レビューを照合する。
+
+使い方 (リポジトリ直下で):
+    python benchmarks/bench_stream_memory.py [--hotels 2000] [--reviews 500]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import yaml
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src'))
+
+import review_store  # noqa: E402
+import score_analyzer  # noqa: E402
+
+CONFIG_FILE = os.path.join(ROOT_DIR, 'config', 'config.yml')
+CHARS = [chr(c) for c in range(0x3041, 0x3094)] + list('部屋犬広料金汚清掃食事温泉庭走写真高安宿泊朝夕散歩')
+
+
+def build_store(store_dir, hotels, reviews_per_hotel, rng):
+    """合成レビューDB (本文は2万種類から選ぶ。1軒あたりの件数は平均 reviews_per_hotel、最大でその3倍)"""
+    with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    keywords = [k for d in (config['fatal_risks'], config['wow_factors']) for ks in d.values() for k in ks]
+    texts = [''.join(rng.choice(CHARS) for _ in range(100)) + (rng.choice(keywords) if rng.random() < 0.4 else '')
+             for _ in range(20000)]
+    today = date.today()
+    store = review_store.ReviewStore(store_dir)
+    total = 0
+    for h in range(hotels):
+        count = reviews_per_hotel * 3 if h == 0 else rng.randint(0, reviews_per_hotel * 2)
+        reviews = [{'date': (today - timedelta(days=rng.randint(0, 1500))).isoformat(), 'text': rng.choice(texts)}
+                   for _ in range(count)]
+        store[f"rakuten_{h}"] = {'hotel_name': f"ホテル{h}番", 'source': 'rakuten', 'url': '',
+                                 'last_updated': '2025-10-01T00:00:00', 'reviews': reviews}
+        total += count
+    store.flush()
+    return total
+
+
+def run_child(work_dir, argv):
+    """子プロセス側: score_analyzer.main を1回実行し、所要時間と最大RSS (MB) を JSON で出力する"""
+    score_analyzer.STORE_DIR = os.path.join(work_dir, 'store')
+    score_analyzer.INPUT_FILE = None
+    score_analyzer.CONFIG_FILE = CONFIG_FILE
+    score_analyzer.MATCH_CACHE_FILE = None
+    for name, file_name in [('OUTPUT_FILE', 'analysis_results.json'), ('STATE_FILE', 'analysis_state.json.gz'),
+                            ('HISTORY_FILE', 'score_history.json'), ('ENTITY_MAP_FILE', 'hotel_id_map.json'),
+                            ('NAME_CACHE_FILE', 'name_cache.json')]:
+        setattr(score_analyzer, name, os.path.join(work_dir, file_name))
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        score_analyzer.main(argv)
+    elapsed = time.perf_counter() - started
+    print(json.dumps({'seconds': elapsed, 'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+
+def measure(work_dir, argv):
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', work_dir, *argv],
+                               check=True, capture_output=True, text=True)
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    with open(os.path.join(work_dir, 'analysis_results.json'), 'r', encoding='utf-8') as f:
+        result['output'] = f.read()
+    return result
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        run_child(sys.argv[2], sys.argv[3:])
+        return
+    parser = argparse.ArgumentParser(description="通常の分析とストリーミング分析の最大RSSの比較")
+    parser.add_argument('--hotels', type=int, default=2000, help="合成ホテル数")
+    parser.add_argument('--reviews', type=int, default=500, help="1軒あたりの平均レビュー数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        started = time.perf_counter()
+        total = build_store(os.path.join(work_dir, 'store'), args.hotels, args.reviews, random.Random(0))
+        print(f"合成レビュー {total}件 / {args.hotels}軒 (最大のホテル {args.reviews * 3}件, 作成 {time.perf_counter() - started:.0f}秒)")
+        print(f"{'モード':<24}{'秒':>8}{'最大RSS (MB)':>14}")
+        outputs = set()
+        for label, argv in [('通常 (全件)', ['--full']), ('通常 (差分なし)', []),
+                            ('ストリーミング (全件)', ['--full', '--stream']), ('ストリーミング (差分なし)', ['--stream'])]:
+            result = measure(work_dir, argv)
+            outputs.add(result['output'])
+            print(f"{label:<24}{result['seconds']:>8.1f}{result['max_rss_mb']:>14.0f}")
+        assert len(outputs) == 1, "モードによって結果が異なります"
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,6 @@
+import argparse
+import hashlib
+import io
 import json
 import os
 import sys
@@ -20,6 +23,7 @@ else:
 
 # --- ファイル設定 (変更なし) ---
 INPUT_JSON_FILE = os.path.join(project_root, 'data/output/analysis_results.json')
+FINGERPRINT_FILE = os.path.join(project_root, 'data/processed/db_fingerprints.json') # [NEW] 前回DBに書き込んだ各行の指紋
 
 # --- DB接続設定 (変更なし) ---
 DB_HOST = os.environ.get('DB_HOST')
@@ -28,6 +32,11 @@ DB_USER = os.environ.get('DB_USER')
 DB_PASSWORD = os.environ.get('DB_PASSWORD')
 DB_PORT = os.environ.get('DB_PORT', '6543')
 
+# --- 一括書き込み設定 [NEW] ---
+LOAD_BATCH_SIZE = 5000   # COPY でステージングテーブルに送り、まとめて UPSERT する1回あたりの件数
+STAGING_TABLE = 'hotel_analysis_staging' # 一時テーブル (トランザクション終了時に自動で削除)
+MAX_DELETE_RATIO = 0.5   # 前回書き込んだ行のうち、これより多くが分析結果から消えたら削除しない (分析の失敗とみなす)
+
 # --- テーブル情報 (変更なし) ---
 TABLE_NAME = 'hotel_analysis_results'
 # ... (COLUMNS, JSON_KEYS の定義は変更なし) ...
@@ -121,55 +130,97 @@ def load_json_data(file_path):
         print(f"エラー: {file_path} のJSON形式が不正です。詳細: {e}")
         return None
 
-# --- upsert_data 関数 (変更なし) ---
+# --- build_row 関数 [NEW] (upsert_data から切り出し) ---
+def build_row(hotel_name, analysis_data):
+    """分析結果1件を COLUMNS の順の値のリストにする (不正なデータは警告して None)"""
+    values = []
+    for col in COLUMNS:
+        key_info = JSON_KEYS[col]
+        value = None
+        if key_info is None: value = hotel_name
+        elif isinstance(key_info, tuple):
+            nested_dict = analysis_data.get(key_info[0], {})
+            value = nested_dict.get(key_info[1])
+        else: value = analysis_data.get(key_info)
+        if col == 'sources' and value is not None and not isinstance(value, list):
+             print(f"  [警告] {hotel_name}: 'sources' がリスト形式ではありません。スキップします。 Value: {value}")
+             return None
+        values.append(value)
+    return values
+
+
+def build_upsert_sql(source=None):
+    """
+    hotel_analysis_results への UPSERT 文。
+    source を渡すと VALUES ではなくそのテーブルの全行を1文で書き込む (ステージングテーブルからの取り込み用)。
+    """
+    columns = sql.SQL(', ').join(map(sql.Identifier, COLUMNS))
+    if source is None:
+        insert_sql = sql.SQL("INSERT INTO {} ({}) VALUES ({})").format(
+            sql.Identifier(TABLE_NAME), columns, sql.SQL(', ').join(sql.Placeholder() * len(COLUMNS)))
+    else:
+        insert_sql = sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {}").format(
+            sql.Identifier(TABLE_NAME), columns, columns, sql.Identifier(source))
+    update_sql_part = sql.SQL(', ').join(
+        sql.SQL("{} = EXCLUDED.{}").format(sql.Identifier(col), sql.Identifier(col))
+        for col in COLUMNS if col != 'hotel_name'
+    )
+    # 値が変わらない行は更新しない (指紋が無い初回や --full でも last_calculated_at・インデックスを無駄に更新しない)
+    changed_condition = sql.SQL("({}) IS DISTINCT FROM ({})").format(
+        sql.SQL(', ').join(sql.SQL("{}.{}").format(sql.Identifier(TABLE_NAME), sql.Identifier(col))
+                           for col in COLUMNS if col != 'hotel_name'),
+        sql.SQL(', ').join(sql.SQL("EXCLUDED.{}").format(sql.Identifier(col)) for col in COLUMNS if col != 'hotel_name'))
+    return sql.SQL("{} ON CONFLICT (hotel_name) DO UPDATE SET {}, last_calculated_at = CURRENT_TIMESTAMP WHERE {}").format(
+        insert_sql, update_sql_part, changed_condition)
+
+
+# --- COPY (text形式) 用の変換 [NEW] ---
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def array_literal(values):
+    """リストを PostgreSQL の配列リテラル ({"a","b"}) にする (sources 列 = text[] 用)"""
+    items = ('NULL' if v is None else '"' + str(v).replace('\\', '\\\\').replace('"', '\\"') + '"' for v in values)
+    return '{' + ','.join(items) + '}'
+
+
+def copy_line(values):
+    """1行分の値を COPY FROM STDIN (text形式) の1行にする。None は \\N (NULL)"""
+    fields = []
+    for value in values:
+        if value is None: fields.append('\\N'); continue
+        if isinstance(value, list): value = array_literal(value)
+        elif isinstance(value, bool): value = 't' if value else 'f'
+        elif isinstance(value, float): value = repr(value)
+        fields.append(str(value).translate(COPY_ESCAPES))
+    return '\t'.join(fields) + '\n'
+
+
+# --- upsert_data 関数 (1件ずつ書き込む従来の方式。一括書き込みに失敗したバッチの再試行にも使う) ---
 def upsert_data(conn, data):
-    # ... (関数の中身は変更なし) ...
     if not data:
         print("DBに書き込むデータがありません。")
         return 0
     cursor = None
     upserted_count = 0
-    insert_sql = sql.SQL("INSERT INTO {} ({}) VALUES ({})").format(
-        sql.Identifier(TABLE_NAME),
-        sql.SQL(', ').join(map(sql.Identifier, COLUMNS)),
-        sql.SQL(', ').join(sql.Placeholder() * len(COLUMNS))
-    )
-    update_columns = [col for col in COLUMNS if col != 'hotel_name']
-    update_sql_part = sql.SQL(', ').join(
-        sql.SQL("{} = EXCLUDED.{}").format(sql.Identifier(col), sql.Identifier(col))
-        for col in update_columns
-    )
-    upsert_sql = sql.SQL("{} ON CONFLICT (hotel_name) DO UPDATE SET {}, last_calculated_at = CURRENT_TIMESTAMP").format(
-        insert_sql,
-        update_sql_part
-    )
+    upsert_sql = build_upsert_sql()
     try:
         cursor = conn.cursor()
         print(f"{len(data)}件のデータをDBに書き込み開始...")
         for hotel_name, analysis_data in data.items():
-            values = []
-            valid_entry = True
-            for col in COLUMNS:
-                key_info = JSON_KEYS[col]
-                value = None
-                if key_info is None: value = hotel_name
-                elif isinstance(key_info, tuple):
-                    nested_dict = analysis_data.get(key_info[0], {})
-                    value = nested_dict.get(key_info[1])
-                else: value = analysis_data.get(key_info)
-                if col == 'sources' and value is not None and not isinstance(value, list):
-                     print(f"  [警告] {hotel_name}: 'sources' がリスト形式ではありません。スキップします。 Value: {value}")
-                     valid_entry = False; break
-                values.append(value)
-
-            if valid_entry:
-                try:
-                    cursor.execute(upsert_sql, tuple(values))
-                    upserted_count += 1
-                except psycopg2.Error as db_err:
-                     print(f"  [DBエラー] {hotel_name}: 書き込み中にエラー。スキップします。 詳細: {db_err}")
-                     conn.rollback() 
-            
+            values = build_row(hotel_name, analysis_data)
+            if values is None: continue
+            # 1件ごとにセーブポイントを置き、失敗した行だけを取り消す (同じトランザクションの他の行は残す)
+            cursor.execute("SAVEPOINT upsert_row")
+            try:
+                cursor.execute(upsert_sql, tuple(values))
+            except psycopg2.Error as db_err:
+                print(f"  [DBエラー] {hotel_name}: 書き込み中にエラー。スキップします。 詳細: {db_err}")
+                cursor.execute("ROLLBACK TO SAVEPOINT upsert_row")
+                continue
+            cursor.execute("RELEASE SAVEPOINT upsert_row")
+            upserted_count += 1
+
         conn.commit()
         print(f"-> {upserted_count}件のデータの書き込み（UPSERT）が完了しました。")
         return upserted_count
@@ -180,20 +231,190 @@ def upsert_data(conn, data):
     finally:
         if cursor: cursor.close()
 
-# --- main 関数 (変更なし) ---
-def main():
+
+# --- bulk_upsert_data 関数 [NEW] ---
+def bulk_upsert_data(conn, data, batch_size=LOAD_BATCH_SIZE):
+    """
+    batch_size 件ずつ、一時テーブルへ COPY FROM STDIN で送り、1文の UPSERT で本テーブルに反映する。
+    1バッチは 作成・COPY・UPSERT・コミット の数往復で済むため、往復回数は件数ではなくバッチ数に比例する。
+    一時テーブルは ON COMMIT DROP で作るため、トランザクションモードのプーラー (ポート6543) でも使える。
+    失敗したバッチはロールバックして 1件ずつの upsert_data で再試行する (行ごとのセーブポイントで不正な行だけをスキップする)。
+    """
+    if not data:
+        print("DBに書き込むデータがありません。")
+        return 0
+    rows = [(name, values) for name, values in ((n, build_row(n, d)) for n, d in data.items()) if values is not None]
+    create_sql = sql.SQL("CREATE TEMP TABLE {} ON COMMIT DROP AS SELECT {} FROM {} WITH NO DATA").format(
+        sql.Identifier(STAGING_TABLE), sql.SQL(', ').join(map(sql.Identifier, COLUMNS)), sql.Identifier(TABLE_NAME))
+    copy_sql = sql.SQL("COPY {} ({}) FROM STDIN").format(
+        sql.Identifier(STAGING_TABLE), sql.SQL(', ').join(map(sql.Identifier, COLUMNS)))
+    merge_sql = build_upsert_sql(source=STAGING_TABLE)
+    batch_size = max(1, batch_size)
+    upserted_count = 0
+    print(f"{len(data)}件のデータを {batch_size}件ずつ一括でDBに書き込み開始...")
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        buffer = io.StringIO(''.join(copy_line(values) for _, values in batch))
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(create_sql)
+                cursor.copy_expert(copy_sql, buffer)
+                cursor.execute(merge_sql)
+            conn.commit()
+            upserted_count += len(batch)
+            print(f"  {start + len(batch)}/{len(rows)}件 書き込み済み")
+        except psycopg2.Error as e:
+            print(f"  [DBエラー] {start + 1}〜{start + len(batch)}件目の一括書き込みに失敗。1件ずつ再試行します。 詳細: {e}")
+            conn.rollback()
+            upserted_count += upsert_data(conn, {name: data[name] for name, _ in batch})
+    print(f"-> {upserted_count}件のデータの書き込み（一括UPSERT）が完了しました。")
+    return upserted_count
+
+
+# --- 差分書き込み [NEW] ---
+def row_fingerprint(values):
+    """1行分の値 (COLUMNS の順) の指紋"""
+    return hashlib.sha1(json.dumps(values, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+
+def fingerprint_target():
+    """指紋を記録した書き込み先 (接続先・テーブル・列)。変われば前回の指紋は使わない"""
+    return f"{DB_HOST}:{DB_PORT}/{DB_NAME}/{TABLE_NAME}/{','.join(COLUMNS)}"
+
+
+def load_fingerprints(path, target):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return saved.get('rows', {}) if saved.get('target') == target else {}
+
+
+def save_fingerprints(path, target, fingerprints):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'target': target, 'rows': fingerprints}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def plan_delta(data, previous):
+    """
+    前回の指紋と比べて、書き込みが必要な行を求める。
+    戻り値: (追加・変更のあったデータ, 分析結果から消えたホテル名のリスト, 今回の指紋, 変更なしの件数)
+    不正な行 (build_row が None) は書き込まず、前回の指紋があればそのまま残す (削除もしない)。
+    """
+    changed, fingerprints, unchanged_count = {}, {}, 0
+    for hotel_name, analysis_data in data.items():
+        values = build_row(hotel_name, analysis_data)
+        if values is None:
+            if hotel_name in previous: fingerprints[hotel_name] = previous[hotel_name]
+            continue
+        fingerprints[hotel_name] = row_fingerprint(values)
+        if previous.get(hotel_name) == fingerprints[hotel_name]: unchanged_count += 1
+        else: changed[hotel_name] = analysis_data
+    deleted = sorted(name for name in previous if name not in data)
+    return changed, deleted, fingerprints, unchanged_count
+
+
+def load_db_hotel_names(conn):
+    """DBに今あるホテル名の一覧 (指紋が無いときに、消えたホテルを求める基準にする)"""
+    select_sql = sql.SQL("SELECT hotel_name FROM {}").format(sql.Identifier(TABLE_NAME))
+    with conn.cursor() as cursor:
+        cursor.execute(select_sql)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def delete_hotels(conn, hotel_names, batch_size=LOAD_BATCH_SIZE):
+    """分析結果から消えたホテルの行を batch_size 件ずつ削除する (まとめて1回コミット)"""
+    if not hotel_names: return 0
+    delete_sql = sql.SQL("DELETE FROM {} WHERE hotel_name = ANY(%s)").format(sql.Identifier(TABLE_NAME))
+    batch_size = max(1, batch_size)
+    with conn.cursor() as cursor:
+        for start in range(0, len(hotel_names), batch_size):
+            cursor.execute(delete_sql, (hotel_names[start:start + batch_size],))
+    conn.commit()
+    print(f"-> 分析結果から消えた {len(hotel_names)}件のホテルをDBから削除しました。")
+    return len(hotel_names)
+
+
+def sync_data(conn, data, fingerprint_path=FINGERPRINT_FILE, batch_size=LOAD_BATCH_SIZE,
+              row_by_row=False, full=False, allow_mass_delete=False):
+    """
+    前回書き込んだ行の指紋 (fingerprint_path) と比べ、追加・変更のあったホテルだけを書き込み、
+    消えたホテルの行を削除する。変更の無いホテルには一切書き込まない (last_calculated_at も更新しない)。
+    書き込みに失敗した行・削除に失敗した行は指紋に反映せず、次回もう一度送る。
+    full=True なら前回の指紋を使わずに全件を送る (値の変わらない行はDB側の条件で更新されない)。
+    指紋が無いとき (初回・data/ が残らないCI) と full=True のときは、DBにある行を前回の行として削除対象を求める。
+    戻り値: (書き込んだ件数, 削除した件数)
+    """
+    target = fingerprint_target()
+    previous = {} if full else load_fingerprints(fingerprint_path, target)
+    if not previous:
+        # 指紋の分からない前回の行として扱う (全件を送り、分析結果に無いホテルは削除する)
+        try:
+            previous = dict.fromkeys(load_db_hotel_names(conn))
+        except psycopg2.Error as e:
+            print(f"警告: DBの既存行を読み込めませんでした。今回は削除しません。 詳細: {e}")
+            conn.rollback()
+    changed, deleted, fingerprints, unchanged_count = plan_delta(data, previous)
+    added_count = sum(1 for name in changed if name not in previous)
+    print(f"差分: 追加 {added_count}件 / 変更 {len(changed) - added_count}件 / 削除 {len(deleted)}件 / 変更なし {unchanged_count}件")
+
+    if previous and len(deleted) > MAX_DELETE_RATIO * len(previous) and not allow_mass_delete:
+        print(f"警告: 前回の {len(previous)}件のうち {len(deleted)}件が分析結果にありません。"
+              f"分析の失敗の可能性があるため削除しません (削除するには --allow-mass-delete)。")
+        for name in deleted: fingerprints[name] = previous[name]
+        deleted = []
+
+    written_count = 0
+    if changed:
+        written_count = upsert_data(conn, changed) if row_by_row else bulk_upsert_data(conn, changed, batch_size)
+        if written_count != len(changed):
+            # どの行が失敗したかは分からないため、変更分は全て次回もう一度送る
+            for name in changed:
+                if name in previous: fingerprints[name] = previous[name]
+                else: fingerprints.pop(name, None)
+    deleted_count = 0
+    try:
+        deleted_count = delete_hotels(conn, deleted, batch_size)
+    except psycopg2.Error as e:
+        print(f"エラー: 削除中にエラー。次回再試行します。 詳細: {e}")
+        conn.rollback()
+        for name in deleted: fingerprints[name] = previous[name]
+    save_fingerprints(fingerprint_path, target, fingerprints)
+    return written_count, deleted_count
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="分析結果を hotel_analysis_results に書き込む")
+    parser.add_argument('--batch-size', type=int, default=LOAD_BATCH_SIZE,
+                        help=f"一括書き込み1回あたりの件数 (既定 {LOAD_BATCH_SIZE})")
+    parser.add_argument('--row-by-row', action='store_true', help="従来どおり1件ずつ書き込む (COPY を使わない)")
+    parser.add_argument('--full', action='store_true', help="前回の指紋を使わずに全件を書き込む")
+    parser.add_argument('--allow-mass-delete', action='store_true',
+                        help=f"前回の {MAX_DELETE_RATIO:.0%} より多くのホテルが消えていても削除する")
+    return parser.parse_args(argv)
+
+
+# --- main 関数 [変更] 差分だけを一括書き込み (COPY + ステージングテーブル) する ---
+def main(argv=None):
     """メイン処理"""
+    args = parse_args(argv)
     print("データベースローダー (Supabase IPv4 Fix v3) を起動します...")
     connection = get_db_connection()
     if not connection: return
     analysis_data = load_json_data(INPUT_JSON_FILE)
-    processed_count = 0
+    processed_count, deleted_count = 0, 0
     if analysis_data:
-        processed_count = upsert_data(connection, analysis_data)
+        processed_count, deleted_count = sync_data(
+            connection, analysis_data, FINGERPRINT_FILE, args.batch_size,
+            row_by_row=args.row_by_row, full=args.full, allow_mass_delete=args.allow_mass_delete)
     if connection:
         connection.close()
         print("データベース接続を閉じました。")
-    print(f"\n処理結果: {processed_count}件のホテルデータがDBに正常に書き込まれました。")
+    print(f"\n処理結果: {processed_count}件のホテルデータがDBに正常に書き込まれ、{deleted_count}件が削除されました。")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,99 @@
+import json
+import os
+from collections import defaultdict
+
+# --- 設定項目 ---
+MAPPING_FILE = '../data/processed/hotel_id_map.json' # 名寄せ結果 (unique_id -> 同一ホテルのキー) の対応表
+NGRAM_SIZE = 2                       # 候補作り・類似度に使う文字 n-gram の長さ
+SIMILARITY_THRESHOLD = 0.8           # 正規化名の n-gram の Dice 係数がこれ以上なら同じホテルとみなす
+MAX_BLOCK_SIZE = 200                 # これより多くの名前が持つ n-gram (「温泉」「高原」など) は候補作りに使わない
+
+
+def ngrams(name, n=NGRAM_SIZE):
+    """文字 n-gram の集合 (n 文字未満の名前は名前そのもの)"""
+    if len(name) <= n: return {name} if name else set()
+    return {name[i:i + n] for i in range(len(name) - n + 1)}
+
+
+def candidate_pairs(grams, sources=None, max_block_size=MAX_BLOCK_SIZE):
+    """
+    ブロッキング: 同じ n-gram を持つ名前の組 (i < j) だけを候補にする。全ての組を比べる O(n^2) を避ける。
+    多くの名前が共有する n-gram のブロックは飛ばす (組の数が爆発し、一致の根拠にもならないため)。
+    sources を渡すと、同じサイトを含む組 (統合できない組) は候補にせず、覚えておく組も減らす。
+    """
+    blocks = defaultdict(list)
+    for i, name_grams in enumerate(grams):
+        for gram in name_grams:
+            blocks[gram].append(i)
+    seen = set()
+    for members in blocks.values():
+        if len(members) < 2 or len(members) > max_block_size: continue
+        for a in range(len(members)):
+            for b in range(a + 1, len(members)):
+                pair = (members[a], members[b])
+                if sources is not None and sources[pair[0]] & sources[pair[1]]: continue
+                if pair in seen: continue
+                seen.add(pair)
+                yield pair
+
+
+def dice(a, b):
+    """n-gram 集合の Dice 係数 (0.0〜1.0)"""
+    if not a or not b: return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def resolve(names, sources, threshold=SIMILARITY_THRESHOLD):
+    """
+    正規化名のリストを、表記ゆれを許して同じホテルごとにまとめる。
+    sources[i] は names[i] を持つホテルのサイトの集合。各サイトは同じホテルを1回しか載せないため、
+    同じサイトのホテルを含むまとまり同士は結合しない (似た名前の別館・姉妹館を誤って統合しない)。
+    類似度の高い組から順に結合し、まとまりの代表は最初に現れた名前にする。
+    戻り値: (代表の番号のリスト, [(番号, 結合先の番号, 類似度), ...])
+    """
+    grams = [ngrams(name) for name in names]
+    scored = []
+    for i, j in candidate_pairs(grams, sources):
+        similarity = dice(grams[i], grams[j])
+        if similarity >= threshold:
+            scored.append((-similarity, i, j))
+    scored.sort()
+
+    parent = list(range(len(names)))
+    cluster_sources = [set(s) for s in sources]
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    merges = []
+    for negative_similarity, i, j in scored:
+        root_i, root_j = find(i), find(j)
+        if root_i == root_j or cluster_sources[root_i] & cluster_sources[root_j]: continue
+        root, child = min(root_i, root_j), max(root_i, root_j)
+        parent[child] = root
+        cluster_sources[root] |= cluster_sources[child]
+        merges.append((j, i, -negative_similarity))
+    return [find(i) for i in range(len(names))], merges
+
+
+def save_mapping(path, hotel_groups, merges):
+    """
+    名寄せ結果を対応表として保存する (一時ファイル経由で置き換え)。
+    hotels: unique_id -> {'entity': 同一ホテルのキー, 'normalized': 正規化名}
+    merges: 表記ゆれで結合した正規化名 -> {'into': 結合先, 'similarity': 類似度}
+    """
+    table = {
+        'ngram_size': NGRAM_SIZE,
+        'threshold': SIMILARITY_THRESHOLD,
+        'hotels': {member['unique_id']: {'entity': entity_key, 'normalized': member['normalized']}
+                   for entity_key, members in hotel_groups.items() for member in members},
+        'merges': {name: {'into': into, 'similarity': round(similarity, 3)} for name, into, similarity in merges},
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(table, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
@@ -0,0 +1,213 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+from requests.structures import CaseInsensitiveDict
+
+try:
+    import http_client
+except ImportError:
+    from src import http_client
+
+# --- 設定項目 ---
+CACHE_DIR = '../data/cache/http'     # srcフォルダからの相対パス
+CACHE_MAX_AGE_DAYS = 30              # この日数より長く取得していないページのキャッシュは prune() で削除する
+CACHED_HEADERS = ('Content-Type',)   # 304 応答に付かないことが多いため、本文と一緒に保存しておくヘッダー
+
+# --- 実行中の統計 (プロセス単位) ---
+_stats_lock = threading.Lock()
+STATS = {'not_modified': 0, 'unchanged': 0, 'misses': 0, 'bytes_saved': 0, 'parse_skipped': 0}
+
+
+class CachedResponse:
+    """
+    キャッシュ層を通した取得結果。requests.Response と同じく
+    status_code / content / headers / raise_for_status() を持つ。
+    unchanged が True の場合、本文は前回取得時とハッシュが一致している。
+    """
+
+    def __init__(self, url, status_code, content, headers, content_hash=None, unchanged=False, response=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.content_hash = content_hash
+        self.unchanged = unchanged
+        self._response = response
+
+    def raise_for_status(self):
+        if self._response is not None:
+            self._response.raise_for_status()
+
+
+def _count(key, amount=1):
+    with _stats_lock:
+        STATS[key] += amount
+
+
+def _entry_paths(url):
+    key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    sub_dir = os.path.join(CACHE_DIR, key[:2])
+    return os.path.join(sub_dir, key + '.json'), os.path.join(sub_dir, key + '.body.gz')
+
+
+def _load_meta(meta_path):
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _atomic_write(path, data, mode='w'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    encoding = 'utf-8' if 'b' not in mode else None
+    with open(tmp_path, mode, encoding=encoding) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _write_meta(meta_path, meta):
+    _atomic_write(meta_path, json.dumps(meta, ensure_ascii=False))
+
+
+def fetch(url, headers=None, timeout=http_client.DEFAULT_TIMEOUT, getter=None):
+    """
+    URLを取得する。前回の ETag / Last-Modified があれば条件付きリクエストを送り、
+    304 の場合はディスク上の本文を返す。200 の場合は本文ハッシュを前回と比較する。
+    キャッシュ対象は 200 応答のみ (404 などはそのまま返す)。
+    """
+    getter = getter or http_client.get
+    meta_path, body_path = _entry_paths(url)
+    meta = _load_meta(meta_path)
+
+    request_headers = dict(headers or {})
+    if meta and os.path.exists(body_path):
+        if meta.get('etag'): request_headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'): request_headers['If-Modified-Since'] = meta['last_modified']
+    else:
+        meta = None
+
+    response = getter(url, headers=request_headers, timeout=timeout)
+
+    if response.status_code == 304 and meta:
+        with open(body_path, 'rb') as f:
+            content = gzip.decompress(f.read())
+        _count('not_modified'); _count('bytes_saved', len(content))
+        meta['fetched_at'] = time.time()
+        _write_meta(meta_path, meta)
+        # 保存しておいたヘッダー (Content-Type など) に 304 応答のヘッダーを重ね、文字コード判定を取得時と揃える
+        merged_headers = CaseInsensitiveDict(meta.get('headers', {}))
+        merged_headers.update(response.headers)
+        return CachedResponse(url, 200, content, merged_headers, meta['content_hash'], unchanged=True)
+
+    if response.status_code != 200:
+        return CachedResponse(url, response.status_code, response.content, response.headers, response=response)
+
+    content = response.content
+    content_hash = hashlib.sha256(content).hexdigest()
+    unchanged = bool(meta and meta.get('content_hash') == content_hash)
+    _count('unchanged' if unchanged else 'misses')
+
+    new_meta = {
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'content_hash': content_hash,
+        'headers': {key: response.headers[key] for key in CACHED_HEADERS if key in response.headers},
+        'fetched_at': time.time(),
+        # 本文が変わっていなければ、前回の抽出結果を引き継ぐ
+        'extracted': meta.get('extracted', {}) if unchanged else {},
+    }
+    if not unchanged:
+        _atomic_write(body_path, gzip.compress(content), mode='wb')
+    _write_meta(meta_path, new_meta)
+    return CachedResponse(url, 200, content, response.headers, content_hash, unchanged=unchanged, response=response)
+
+
+def load_extracted(response, key):
+    """
+    本文が前回と同一であれば、前回保存した抽出結果を返す (解析をスキップできる)。
+    key には抽出ロジックのバージョンを含めること (例: 'reviews-v1')。
+    """
+    if not response.unchanged: return None
+    meta = _load_meta(_entry_paths(response.url)[0])
+    if not meta or meta.get('content_hash') != response.content_hash: return None
+    extracted = meta.get('extracted', {}).get(key)
+    if extracted is not None: _count('parse_skipped')
+    return extracted
+
+
+def store_extracted(response, key, data):
+    """抽出結果を本文ハッシュに紐づけて保存する (JSONに変換できる値のみ)"""
+    if response.content_hash is None: return
+    meta_path = _entry_paths(response.url)[0]
+    meta = _load_meta(meta_path)
+    if not meta or meta.get('content_hash') != response.content_hash: return
+    meta.setdefault('extracted', {})[key] = data
+    _write_meta(meta_path, meta)
+
+
+def take_stats():
+    """現在の統計を返してゼロに戻す (Poolの子プロセスから親へ渡すため)"""
+    with _stats_lock:
+        snapshot = dict(STATS)
+        for key in STATS: STATS[key] = 0
+    return snapshot
+
+
+def merge_stats(snapshot):
+    """子プロセスの統計を合算する"""
+    with _stats_lock:
+        for key, value in snapshot.items():
+            STATS[key] = STATS.get(key, 0) + value
+
+
+def print_stats():
+    """実行終了時にキャッシュの統計を表示する"""
+    hits = STATS['not_modified'] + STATS['unchanged']
+    total = hits + STATS['misses']
+    print(f"HTTPキャッシュ: ヒット {hits}件 (304: {STATS['not_modified']}件, 本文一致: {STATS['unchanged']}件) / "
+          f"ミス {STATS['misses']}件 / 全{total}件")
+    print(f"  - 転送を省略したバイト数: {STATS['bytes_saved']:,} bytes")
+    print(f"  - 解析をスキップしたページ: {STATS['parse_skipped']}件")
+
+
+def prune(max_age_days=CACHE_MAX_AGE_DAYS, now=None):
+    """
+    最後の取得 (304 / 本文一致も含む。メタデータの更新時刻) から max_age_days 日を過ぎたエントリを削除する。
+    巡回しなくなったページ (掲載終了したホテル、差分取得で読まなくなった深いページなど) が溜まり続けないようにする。
+    同じ期間を過ぎた一時ファイルとメタデータの無い本文 (強制終了で取り残されたもの) も消す。
+    戻り値: (削除したエントリ数, 削除したバイト数)
+    """
+    if max_age_days is None or not os.path.isdir(CACHE_DIR): return 0, 0
+    cutoff = (now or time.time()) - max_age_days * 86400
+    removed, removed_bytes = 0, 0
+    for sub_dir in os.scandir(CACHE_DIR):
+        if not sub_dir.is_dir(): continue
+        for item in os.scandir(sub_dir.path):
+            if item.name.endswith('.json'):
+                paths = [item.path, item.path[:-len('.json')] + '.body.gz']
+            elif item.name.endswith('.tmp') or (
+                    item.name.endswith('.body.gz') and not os.path.exists(item.path[:-len('.body.gz')] + '.json')):
+                paths = [item.path]
+            else:
+                continue
+            try:
+                if item.stat().st_mtime >= cutoff: continue
+            except FileNotFoundError:
+                continue
+            for path in paths:
+                try:
+                    removed_bytes += os.path.getsize(path)
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            if item.name.endswith('.json'): removed += 1
+    if removed:
+        print(f"  - 古いキャッシュを削除: {removed}件 ({removed_bytes:,} bytes, {max_age_days}日以上未取得)")
+    return removed, removed_bytes
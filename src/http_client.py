@@ -0,0 +1,106 @@
+import os
+import threading
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- brotli は任意 (入っていれば br も受け付ける) ---
+try:
+    import brotli  # noqa: F401  requests/urllib3 が br の展開に使う
+    BROTLI_AVAILABLE = True
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        BROTLI_AVAILABLE = True
+    except ImportError:
+        BROTLI_AVAILABLE = False
+
+# --- 設定項目 ---
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+DEFAULT_TIMEOUT = 20                 # リクエストのタイムアウト時間（秒）
+POOL_CONNECTIONS = 4                 # セッションごとに保持するホスト別プールの数 (楽天2 + じゃらん + 予備)
+POOL_MAXSIZE = 4                     # ホストごとに保持するkeep-alive接続数
+RETRY_STATUSES = (429, 500, 502, 503, 504)  # 時間をおけば回復しうる応答 (再試行の対象)
+
+DEFAULT_HEADERS = {
+    "User-Agent": USER_AGENT,
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "ja,en-US;q=0.7,en;q=0.3",
+    "Accept-Encoding": "gzip, deflate, br" if BROTLI_AVAILABLE else "gzip, deflate",
+    "Connection": "keep-alive",
+}
+
+
+
+def parse_host_overrides(spec):
+    """'ホスト=http://127.0.0.1:8765,ホスト2=...' 形式の文字列を辞書にする"""
+    overrides = {}
+    for item in (spec or '').split(','):
+        host, sep, target = item.strip().partition('=')
+        if sep and host and target: overrides[host] = target.rstrip('/')
+    return overrides
+
+
+# [NEW] ホスト名 -> 差し替え先のオリジン (例: 'http://127.0.0.1:8765')。
+# ローカルの代替サーバー (tests/stub_server.py) に向けてテスト・ベンチマークを行うためのもの。
+# 環境変数 SCRAPER_HOST_OVERRIDES でも指定できる (Poolの子プロセスにも引き継がれる)。
+HOST_OVERRIDES = parse_host_overrides(os.environ.get('SCRAPER_HOST_OVERRIDES'))
+
+# 作業員 (スレッド / Poolの子プロセス) ごとに1つのセッションを持つ
+_local = threading.local()
+
+
+def create_session():
+    """keep-alive接続プールと共通ヘッダを設定したセッションを作る"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+
+def get_session():
+    """
+    現在の作業員用のセッションを返す。
+    fork後の子プロセスが親の接続を使い回さないよう、プロセスIDが変わったら作り直す。
+    """
+    session = getattr(_local, 'session', None)
+    if session is None or _local.pid != os.getpid():
+        session = create_session()
+        _local.session = session
+        _local.pid = os.getpid()
+    return session
+
+
+def apply_host_override(url):
+    """HOST_OVERRIDES に登録されたホストなら、差し替え先のオリジンにURLを書き換える"""
+    if not HOST_OVERRIDES: return url
+    parsed = urlparse(url)
+    target = HOST_OVERRIDES.get(parsed.netloc)
+    if not target: return url
+    target = urlparse(target)
+    return parsed._replace(scheme=target.scheme, netloc=target.netloc).geturl()
+
+
+def get(url, headers=None, timeout=DEFAULT_TIMEOUT):
+    """共有セッション経由の GET (headers は共通ヘッダに上書きマージされる)"""
+    return get_session().get(apply_host_override(url), headers=headers, timeout=timeout)
+
+
+def is_retryable_error(exc):
+    """タイムアウト・接続エラー・429/5xx の応答なら True (404 などは再試行しない)"""
+    if isinstance(exc, (requests.Timeout, requests.ConnectionError)):
+        return True
+    response = getattr(exc, 'response', None)
+    return response is not None and response.status_code in RETRY_STATUSES
+
+
+def retry_after_seconds(exc):
+    """応答に Retry-After (秒数) があれば返す。無ければ None。"""
+    response = getattr(exc, 'response', None)
+    if response is None: return None
+    try:
+        return max(0.0, float(response.headers.get('Retry-After')))
+    except (TypeError, ValueError):
+        return None
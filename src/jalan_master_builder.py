@@ -1,8 +1,13 @@
-import csv
-import time
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse, parse_qs, urlencode
+import re
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs, urlencode
+
+try:
+    import http_cache
+    import master_index
+    import page_parser
+except ImportError:
+    from src import http_cache, master_index, page_parser
 
 # --- ★設定場所★ ---
 # 収集したいじゃらんの検索結果URLをリストしたファイル名を指定
@@ -13,15 +18,77 @@ URL_LIST_FILE = '../data/input/search_urls_jalan.txt'
 # --- 設定項目 ---
 # [変更] 出力するマスターリストのファイルパス
 OUTPUT_FILE = '../data/raw/hotels_raw_jalan.csv'
-REQUEST_DELAY = 1.0                  # 各リクエスト間の待機時間（秒）。サーバー負荷を考慮し、1秒を推奨。
+# [NEW] ホテルIDインデックス (初出日・最終確認日、地域ごとの全巡回日時)
+INDEX_FILE = '../data/processed/hotel_index_jalan.json'
+# [変更] リクエスト間隔は rate_control.HOST_RATE_LIMITS のホスト別レートで制御する
 REQUEST_TIMEOUT = 20                 # リクエストのタイムアウト時間（秒）
+HOTEL_EXTRACT_KEY = 'jalan-hotels-v2' # HTTPキャッシュに保存する抽出結果のキー
+HOTEL_ID_REGEX = re.compile(r'/yad(\d+)/') # クチコミページURLからホテルIDを取り出す
+
+def extract_hotels(content, content_type=None, backend=None):
+    """
+    検索結果ページからホテル情報を抽出する。
+    戻り値: [ホテルカードの件数, [[ホテルID, ホテル名], ...]]
+    """
+    # [変更] 文字化け検知のための二重解析をやめ、バイト列から文字コードを判定して1回だけ解析する
+    text, _ = page_parser.decode_html(content, content_type, expect='件')
+    parser = backend or page_parser.get_backend()
+    hotel_items = parser.select(parser.parse(text), '.p-yadoCassette.p-searchResultItem.js-searchResultItem')
+
+    hotels = []
+    for item in hotel_items:
+        hotel_id = None
+        map_button = parser.select_one(item, 'a.p-searchResultItem__mapButton')
+        if map_button is not None and parser.attr(map_button, 'onclick') is not None:
+            try:
+                onclick_text = parser.attr(map_button, 'onclick')
+                hotel_id = onclick_text.split("yadNo=")[1].split("'")[0]
+            except IndexError: continue
+
+        if not hotel_id: continue
+
+        name_element = parser.select_one(item, 'h2.p-searchResultItem__facilityName')
+        if name_element is not None:
+            hotels.append([hotel_id, parser.text(name_element)])
+    return [len(hotel_items), hotels]
+
+def page_url(base_url, page_num):
+    """起点URLの idx (30件ごとの開始位置) を書き換えて、指定ページのURLを返す"""
+    parsed_url = urlparse(base_url)
+    query_params = parse_qs(parsed_url.query)
+    query_params['idx'] = [str((page_num - 1) * 30)]
+    return parsed_url._replace(query=urlencode(query_params, doseq=True)).geturl()
+
+def hotel_id_from_url(url):
+    """クチコミページURL (https://www.jalan.net/yad<ホテルID>/kuchikomi/) からホテルIDを取り出す。取り出せなければ None"""
+    match = HOTEL_ID_REGEX.search(url)
+    return match.group(1) if match else None
+
+def read_page(current_url):
+    """
+    検索結果1ページを取得して解析する (巡回用のスレッドで実行される)。
+    戻り値: (ホテルカードの件数, [(ホテルID, ホテル名, レビューページURL), ...])
+    """
+    # [変更] 共有セッション (keep-alive / 共通User-Agent) 経由で取得
+    response = http_cache.fetch(current_url, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+
+    # 本文が前回と同じなら、解析せずに前回の抽出結果を使う
+    extracted = http_cache.load_extracted(response, HOTEL_EXTRACT_KEY)
+    if extracted is None:
+        extracted = extract_hotels(response.content, response.headers.get('Content-Type'))
+        http_cache.store_extracted(response, HOTEL_EXTRACT_KEY, extracted)
+    card_count, page_hotels = extracted
+    return card_count, [(hotel_id, hotel_name, f"https://www.jalan.net/yad{hotel_id}/kuchikomi/")
+                        for hotel_id, hotel_name in page_hotels]
 
 def main():
     """
     search_urls_jalan.txtから複数の起点URLを読み込み、
-    全ての検索結果を巡回して、単一のマスターリストを生成する。
+    全ての検索結果を全地域同時に巡回して、単一のマスターリストを生成する。
+    [変更] ホテルIDインデックスを使い、既知のホテルだけのページで巡回を打ち切り、CSVは差分だけ更新する。
     """
-    print("じゃらん用マスターリスト自動構築エンジン v9 (複数地域対応・最終版) を起動します...")
+    print("じゃらん用マスターリスト自動構築エンジン v10 (同時巡回・差分更新) を起動します...")
     
     # --- [変更] 複数の起点URLをファイルから読み込む ---
     try:
@@ -35,98 +102,31 @@ def main():
         print(f"エラー: {URL_LIST_FILE} が見つかりません。ファイルを作成してください。")
         return
 
-    # [変更] 全てのホテルデータを一時的に格納するリストと、重複防止用のセット
-    all_hotels_data = []
-    unique_hotel_ids = set()
-
-    # --- [変更] 読み込んだ起点URLごとにループ ---
-    for i, base_url in enumerate(search_base_urls, 1):
-        print("\n" + "="*50)
-        print(f"[{i}/{len(search_base_urls)}] 起点URLの処理を開始: {base_url[:80]}...")
-        print("="*50)
-        
-        page_count = 1
-        while True:
-            current_idx = (page_count - 1) * 30
-            parsed_url = urlparse(base_url)
-            query_params = parse_qs(parsed_url.query)
-            query_params['idx'] = [str(current_idx)]
-            new_query = urlencode(query_params, doseq=True)
-            current_url = parsed_url._replace(query=new_query).geturl()
-            
-            print(f"\n[ {page_count}ページ目 ] (idx={current_idx}) を解析中...")
-
-            try:
-                headers = { "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/5.0 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/5.36" }
-                response = requests.get(current_url, headers=headers, timeout=REQUEST_TIMEOUT)
-                response.raise_for_status()
-                
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
-                if '件' not in soup.get_text():
-                    print("  -> 1ページ目で文字化けを検知。CP932で再解析します。")
-                    soup = BeautifulSoup(response.content, 'html.parser', from_encoding='CP932')
-
-                hotel_items = soup.select('.p-yadoCassette.p-searchResultItem.js-searchResultItem')
-                
-                if not hotel_items:
-                    print("  -> このページにホテル情報が見つかりませんでした。この起点URLの処理を終了します。")
-                    break
-
-                found_on_page = 0
-                for item in hotel_items:
-                    hotel_id = None
-                    map_button = item.select_one('a.p-searchResultItem__mapButton')
-                    if map_button and map_button.has_attr('onclick'):
-                        try:
-                            onclick_text = map_button['onclick']
-                            hotel_id = onclick_text.split("yadNo=")[1].split("'")[0]
-                        except IndexError: continue
-                    
-                    if not hotel_id: continue
-                    if hotel_id in unique_hotel_ids: continue
-                    
-                    name_element = item.select_one('h2.p-searchResultItem__facilityName')
-                    if name_element:
-                        hotel_name = name_element.get_text(strip=True)
-                        review_page_url = f"https://www.jalan.net/yad{hotel_id}/kuchikomi/"
-                        
-                        all_hotels_data.append({'hotel_name': hotel_name, 'url': review_page_url})
-                        unique_hotel_ids.add(hotel_id)
-                        found_on_page += 1
-                
-                print(f"  -> 新規に{found_on_page}件のホテル情報を抽出しました。")
-
-                if found_on_page == 0 and page_count > 1:
-                    print("  -> 新規のホテルが見つかりませんでした。最終ページと判断し、巡回を終了します。")
-                    break
-                
-                page_count += 1
-
-            except requests.exceptions.RequestException as e:
-                print(f"\nエラー: ページの取得に失敗しました。この起点URLの処理をスキップします。 Error: {e}")
-                break
-            
-            time.sleep(REQUEST_DELAY)
+    # [NEW] ホテルIDで重複を除き、初出日・最終確認日を記録する
+    index = master_index.HotelIndex(INDEX_FILE)
+    now = datetime.now()
+    # [NEW] 初回はインデックスが無いので、既存のCSVから作る (巡回に失敗した地域のホテルを消さない)
+    index.seed_from_csv(OUTPUT_FILE, hotel_id_from_url, now)
+    new_count = master_index.crawl_search_urls(search_base_urls, page_url, read_page, index, now)
+    index.save()
 
     # --- 収集した全データをCSVに書き出し ---
-    if not all_hotels_data:
+    rows = index.master_rows(now)
+    if not rows:
         print("\n1件もホテル情報を収集できませんでした。")
         return
 
     print("\n" + "="*50)
-    print(f"全地域の収集が完了しました。合計 {len(all_hotels_data)}件のユニークなホテル情報を収集しました。")
-    print(f"CSVファイル ({OUTPUT_FILE}) に書き出します...")
-
+    print(f"全地域の収集が完了しました。合計 {len(rows)}件のユニークなホテル情報 (うち新規{new_count}件) があります。")
     try:
-        with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8-sig') as f:
-            writer = csv.DictWriter(f, fieldnames=['hotel_name', 'url'])
-            writer.writeheader()
-            writer.writerows(all_hotels_data)
+        diff = master_index.write_master_csv(OUTPUT_FILE, rows)
+        print(f"CSVファイル ({OUTPUT_FILE}) を更新しました: 追加{diff['added']}件, 名前変更{diff['changed']}件, 削除{diff['removed']}件")
         print("じゃらん用マスターリストの構築が完了しました！")
     except IOError as e:
         print(f"エラー: ファイルの書き込みに失敗しました。 Error: {e}")
-    
+
+    http_cache.print_stats()
+    http_cache.prune()
     print("="*50)
 
 if __name__ == "__main__":
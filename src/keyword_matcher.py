@@ -0,0 +1,111 @@
+from collections import deque
+
+# --- 設定項目 ---
+MATCHER_BACKEND = 'auto'             # 'auto' / 'aho-corasick' / 'scan'
+AHO_CORASICK_MIN_KEYWORDS = 150      # 'auto' でオートマトンを使うキーワード数の下限 (これ未満は 'in' の総当たりの方が速い)
+
+
+class KeywordMatcher:
+    """
+    config.yml の辞書 (fatal_risks / wow_factors) を一度だけコンパイルし、
+    レビュー1件に含まれるカテゴリをビットマスク (ビット i = categories[i]) で返す。
+    スコアが設定されていないカテゴリは対象外。同じカテゴリ名が両方の辞書にあれば
+    キーワードは wow_factors 側を使い、集計はリスク側に入れる (calculate_score の従来の挙動)。
+    """
+
+    def __init__(self, score_mapping, fatal_risks, wow_factors, backend=None):
+        all_categories = {**fatal_risks, **wow_factors}
+        self.categories = [category for category in all_categories if score_mapping.get(category) is not None]
+        self.is_risk = [category in fatal_risks for category in self.categories]
+        self.keyword_lists = [list(all_categories[category] or ()) for category in self.categories]
+        self._compile(backend)
+
+    def _compile(self, backend):
+        keyword_count = sum(len(keywords) for keywords in self.keyword_lists)
+        backend = backend or MATCHER_BACKEND
+        if backend == 'auto':
+            backend = 'aho-corasick' if keyword_count >= AHO_CORASICK_MIN_KEYWORDS else 'scan'
+        self.backend = backend
+        self._bits_cache = {}
+        if backend == 'aho-corasick':
+            self._build_automaton(self.keyword_lists)
+            self.match = self._match_automaton
+        else:
+            self._scan_table = [(1 << bit, keywords) for bit, keywords in enumerate(self.keyword_lists) if keywords]
+            self.match = self._match_scan
+
+    def restricted(self, mask, backend=None):
+        """mask のカテゴリだけを照合する KeywordMatcher (ビットの並びは元と同じ)"""
+        matcher = object.__new__(KeywordMatcher)
+        matcher.categories, matcher.is_risk = self.categories, self.is_risk
+        matcher.keyword_lists = [keywords if mask >> bit & 1 else [] for bit, keywords in enumerate(self.keyword_lists)]
+        matcher._compile(backend)
+        return matcher
+
+    def bits(self, mask):
+        """ビットマスクに含まれるカテゴリ番号のタプル (同じマスクは使い回す)"""
+        cached = self._bits_cache.get(mask)
+        if cached is None:
+            cached = self._bits_cache[mask] = tuple(bit for bit in range(mask.bit_length()) if mask >> bit & 1)
+        return cached
+
+    # --- 総当たり (キーワードが少ない場合) ---
+    def _match_scan(self, text):
+        mask = 0
+        for bit, keywords in self._scan_table:
+            for keyword in keywords:
+                if keyword in text:
+                    mask |= bit
+                    break
+        return mask
+
+    # --- Aho-Corasick オートマトン (レビュー本文を1回なめるだけで全カテゴリを判定) ---
+    def _build_automaton(self, keyword_lists):
+        goto = [{}]  # 状態 -> {文字: 次の状態}
+        output = [0] # 状態 -> その状態で見つかったカテゴリのビットマスク
+        for bit, keywords in enumerate(keyword_lists):
+            for keyword in keywords:
+                state = 0
+                for ch in keyword:
+                    next_state = goto[state].get(ch)
+                    if next_state is None:
+                        next_state = len(goto)
+                        goto.append({})
+                        output.append(0)
+                        goto[state][ch] = next_state
+                    state = next_state
+                output[state] |= 1 << bit
+
+        # 失敗遷移を幅優先で張り、失敗先の出力を引き継ぐ (接尾辞として含まれるキーワードも拾う)
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and ch not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(ch, 0) if state else 0
+                output[next_state] |= output[fail[next_state]]
+        self._goto, self._fail, self._output = goto, fail, output
+
+    def _match_automaton(self, text):
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        mask = output[0] # 空文字のキーワードはどの本文にも含まれる
+        for ch in text:
+            while True:
+                next_state = goto[state].get(ch)
+                if next_state is not None:
+                    state = next_state
+                    break
+                if not state: break
+                state = fail[state]
+            mask |= output[state]
+        return mask
+
+
+def compile_config(config, backend=None):
+    """config.yml を読み込んだ辞書から KeywordMatcher を作る"""
+    return KeywordMatcher(config['scores'], config['fatal_risks'], config['wow_factors'], backend)
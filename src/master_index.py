@@ -0,0 +1,189 @@
+import asyncio
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlparse
+
+import requests
+
+try:
+    import http_client
+    from rate_control import build_host_buckets, bucket_for
+except ImportError:
+    from src import http_client
+    from src.rate_control import build_host_buckets, bucket_for
+
+# --- 設定項目 ---
+FULL_CRAWL_DAYS = 7                  # 各地域をこの日数ごとに最終ページまで巡回し直す (それ以外の日は既知のホテルだけのページで打ち切る)
+STALE_DAYS = 30                      # この日数以上どの検索結果にも出てこないホテルはマスターリストから外す
+SEARCH_FETCH_THREADS = 8             # 検索ページの通信・解析を実行するスレッド数 (ホスト別レートは rate_control.HOST_RATE_LIMITS)
+
+
+class HotelIndex:
+    """
+    マスターリスト生成用の永続ホテルIDインデックス (JSON)。
+    hotels: ホテルID -> {'hotel_name', 'url', 'first_seen', 'last_seen'} (初めて見つけた順)
+    regions: 起点URL -> {'last_full_crawl'} (最後に最終ページまで巡回した日時)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+        self.hotels = data.get('hotels', {})
+        self.regions = data.get('regions', {})
+
+    def see(self, hotel_id, hotel_name, url, now):
+        """検索結果で見つけたホテルを記録する"""
+        now = now.isoformat()
+        entry = self.hotels.setdefault(hotel_id, {'first_seen': now})
+        entry.update({'hotel_name': hotel_name, 'url': url, 'last_seen': now})
+
+    def seed_from_csv(self, path, hotel_id_from_url, now):
+        """
+        インデックスが空 (初回実行) なら、既存のマスターリストCSVのホテルを今日見つけたものとして登録する。
+        今回の巡回に失敗した地域のホテルがCSVから消えないようにするため。戻り値: 登録した件数
+        """
+        if self.hotels: return 0
+        for row in read_master_csv(path):
+            hotel_id = hotel_id_from_url(row['url'])
+            if hotel_id and hotel_id not in self.hotels:
+                self.see(hotel_id, row['hotel_name'], row['url'], now)
+        if self.hotels: print(f"既存のマスターリストから {len(self.hotels)}件のホテルでインデックスを作成しました。")
+        return len(self.hotels)
+
+    def needs_full_crawl(self, base_url, now):
+        """この起点URLを最終ページまで巡回すべきか (未巡回か、前回の全巡回から FULL_CRAWL_DAYS 以上経過)"""
+        last = self.regions.get(base_url, {}).get('last_full_crawl')
+        return last is None or (now - datetime.fromisoformat(last)).days >= FULL_CRAWL_DAYS
+
+    def mark_full_crawl(self, base_url, now):
+        self.regions[base_url] = {'last_full_crawl': now.isoformat()}
+
+    def master_rows(self, now):
+        """マスターリストの行 (初めて見つけた順)。長く見つかっていないホテルは除く。"""
+        return [{'hotel_name': entry['hotel_name'], 'url': entry['url']}
+                for entry in self.hotels.values()
+                if (now - datetime.fromisoformat(entry['last_seen'])).days < STALE_DAYS]
+
+    def save(self):
+        """一時ファイルに書いてから置き換える (書き込み中に落ちても前回のインデックスが残る)"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'hotels': self.hotels, 'regions': self.regions}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+async def crawl_region(label, base_url, page_url, read_page, known_ids, full, buckets, executor):
+    """
+    1つの起点URLの検索結果をページ順に巡回する。
+    終了条件: ホテルが0件のページ / 2ページ目以降で新しいホテルが無い (最終ページの繰り返し) /
+    全巡回でない場合は、前回までに知っているホテルだけのページ。
+    戻り値: ([(ホテルID, ホテル名, レビューページURL), ...], 最終ページまで巡回できたか)
+    """
+    loop = asyncio.get_running_loop()
+    hotels, seen = [], set()
+    page_num = 1
+    while True:
+        current_url = page_url(base_url, page_num)
+        bucket = bucket_for(buckets, urlparse(current_url).hostname)
+        await bucket.acquire()
+        started = time.monotonic()
+        try:
+            card_count, page_hotels = await loop.run_in_executor(executor, read_page, current_url)
+        except requests.exceptions.RequestException as e:
+            if http_client.is_retryable_error(e): bucket.on_error()
+            print(f"  [{label}] エラー: {page_num}ページ目の取得に失敗。この起点URLの処理を中断します。 Error: {e}")
+            return hotels, False
+        bucket.on_success(time.monotonic() - started)
+
+        if not card_count:
+            print(f"  [{label}] {page_num}ページ目にホテル情報がありません。巡回を終了します。")
+            return hotels, True
+        new_hotels = [hotel for hotel in page_hotels if hotel[0] not in seen]
+        if not new_hotels and page_num > 1:
+            print(f"  [{label}] {page_num}ページ目に新規のホテルがありません。最終ページと判断し、巡回を終了します。")
+            return hotels, True
+        seen.update(hotel[0] for hotel in new_hotels)
+        hotels.extend(new_hotels)
+        print(f"  [{label}] {page_num}ページ目: {len(new_hotels)}件")
+
+        if not full and new_hotels and all(hotel[0] in known_ids for hotel in new_hotels):
+            print(f"  [{label}] {page_num}ページ目は既知のホテルのみ。差分巡回を終了します。")
+            return hotels, False
+        page_num += 1
+
+
+async def crawl_all(search_base_urls, page_url, read_page, known_ids, full_flags):
+    buckets = build_host_buckets()
+    with ThreadPoolExecutor(max_workers=SEARCH_FETCH_THREADS) as executor:
+        return await asyncio.gather(*[
+            crawl_region(f"{i}/{len(search_base_urls)}", base_url, page_url, read_page, known_ids, full, buckets, executor)
+            for i, (base_url, full) in enumerate(zip(search_base_urls, full_flags), 1)
+        ])
+
+
+def crawl_search_urls(search_base_urls, page_url, read_page, index, now=None):
+    """
+    全ての起点URLをホスト別レート制限の下で同時に巡回し、見つけたホテルをインデックスに記録する。
+    page_url(起点URL, ページ番号) -> URL、read_page(URL) -> (ホテルカードの件数, [(ホテルID, ホテル名, URL), ...])
+    戻り値: 今回初めて見つけたホテルの件数
+    """
+    now = now or datetime.now()
+    known_ids = set(index.hotels)
+    full_flags = [index.needs_full_crawl(base_url, now) for base_url in search_base_urls]
+    print(f"{len(search_base_urls)}件の起点URLを同時に巡回します (全巡回: {sum(full_flags)}件, 差分巡回: {len(full_flags) - sum(full_flags)}件)...")
+    results = asyncio.run(crawl_all(search_base_urls, page_url, read_page, known_ids, full_flags))
+
+    # 結果は起点URLの順に反映する (同時巡回でもインデックスとCSVの並びが毎回同じになる)
+    for base_url, (hotels, completed) in zip(search_base_urls, results):
+        for hotel_id, hotel_name, url in hotels:
+            index.see(hotel_id, hotel_name, url, now)
+        if completed: index.mark_full_crawl(base_url, now)
+    return len(set(index.hotels) - known_ids)
+
+
+def read_master_csv(path):
+    try:
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            return [{'hotel_name': row['hotel_name'], 'url': row['url']} for row in csv.DictReader(f)]
+    except FileNotFoundError:
+        return []
+
+
+def write_master_csv(path, rows):
+    """
+    マスターリストCSVを差分だけ更新する。変化が無ければ書き込まず、末尾への追加だけなら追記し、
+    それ以外 (名前の変更・削除) は一時ファイル経由で置き換える。
+    戻り値: {'added': 追加, 'changed': 変更, 'removed': 削除} の件数
+    """
+    existing = read_master_csv(path)
+    old_names = {row['url']: row['hotel_name'] for row in existing}
+    new_names = {row['url']: row['hotel_name'] for row in rows}
+    diff = {
+        'added': sum(1 for url in new_names if url not in old_names),
+        'changed': sum(1 for url, name in new_names.items() if url in old_names and old_names[url] != name),
+        'removed': sum(1 for url in old_names if url not in new_names),
+    }
+    if rows == existing: return diff
+
+    fieldnames = ['hotel_name', 'url']
+    if existing and rows[:len(existing)] == existing:
+        with open(path, 'a', newline='', encoding='utf-8') as f:
+            csv.DictWriter(f, fieldnames=fieldnames).writerows(rows[len(existing):])
+        return diff
+    tmp_path = path + '.tmp'
+    # encoding='utf-8-sig' でBOM付きUTF-8として保存
+    with open(tmp_path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+    return diff
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+# --- 設定項目 ---
+MATCH_CACHE_FILE = '../data/processed/match_cache.sqlite3' # srcフォルダからの相対パス
+MATCH_CACHE_VERSION = 1              # 照合の仕様 (部分一致・最初の1ヒット) を変えたら上げる。全キャッシュが無効になる
+FETCH_CHUNK = 500                    # 1回のSELECTで引くレビュー数 (SQLiteの変数上限より小さく)
+SQLITE_TIMEOUT = 60                  # [NEW] 並列スコア計算で他のプロセスの書き込みを待つ秒数
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS keyword_sets (
+    keyword_set_hash TEXT PRIMARY KEY,
+    bit INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS review_matches (
+    review_hash BLOB PRIMARY KEY,
+    checked TEXT NOT NULL,
+    matched TEXT NOT NULL
+);
+"""
+# keyword_sets: カテゴリのキーワード集合のハッシュ -> キャッシュ内のビット番号 (辞書を編集するたびに増える)
+# review_matches: 本文のハッシュ -> 照合済みのキーワード集合 / ヒットしたキーワード集合 (ビットマスクの16進文字列)
+
+
+def keyword_set_hash(keywords):
+    """
+    カテゴリのキーワード集合のハッシュ。並び順・重複・カテゴリ名・スコアには依存しないため、
+    キーワードを変えたカテゴリだけがキャッシュ無効になり、スコアの重みの変更では何も無効にならない。
+    """
+    payload = json.dumps([MATCH_CACHE_VERSION, sorted(set(keywords))], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def review_hash(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+
+class MatchCache:
+    """
+    レビュー本文ごとの照合結果 (カテゴリのビットマスク) を SQLite に保存し、次回の分析で再利用する。
+    キーは (本文のハッシュ, カテゴリのキーワード集合のハッシュ)。まだ照合していない組み合わせだけを照合する。
+    """
+
+    def __init__(self, matcher, path=MATCH_CACHE_FILE):
+        self.matcher = matcher
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=SQLITE_TIMEOUT)
+        self.conn.executescript(SCHEMA)
+        self.stats = {'hits': 0, 'partial': 0, 'misses': 0}
+
+        # matcher のカテゴリ i -> キャッシュ内のビット番号
+        known = dict(self.conn.execute("SELECT keyword_set_hash, bit FROM keyword_sets"))
+        self.cache_bits = []
+        for keywords in matcher.keyword_lists:
+            version = keyword_set_hash(keywords)
+            if version not in known:
+                known[version] = len(known)
+                self.conn.execute("INSERT INTO keyword_sets VALUES (?, ?)", (version, known[version]))
+            self.cache_bits.append(known[version])
+        self.conn.commit() # ビット番号の割り当てはすぐ確定する (並列スコア計算のワーカーが同じ番号を使えるように)
+        self.needed = sum(1 << bit for bit in set(self.cache_bits))
+        self._to_matcher, self._to_cache, self._partial_matchers = {}, {}, {}
+
+    # --- ビットマスクの変換 (matcher のビット <-> キャッシュのビット)。同じマスクは使い回す ---
+    def _matcher_mask(self, cache_mask):
+        mask = self._to_matcher.get(cache_mask)
+        if mask is None:
+            mask = self._to_matcher[cache_mask] = sum(
+                1 << i for i, bit in enumerate(self.cache_bits) if cache_mask >> bit & 1)
+        return mask
+
+    def _cache_mask(self, matcher_mask):
+        mask = self._to_cache.get(matcher_mask)
+        if mask is None:
+            mask = self._to_cache[matcher_mask] = sum(1 << self.cache_bits[i] for i in self.matcher.bits(matcher_mask))
+        return mask
+
+    def _matcher_for(self, missing):
+        """キャッシュに無いカテゴリ (キャッシュのビット) だけを照合する matcher"""
+        if missing == self.needed: return self.matcher
+        if missing not in self._partial_matchers:
+            self._partial_matchers[missing] = self.matcher.restricted(self._matcher_mask(missing))
+        return self._partial_matchers[missing]
+
+    def _fetch(self, hashes):
+        stored = {}
+        hashes = list(hashes)
+        for start in range(0, len(hashes), FETCH_CHUNK):
+            chunk = hashes[start:start + FETCH_CHUNK]
+            rows = self.conn.execute(
+                f"SELECT review_hash, checked, matched FROM review_matches WHERE review_hash IN ({','.join('?' * len(chunk))})",
+                chunk)
+            for key, checked, matched in rows:
+                stored[key] = (int(checked, 16), int(matched, 16))
+        return stored
+
+    def match_texts(self, texts):
+        """本文のリストを照合し、matcher のビットマスクのリストを返す (空の本文は 0)"""
+        hashes = [review_hash(text) if text else None for text in texts]
+        stored = self._fetch({key for key in hashes if key is not None})
+        updates = {}
+        masks = []
+        for text, key in zip(texts, hashes):
+            if key is None:
+                masks.append(0)
+                continue
+            checked, matched = stored.get(key, (0, 0))
+            missing = self.needed & ~checked
+            if missing:
+                self.stats['misses' if missing == self.needed else 'partial'] += 1
+                checked |= missing
+                matched |= self._cache_mask(self._matcher_for(missing).match(text))
+                stored[key] = updates[key] = (checked, matched)
+            else:
+                self.stats['hits'] += 1
+            masks.append(self._matcher_mask(matched & self.needed))
+        if updates:
+            self.conn.executemany("INSERT OR REPLACE INTO review_matches VALUES (?, ?, ?)",
+                                  [(key, format(checked, 'x'), format(matched, 'x')) for key, (checked, matched) in updates.items()])
+        return masks
+
+    def commit(self):
+        """ここまでの照合結果を確定する"""
+        self.conn.commit()
+
+    def close(self):
+        """照合結果を確定して閉じる"""
+        self.conn.commit()
+        self.conn.close()
+
+    def describe(self):
+        total = sum(self.stats.values())
+        return (f"照合キャッシュ: ヒット {self.stats['hits']}件 / 一部のカテゴリのみ照合 {self.stats['partial']}件 / "
+                f"新規に照合 {self.stats['misses']}件 (全{total}件)")
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import re
+from importlib import metadata
+
+import mojimoji  # 半角/全角変換ライブラリ
+
+# --- 設定項目 ---
+NAME_CACHE_FILE = '../data/processed/name_cache.json' # 正規化結果のキャッシュ (元の名前 -> 正規化名)
+NORMALIZER_VERSION = 1               # 正規化の手順を変えたら上げる (キャッシュが作り直しになる)
+
+# --- 除去する接頭辞/接尾辞のパターン (最終版) ---
+PREFIX_SUFFIX_PATTERNS = [
+    # 具体的なフレーズ
+    r'^那須高原ペットと泊まれる宿', r'那須高原ペットと泊まれる宿$',
+    r'^ペットと泊まれる宿', r'ペットと泊まれる宿$',
+    r'^犬と遊べるペンション', r'犬と遊べるペンション$',
+    r'^那須温泉', r'那須温泉$',
+    # 一般的な単語
+    r'^ホテル', r'ホテル$',
+    r'^ぺんしょん', r'ぺんしょん$', r'^ペンション', r'ペンション$',
+    r'^旅館', r'旅館$',
+    r'^温泉', r'温泉$',
+    r'^高原', r'高原$',
+    r'^の宿', r'の宿$',
+    r'^ｉｎｎ', r'ｉｎｎ$', r'^イン', r'イン$',
+    r'^りぞーと', r'りぞーと$', r'^リゾート', r'リゾート$'
+]
+PREFIX_SUFFIX_REGEX = re.compile(r'|'.join(PREFIX_SUFFIX_PATTERNS))
+
+# 除去する記号 (長音符 'ー' は除去しない)。空白類 (str.isspace、最大は U+3000) も同じ変換表でまとめて消す
+SYMBOLS_TO_REMOVE = '・＆～★＊！？／♪☆　・＆~★*!?/♪☆-' + ' ' + '’' + '\'' + '-'
+REMOVE_TABLE = str.maketrans({**{c: None for c in SYMBOLS_TO_REMOVE},
+                              **{chr(code): None for code in range(0x3001) if chr(code).isspace()}})
+PARENTHESES_REGEX = re.compile(r'[（\(][^（）()]*[）\)]')
+
+
+def _ruleset_version():
+    """正規化の規則 (パターン・記号・手順・mojimoji の版) のハッシュ。キャッシュのキーに使う"""
+    try:
+        mojimoji_version = metadata.version('mojimoji')
+    except metadata.PackageNotFoundError:
+        mojimoji_version = None
+    payload = [NORMALIZER_VERSION, PREFIX_SUFFIX_PATTERNS, SYMBOLS_TO_REMOVE, mojimoji_version]
+    return hashlib.sha1(json.dumps(payload, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+
+RULESET_VERSION = _ruleset_version()
+
+
+def normalize_name(name):
+    """
+    【v3.3】ホテル名を正規化（すっぴん化）する関数。
+    記号と空白の除去は事前に作った変換表 (str.translate) で1回で行う。結果は v3.2 と同じ。
+    """
+    if not name: return ""
+
+    normalized = mojimoji.han_to_zen(name, kana=True, ascii=True, digit=True).lower()
+    normalized = PARENTHESES_REGEX.sub('', normalized)
+    normalized = normalized.translate(REMOVE_TABLE)
+
+    for _ in range(3):
+        prev_normalized = normalized
+        normalized = PREFIX_SUFFIX_REGEX.sub('', normalized)
+        if normalized == prev_normalized: break
+
+    # カタカナは全角のまま、英数のみ半角に戻す
+    return mojimoji.zen_to_han(normalized, ascii=True, digit=True, kana=False)
+
+
+def load_cache(path):
+    """規則の版が同じキャッシュだけを読み込む (版が違えば空)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return cache.get('names', {}) if cache.get('ruleset') == RULESET_VERSION else {}
+
+
+def save_cache(path, names):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'ruleset': RULESET_VERSION, 'names': names}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def normalize_names(names, cache_path=NAME_CACHE_FILE):
+    """
+    名前のリスト (マスターリスト全体など) をまとめて正規化し、同じ並びのリストを返す。
+    同じ名前は1回だけ計算し、cache_path のキャッシュにある名前 (同じ規則の版で計算済み) は計算しない。
+    """
+    cache = load_cache(cache_path) if cache_path else {}
+    computed = {name: normalize_name(name) for name in set(names) if name and name not in cache}
+    cache.update(computed)
+    if computed and cache_path: save_cache(cache_path, cache)
+    return [cache[name] if name else "" for name in names]
@@ -0,0 +1,147 @@
+import re
+from bs4 import BeautifulSoup
+
+# --- lxml は任意 (無ければ html.parser にフォールバック) ---
+try:
+    import lxml.html
+    from lxml import etree
+    from lxml.cssselect import CSSSelector
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+# --- 設定項目 ---
+PARSER_BACKEND = 'lxml'              # 'lxml' または 'html.parser'
+FALLBACK_ENCODINGS = ['utf-8', 'cp932']
+
+# スクレイパーとマスター生成で使うセレクタ (lxmlバックエンドでは起動時に事前コンパイル)
+SELECTORS = [
+    # 楽天 レビュー
+    'dl.commentReputation', 'dt > span.time', 'dd > p.commentSentence',
+    # じゃらん クチコミ
+    'div.jlnpc-kuchikomiCassette__contWrap', 'p.jlnpc-kuchikomiCassette__postBody',
+    'div.jlnpc-kuchikomiCassette__rightArea p.jlnpc-kuchikomiCassette__postDate',
+    'div.jlnpc-kuchikomiCassette__rightArea p.jlnpc-kuchikomiCassette__postBody',
+    # 楽天 検索結果
+    'li.htl-list-card', 'h2.hotel-list__title-text a',
+    # じゃらん 検索結果
+    '.p-yadoCassette.p-searchResultItem.js-searchResultItem',
+    'a.p-searchResultItem__mapButton', 'h2.p-searchResultItem__facilityName',
+]
+
+# XHTML の XML 宣言 (<?xml ... encoding="..."?>)。lxml は encoding 宣言付きの文字列を解析できないため取り除く
+XML_DECLARATION_REGEX = re.compile(r'^\ufeff?\s*<\?xml[^>]*\?>')
+CHARSET_HEADER_REGEX = re.compile(r'charset=["\']?([\w.:-]+)', re.IGNORECASE)
+META_CHARSET_REGEX = re.compile(rb'<meta[^>]+charset=["\']?([\w.:-]+)', re.IGNORECASE)
+# CP932 の別名はすべて CP932 (Shift_JIS の上位互換) として扱う
+ENCODING_ALIASES = {'shift_jis': 'cp932', 'shift-jis': 'cp932', 'sjis': 'cp932', 'x-sjis': 'cp932', 'windows-31j': 'cp932'}
+
+
+def decode_html(content, content_type=None, expect=None):
+    """
+    生のバイト列から文字コードを判定してデコードする (解析は1回で済む)。
+    判定順: HTTPヘッダの charset -> meta charset -> UTF-8 / CP932 の試行デコード。
+    expect を指定すると、その文字列を含むデコード結果を優先する (例: じゃらんの '件')。
+    戻り値: (デコード済み文字列, 使用した文字コード)
+    """
+    candidates = []
+    if content_type:
+        match = CHARSET_HEADER_REGEX.search(content_type)
+        if match: candidates.append(match.group(1))
+    match = META_CHARSET_REGEX.search(content[:4096])
+    if match: candidates.append(match.group(1).decode('ascii', 'ignore'))
+    candidates += FALLBACK_ENCODINGS
+
+    seen = set()
+    first_decoded = None
+    for encoding in candidates:
+        encoding = ENCODING_ALIASES.get(encoding.lower(), encoding.lower())
+        if encoding in seen: continue
+        seen.add(encoding)
+        try:
+            text = content.decode(encoding)
+        except (UnicodeDecodeError, LookupError):
+            continue
+        if expect is None or expect in text:
+            return text, encoding
+        if first_decoded is None:
+            first_decoded = (text, encoding)
+
+    if first_decoded: return first_decoded
+    return content.decode('utf-8', errors='replace'), 'utf-8'
+
+
+class SoupBackend:
+    """BeautifulSoup (html.parser) による従来方式のバックエンド"""
+    name = 'html.parser'
+
+    def parse(self, text):
+        return BeautifulSoup(text, 'html.parser')
+
+    def select(self, node, selector):
+        return node.select(selector)
+
+    def select_one(self, node, selector):
+        return node.select_one(selector)
+
+    def text(self, node):
+        return node.get_text(strip=True)
+
+    def full_text(self, doc):
+        return doc.get_text()
+
+    def attr(self, node, name):
+        return node.get(name)
+
+
+class LxmlBackend:
+    """lxml + 事前コンパイル済みCSSセレクタによる高速バックエンド"""
+    name = 'lxml'
+
+    def __init__(self, selectors=SELECTORS):
+        self._compiled = {selector: CSSSelector(selector) for selector in selectors}
+        self._text_nodes = etree.XPath('.//text()')
+
+    def _selector(self, selector):
+        if selector not in self._compiled:
+            self._compiled[selector] = CSSSelector(selector)
+        return self._compiled[selector]
+
+    def parse(self, text):
+        # デコード済みの文字列なので XML 宣言は不要 (残すと lxml が ValueError を送出する)。
+        # それ以外の解析エラーは空の文書にせずそのまま送出する (ページの終端と誤認しないため)
+        text = XML_DECLARATION_REGEX.sub('', text, count=1)
+        if not text.strip(): text = '<html></html>'
+        return lxml.html.document_fromstring(text)
+
+    def select(self, node, selector):
+        return self._selector(selector)(node)
+
+    def select_one(self, node, selector):
+        found = self._selector(selector)(node)
+        return found[0] if found else None
+
+    def text(self, node):
+        # BeautifulSoup の get_text(strip=True) と同じく、各テキスト片を strip して連結する
+        return ''.join(s.strip() for s in self._text_nodes(node))
+
+    def full_text(self, doc):
+        return ''.join(self._text_nodes(doc))
+
+    def attr(self, node, name):
+        return node.get(name)
+
+
+_backends = {}
+
+
+def get_backend(name=None):
+    """名前 (省略時は PARSER_BACKEND) に対応するバックエンドを返す"""
+    name = name or PARSER_BACKEND
+    if name not in _backends:
+        if name == 'lxml' and not LXML_AVAILABLE:
+            print("警告: lxml / cssselect が見つからないため html.parser で解析します。")
+            _backends[name] = SoupBackend()
+        else:
+            _backends[name] = LxmlBackend() if name == 'lxml' else SoupBackend()
+    return _backends[name]
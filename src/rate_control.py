@@ -0,0 +1,121 @@
+import asyncio
+import random
+import time
+
+# --- ホスト別のレート設定 (1秒あたりのリクエスト数) ---
+HOST_RATE_LIMITS = {
+    'review.travel.rakuten.co.jp': 2.0,
+    'www.jalan.net': 2.0,
+    'search.travel.rakuten.co.jp': 1.0,  # [NEW] 楽天の検索結果 (マスターリスト生成)
+}
+DEFAULT_RATE = 1.0                   # 上記以外のホストに適用するレート
+
+# --- [NEW] AIMD (加算増加・乗算減少) によるレートの自動調整 ---
+AIMD_INCREASE = 0.05                 # 正常な応答1回ごとに上げるレート (req/s)
+AIMD_DECREASE = 0.5                  # エラー・遅延時にレートへ掛ける係数
+MIN_RATE = 0.2                       # これより下げない (req/s)
+MAX_RATE_FACTOR = 2.0                # 設定レートの何倍まで上げてよいか
+SLOW_RESPONSE_SECONDS = 5.0          # これより遅い応答は混雑とみなして減速する
+DECREASE_COOLDOWN = 2.0              # 同時に失敗した複数リクエストで何度も減速しないための間隔（秒）
+
+# --- [NEW] ページ単位のリトライ設定 ---
+MAX_RETRIES = 4                      # タイムアウト / 429 / 5xx の再試行回数
+BACKOFF_BASE = 1.0                   # 初回の待ち時間の目安（秒）。2倍ずつ伸ばす
+BACKOFF_MAX = 60.0                   # 待ち時間の上限（秒）
+
+
+def aimd_next_rate(rate, ok, latency=None, min_rate=MIN_RATE, max_rate=None):
+    """
+    1回の応答結果から次のレートを計算する。
+    正常かつ速い応答なら少しずつ上げ、エラーか遅い応答なら半分に下げる。
+    """
+    if ok and (latency is None or latency <= SLOW_RESPONSE_SECONDS):
+        rate += AIMD_INCREASE
+    else:
+        rate *= AIMD_DECREASE
+    if max_rate is not None: rate = min(rate, max_rate)
+    return max(rate, min_rate)
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    attempt 回目 (0始まり) の失敗後に待つ秒数。指数的に伸ばし、ジッターで作業員の再試行を分散させる。
+    サーバーが Retry-After を返した場合はそれに従う。
+    """
+    if retry_after is not None:
+        return min(BACKOFF_MAX, retry_after)
+    ceiling = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class TokenBucket:
+    """
+    asyncio用のトークンバケット。rate 個/秒でトークンが補充され、
+    capacity 個までバーストを許容する。
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """トークンを1個取得する。足りなければ補充されるまで待つ。"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """
+    [NEW] 応答結果に応じてレートを自動調整するトークンバケット (AIMD)。
+    サーバーが健全なら max_rate まで徐々に速め、エラーや遅延が出たらすぐに半減する。
+    """
+
+    def __init__(self, rate, capacity=None, min_rate=MIN_RATE, max_rate=None):
+        super().__init__(rate, capacity)
+        self.min_rate = min(min_rate, self.rate)
+        self.max_rate = max_rate if max_rate is not None else self.rate * MAX_RATE_FACTOR
+        self._last_decrease = 0.0
+
+    def _set_rate(self, rate):
+        self._refill() # 変更前のレートで貯まった分を確定させる
+        self.rate = rate
+
+    def on_success(self, latency=None):
+        """正常な応答を受け取ったときに呼ぶ (latency: 通信にかかった秒数)"""
+        if latency is not None and latency > SLOW_RESPONSE_SECONDS:
+            self.on_error()
+            return
+        self._set_rate(aimd_next_rate(self.rate, True, latency, self.min_rate, self.max_rate))
+
+    def on_error(self):
+        """タイムアウト / 429 / 5xx を受け取ったときに呼ぶ"""
+        now = time.monotonic()
+        if now - self._last_decrease < DECREASE_COOLDOWN: return
+        self._last_decrease = now
+        self._set_rate(aimd_next_rate(self.rate, False, None, self.min_rate, self.max_rate))
+
+
+def build_host_buckets(rate_limits=None):
+    """ホスト名 -> AdaptiveTokenBucket の辞書を生成する (設定レートが初期値)"""
+    rate_limits = rate_limits or HOST_RATE_LIMITS
+    return {host: AdaptiveTokenBucket(rate) for host, rate in rate_limits.items()}
+
+
+def bucket_for(buckets, host):
+    """ホストに対応するバケットを返す。未登録ならデフォルトレートで作成する。"""
+    if host not in buckets:
+        buckets[host] = AdaptiveTokenBucket(DEFAULT_RATE)
+    return buckets[host]
@@ -1,31 +1,80 @@
+import argparse
+import asyncio
 import csv
-import json
+import hashlib
+import threading
 import time
 import re # ホテルID抽出のために正規表現ライブラリをインポート
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from multiprocessing import Pool, Manager, freeze_support # freeze_supportを追加
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
 import requests
-from bs4 import BeautifulSoup
 
 # --- [NEW] 日付解析用ライブラリ ---
 # もし入ってなければ pip install python-dateutil
 from dateutil.parser import parse as date_parse
 import locale
 
+try:
+    import http_cache
+    import http_client
+    import page_parser
+    import review_store
+    import scrape_journal
+    import scrape_scheduler
+    import work_queue
+    from rate_control import (build_host_buckets, bucket_for, aimd_next_rate, backoff_delay, MAX_RETRIES,
+                              DEFAULT_RATE, DECREASE_COOLDOWN, MAX_RATE_FACTOR, SLOW_RESPONSE_SECONDS)
+except ImportError:
+    from src import http_cache, http_client, page_parser, review_store, scrape_journal, scrape_scheduler, work_queue
+    from src.rate_control import (build_host_buckets, bucket_for, aimd_next_rate, backoff_delay, MAX_RETRIES,
+                                  DEFAULT_RATE, DECREASE_COOLDOWN, MAX_RATE_FACTOR, SLOW_RESPONSE_SECONDS)
+
 # --- 設定項目 ---
 # --- 設定項目 ---
 # [変更] 各マスターリストのパス
 RAKUTEN_MASTER_FILE = '../data/raw/hotels_raw_rakuten.csv'
 JALAN_MASTER_FILE = '../data/raw/hotels_raw_jalan.csv'
-# [変更] レビューデータファイルのパス
+# [変更] レビューDB (ホテルごとのシャード + manifest) のパス
+STORE_DIR = review_store.STORE_DIR
+# 旧形式の単一JSON。レビューDBが空のときに一度だけ取り込む
 DATA_FILE = '../data/processed/hotel_review_data.json'
-OUTPUT_FILE = '../data/processed/hotel_review_data.json'
+# [NEW] 完了したホテルを1軒ずつ追記するジャーナル (強制終了後の再開用)
+JOURNAL_FILE = scrape_journal.JOURNAL_FILE
 
 # --- パフォーマンス & 安全性設定 ---
 MAX_WORKERS = 4                      # 同時に動かす分身の数
-REQUESTS_PER_SECOND = 2              # 1秒あたりの最大リクエスト数
+REQUESTS_PER_SECOND = 2              # 1秒あたりの最大リクエスト数 (Poolモードでホテルの取得を始める間隔)
+# [変更] Poolモードのページ間隔は asyncモードと同じホスト別レート (rate_control.HOST_RATE_LIMITS) を
+# 全プロセスで共有し、ホストごとに応答に応じて自動調整する (AIMD)
 REFRESH_DAYS = 30                    # この日数より古いデータは再取得の対象とする
+REQUEST_TIMEOUT = 20                 # リクエストのタイムアウト時間（秒）
+
+# --- [NEW] asyncモード設定 (ホスト別レートは rate_control.HOST_RATE_LIMITS) ---
+SCRAPE_MODE = 'async'                # 'async' または 'pool' (--mode で上書き可)
+ASYNC_PAGE_WORKERS = 200             # 共有キューからページを取り出す作業員(コルーチン)の数
+# 通信 (requests はブロッキング) と解析を実行するスレッド数。同時に通信できるページ数の上限はこの値になり、
+# これを超える作業員はスレッドの空きを待つ (ホスト別レートで数 req/s に絞るため、通常はこの上限に達しない)
+ASYNC_FETCH_THREADS = 32
+
+# [NEW] 複数ノードで分担する場合の共有キュー (--queue で有効化)
+WORK_QUEUE_DSN = work_queue.DEFAULT_DSN  # 'sqlite:///...' または 'postgresql://...' (--queue-dsn で上書き可)
+QUEUE_BATCH_SIZE = 50                # 作業ノードが1回に借りるホテル数
+
+# --- [NEW] ページ単位分割の設定 ---
+REVIEWS_PER_PAGE = {'rakuten': 20, 'jalan': 10}   # 1ページあたりのレビュー件数
+# [NEW] 差分取得モード: 既知のレビューだけのページに到達したら巡回を止め、新着分のみマージする
+DELTA_MODE = True                    # --full で無効化 (全ページ再取得 + 全置換)
+
+# [NEW] HTTPキャッシュに保存する抽出結果のキー (抽出ロジックを変えたら版を上げる)
+REVIEW_EXTRACT_KEY = 'reviews-v2'
+
+# 1ページ目からレビュー総数を読み取るためのパターン (上から順に試す)
+REVIEW_COUNT_PATTERNS = [
+    re.compile(r'全\s*([\d,]+)\s*件'),
+    re.compile(r'(?:クチコミ|口コミ)\D{0,10}?([\d,]+)\s*件'),
+]
 
 # --- ロケール設定 (日本語日付解析のため) ---
 try:
@@ -36,14 +85,6 @@ except locale.Error:
     except locale.Error: print("警告: 代替ロケールも失敗。")
 
 
-def load_existing_data(file_path):
-    """既存のレビューデータ(hotel_data.json)を読み込む"""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
-
 def generate_unique_id(url):
     """URLからソース名とホテルIDを抽出し、ユニークIDを生成する"""
     if "review.travel.rakuten.co.jp" in url:
@@ -78,51 +119,81 @@ def load_target_hotels(rakuten_file, jalan_file):
 
     return targets
 
+def review_fingerprint(review):
+    """レビューの指紋 (投稿日 + 本文ハッシュ) を返す"""
+    text_hash = hashlib.sha1(review.get('text', '').encode('utf-8')).hexdigest()[:16]
+    return f"{review.get('date')}:{text_hash}"
+
+def build_known_fingerprints(todo_hotels, existing_data):
+    """
+    差分取得できるホテル (保存済みで形式が新しいもの) について、
+    ユニークID -> 既知レビューの指紋セット を返す。
+    """
+    known = {}
+    for unique_id in todo_hotels:
+        meta = existing_data.meta(unique_id)
+        if not meta or not meta.get('review_count') or meta.get('review_format') != review_store.REVIEW_FORMAT: continue
+        hotel_entry = existing_data.get(unique_id)
+        if not hotel_entry: continue
+        known[unique_id] = {review_fingerprint(r) for r in hotel_entry.get('reviews', [])}
+    return known
+
+def split_new_reviews(page_reviews, known_fingerprints):
+    """ページのレビューのうち未知のものだけを返す"""
+    return [r for r in page_reviews if review_fingerprint(r) not in known_fingerprints]
+
+def merge_reviews(new_reviews, stored_reviews):
+    """新着レビューを保存済みリストの先頭(新しい順)にマージする。サイト側で非表示になった過去分も残る。"""
+    seen = set()
+    merged = []
+    for review in new_reviews + stored_reviews:
+        fingerprint = review_fingerprint(review)
+        if fingerprint in seen: continue
+        seen.add(fingerprint)
+        merged.append(review)
+    return merged
+
 def determine_scrape_targets(targets, existing_data):
     """
     ユニークIDを基準に、差分と鮮度、レビュー形式をチェックし、更新対象のリストを返す。
+    [変更] レビュー本体は読まず、レビューDBの manifest (書き込み時に更新されるメタデータ) だけで判定する。
+    [NEW] 鮮度期限前でも、投稿ペースから新着が多く見込めるホテルは前倒しで更新する。
     """
     print("更新対象のホテルを抽出中...")
     todo_list = {}
-    thirty_days_ago = datetime.now() - timedelta(days=REFRESH_DAYS)
+    now = datetime.now()
+    thirty_days_ago = now - timedelta(days=REFRESH_DAYS)
+    reason_counts = {'新規': 0, '古いレビュー形式/日付未取得': 0, '取得途中': 0, '最終更新日不明': 0,
+                     'データが古い': 0, '新着見込み': 0, '不正な最終更新日': 0}
 
     for unique_id, data in targets.items():
-        needs_update = False
-        if unique_id not in existing_data:
-            needs_update = True # 完全新規
-            print(f"  -> {data['hotel_name']} ({data['source']}): 新規のため更新対象")
+        reason = None
+        meta = existing_data.meta(unique_id)
+        if meta is None:
+            reason = '新規' # 完全新規
+        elif meta.get('review_format') != review_store.REVIEW_FORMAT: # 古い形式なら更新
+            reason = '古いレビュー形式/日付未取得'
+        elif meta.get('resume_page'): # 前回途中で失敗したホテルは続きから取得する
+            reason = '取得途中'
+        elif not meta.get('last_updated'):
+            reason = '最終更新日不明'
         else:
-            hotel_entry = existing_data[unique_id]
-            last_updated_str = hotel_entry.get('last_updated')
-            reviews_data = hotel_entry.get('reviews', [])
-            # [修正] レビュー形式が古いか、日付がNoneかチェック
-            is_old_format = any(
-                isinstance(r, str) or
-                (isinstance(r, dict) and r.get('date') is None and data['source'] == 'jalan') or # Jalanで日付がNoneなら更新対象
-                (isinstance(r, dict) and 'date' not in r) # dateキー自体がない
-                for r in reviews_data
-            )
-
-            if is_old_format: # 古い形式なら更新
-                 needs_update = True
-                 print(f"  -> {data['hotel_name']} ({data['source']}): 古いレビュー形式/日付未取得のため更新対象")
-            elif not last_updated_str:
-                 needs_update = True
-                 print(f"  -> {data['hotel_name']} ({data['source']}): 最終更新日不明のため更新対象")
-            else:
-                try:
-                    last_updated = datetime.fromisoformat(last_updated_str)
-                    if last_updated < thirty_days_ago:
-                        needs_update = True
-                        print(f"  -> {data['hotel_name']} ({data['source']}): データが古いため更新対象 (最終更新: {last_updated_str})")
-                except ValueError:
-                     needs_update = True
-                     print(f"  -> {data['hotel_name']} ({data['source']}): 不正な最終更新日のため更新対象")
-
-        if needs_update:
+            try:
+                last_updated = datetime.fromisoformat(meta['last_updated'])
+                if last_updated < thirty_days_ago:
+                    reason = 'データが古い'
+                elif ((now - last_updated).days >= scrape_scheduler.EARLY_REFRESH_MIN_DAYS and
+                      scrape_scheduler.expected_new_reviews(meta, now) >= scrape_scheduler.EARLY_REFRESH_REVIEWS):
+                    reason = '新着見込み'
+            except ValueError:
+                reason = '不正な最終更新日'
+
+        if reason:
+            reason_counts[reason] += 1
             todo_list[unique_id] = data
 
-    print(f"-> {len(todo_list)}件のホテルが更新対象です。")
+    summary = ', '.join(f"{reason}: {count}件" for reason, count in reason_counts.items() if count)
+    print(f"-> {len(targets)}件中 {len(todo_list)}件のホテルが更新対象です。" + (f" ({summary})" if summary else ""))
     return todo_list
 
 def parse_review_date(date_str, source):
@@ -155,189 +226,754 @@ def parse_review_date(date_str, source):
         print(f"  [警告] 解析不能な日付形式 ({source}): '{date_str}'")
         return None
 
+def build_review_page_url(url, source, page_num):
+    """ソースに応じて、page_num ページ目のレビューURLを組み立てる"""
+    if source == "rakuten":
+        parsed_url = urlparse(url); query_params = parse_qs(parsed_url.query)
+        query_params['f_next'] = [str((page_num - 1) * 20)]
+        new_query = urlencode(query_params, doseq=True)
+        return parsed_url._replace(query=new_query).geturl()
+    elif source == "jalan":
+        if page_num == 1: return url
+        parsed_url = urlparse(url); path = parsed_url.path.rstrip('/')
+        base_kuchikomi_path = path.rsplit('/', 1)[0] if '/archive' in path else path
+        if not base_kuchikomi_path.endswith('kuchikomi'): # 念のため
+             base_kuchikomi_path += '/kuchikomi'
+
+        new_path_segment = f"{page_num}.HTML"
+        # アーカイブパスを維持
+        if '/archive' in path:
+             new_path = f"{base_kuchikomi_path}/archive/{new_path_segment}"
+        else:
+             new_path = f"{base_kuchikomi_path}/{new_path_segment}"
+
+        return urlunparse(parsed_url._replace(path=new_path))
+    return None
+
+def fetch_review_page(page_url, source):
+    """
+    レビューページを1枚、HTTPキャッシュ経由で取得する。
+    じゃらんの404は最終ページ超過とみなし None を返す。
+    """
+    response = http_cache.fetch(page_url, timeout=REQUEST_TIMEOUT)
+    if source == "jalan" and response.status_code == 404: return None
+    response.raise_for_status()
+    return response
+
+def fetch_and_parse_page(page_url, source, page_num):
+    """
+    1ページを取得・解析する。404(最終ページ超過)は None。
+    本文が前回取得時と同一なら、解析せずに前回の抽出結果を使う。
+    """
+    response = fetch_review_page(page_url, source)
+    if response is None: return None
+    cached = http_cache.load_extracted(response, REVIEW_EXTRACT_KEY)
+    if cached is not None: return tuple(cached)
+    parsed = parse_review_page(response.content, source, page_num, response.headers.get('Content-Type'))
+    http_cache.store_extracted(response, REVIEW_EXTRACT_KEY, list(parsed))
+    return parsed
+
+def timed_fetch_and_parse_page(page_url, source, page_num):
+    """fetch_and_parse_page の結果と通信・解析にかかった秒数を返す (レート自動調整用)"""
+    started = time.monotonic()
+    parsed = fetch_and_parse_page(page_url, source, page_num)
+    return parsed, time.monotonic() - started
+
+def spend_budget(budget):
+    """リクエスト1件分の実行予算を確保する。使い切っていれば BudgetExhausted を送出する。"""
+    if budget is not None and not budget.try_spend():
+        raise scrape_scheduler.BudgetExhausted()
+
+def fetch_page_with_retry(page_url, source, page_num, on_outcome=None, budget=None, before_request=None):
+    """
+    【Poolモード】1ページを取得・解析する。タイムアウト / 429 / 5xx は間隔を伸ばしながら再試行する。
+    on_outcome(ok, latency) で応答ごとの結果を通知する (レート自動調整用)。
+    before_request() は再試行を含む各リクエストの直前に呼ぶ (ホスト別の間隔待ち用)。
+    budget を渡すと、再試行を含めて1リクエストごとに予算を消費する。
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        spend_budget(budget)
+        if before_request: before_request()
+        try:
+            parsed, latency = timed_fetch_and_parse_page(page_url, source, page_num)
+        except requests.RequestException as e:
+            if not http_client.is_retryable_error(e) or attempt == MAX_RETRIES: raise
+            if on_outcome: on_outcome(False, None)
+            time.sleep(backoff_delay(attempt, http_client.retry_after_seconds(e)))
+            continue
+        if on_outcome: on_outcome(True, latency)
+        return parsed
+
+async def fetch_page_with_retry_async(loop, executor, bucket, page_url, source, page_num, budget=None):
+    """【asyncモード】fetch_page_with_retry と同じ再試行を、ホスト別バケットの調整込みで行う"""
+    for attempt in range(MAX_RETRIES + 1):
+        spend_budget(budget)
+        await bucket.acquire()
+        try:
+            parsed, latency = await loop.run_in_executor(executor, timed_fetch_and_parse_page, page_url, source, page_num)
+        except requests.RequestException as e:
+            if not http_client.is_retryable_error(e) or attempt == MAX_RETRIES: raise
+            bucket.on_error()
+            await asyncio.sleep(backoff_delay(attempt, http_client.retry_after_seconds(e)))
+            continue
+        bucket.on_success(latency)
+        return parsed
+
+def pool_host_rates(buckets):
+    """
+    Poolモードの共有辞書に入れるホスト別の初期レートと上限 (asyncモードのバケットと同じ設定)。
+    共有辞書の値の書き換えだけがプロセス間で伝わるため、'rate:ホスト' のような平たいキーにする。
+    """
+    rates = {}
+    for host, bucket in buckets.items():
+        rates[f'rate:{host}'] = bucket.rate
+        rates[f'max_rate:{host}'] = bucket.max_rate
+    return rates
+
+def wait_host_slot(rate_limiter, host):
+    """
+    【Poolモード】ホストの次のリクエスト枠まで待つ。枠は全プロセスで共有するため、
+    作業員の数に関係なく、そのホストへのリクエストは合計で 'rate:ホスト' req/s に収まる。
+    """
+    with rate_limiter['lock']:
+        rate = rate_limiter.get(f'rate:{host}', DEFAULT_RATE)
+        now = time.monotonic()
+        slot = max(now, rate_limiter.get(f'next:{host}', now))
+        rate_limiter[f'next:{host}'] = slot + 1.0 / rate
+    if slot > now: time.sleep(slot - now)
+
+def record_host_outcome(rate_limiter, host, ok, latency):
+    """【Poolモード】応答結果でホストのレートを調整する (AdaptiveTokenBucket と同じ AIMD・減速の間隔)"""
+    slow = latency is not None and latency > SLOW_RESPONSE_SECONDS
+    with rate_limiter['lock']:
+        rate = rate_limiter.get(f'rate:{host}', DEFAULT_RATE)
+        max_rate = rate_limiter.get(f'max_rate:{host}', DEFAULT_RATE * MAX_RATE_FACTOR)
+        if not ok or slow:
+            now = time.monotonic()
+            if now - rate_limiter.get(f'decreased:{host}', 0.0) < DECREASE_COOLDOWN: return
+            rate_limiter[f'decreased:{host}'] = now
+        rate_limiter[f'rate:{host}'] = aimd_next_rate(rate, ok, latency, max_rate=max_rate)
+
+def failed_result(unique_id, data, reviews_with_dates, error, page_num):
+    """
+    取得に失敗したホテルの結果を作る。途中までのレビューがあれば、
+    失敗したページ番号を再開位置として部分結果を返す。
+    """
+    if reviews_with_dates:
+        return unique_id, data, reviews_with_dates, error, page_num
+    return unique_id, data, None, error, None
+
+def parse_review_page(content, source, page_num, content_type=None, backend=None):
+    """
+    レビューページのHTMLから日付付きレビューを抽出する。
+    戻り値: (レビューのリスト, ページ先頭レビューの本文, レビュー総数)
+    レビュー総数は1ページ目のみ読み取り、見つからなければ None。
+    """
+    # --- [変更] 文字コードはバイト列から先に判定し、解析は1回だけ行う ---
+    # じゃらんは '件' を含むデコード結果を優先する (従来の文字化け検知と同じ基準)
+    text, _ = page_parser.decode_html(content, content_type, expect='件' if source == 'jalan' else None)
+    parser = backend or page_parser.get_backend()
+    doc = parser.parse(text)
+
+    reviews = []
+    first_text = None
+    if source == "rakuten":
+        for block in parser.select(doc, 'dl.commentReputation'):
+            date_element = parser.select_one(block, 'dt > span.time')
+            text_element = parser.select_one(block, 'dd > p.commentSentence')
+            if date_element is not None and text_element is not None:
+                raw_date_str = parser.text(date_element)
+                review_text = parser.text(text_element)
+                formatted_date = parse_review_date(raw_date_str, source)
+                if review_text:
+                    reviews.append({"date": formatted_date, "text": review_text})
+
+    elif source == "jalan":
+         # HTMLスニペットに基づいてセレクタを正確に指定
+         review_blocks = parser.select(doc, 'div.jlnpc-kuchikomiCassette__contWrap')
+         if review_blocks:
+              # Jalan無限ループ防止用に、ページ先頭のレビュー本文を控えておく
+              first_text_el = parser.select_one(review_blocks[0], 'p.jlnpc-kuchikomiCassette__postBody')
+              first_text = parser.text(first_text_el) if first_text_el is not None else None
+
+         for block in review_blocks:
+             # 日付要素: div.jlnpc-kuchikomiCassette__rightArea p.jlnpc-kuchikomiCassette__postDate
+             date_element = parser.select_one(block, 'div.jlnpc-kuchikomiCassette__rightArea p.jlnpc-kuchikomiCassette__postDate')
+             # 本文要素: div.jlnpc-kuchikomiCassette__rightArea p.jlnpc-kuchikomiCassette__postBody
+             text_element = parser.select_one(block, 'div.jlnpc-kuchikomiCassette__rightArea p.jlnpc-kuchikomiCassette__postBody')
+
+             if text_element is not None: # 本文があれば処理
+                 raw_date_str = parser.text(date_element) if date_element is not None else None
+                 review_text = parser.text(text_element)
+
+                 formatted_date = parse_review_date(raw_date_str, source)
+
+                 if review_text:
+                     reviews.append({"date": formatted_date, "text": review_text})
+
+    total_count = parse_total_review_count(parser.full_text(doc)) if page_num == 1 else None
+    return reviews, first_text, total_count
+
+def parse_total_review_count(page_text):
+    """ページ本文からレビュー総数を読み取る。読み取れなければ None。"""
+    for pattern in REVIEW_COUNT_PATTERNS:
+        match = pattern.search(page_text)
+        if match:
+            try: return int(match.group(1).replace(',', ''))
+            except ValueError: continue
+    return None
+
+def is_repeated_page(source, page_num, first_text, last_page_first_text):
+    """じゃらんで前ページと同じ内容が返ってきた(無限ループ)かを判定する"""
+    # 最初のページ以外で、かつ最初のレビューが前回と同じならループ終了
+    return source == "jalan" and page_num > 1 and first_text == last_page_first_text
+
 def scrape_hotel_reviews_worker(args):
     """
-    【現場作業員】1軒のホテルの全レビュー（日付付き）を取得する。
+    【現場作業員】1軒のホテルの全レビュー（日付付き）を取得する。(Poolモード)
+    known_fingerprints が渡された場合は差分取得となり、新着レビューのみを返す。
+    start_page が2以上なら、前回失敗したページから続きを取得する。
+    budget (実行予算) を使い切ったら、取得済みの分を再開ページ付きで返して打ち切る。
+    戻り値: (unique_id, data, レビュー, エラー, 再開ページ)
     """
-    unique_id, data, rate_limiter = args
+    unique_id, data, rate_limiter, known_fingerprints, start_page, budget = args
     name = data['hotel_name']
     url = data['url']
     source = data['source']
 
+    if source not in ("rakuten", "jalan"): return unique_id, data, None, "不明なソース", None
+    if budget is not None and budget.exhausted():
+        return unique_id, data, None, scrape_scheduler.BUDGET_EXHAUSTED_ERROR, None
+
     with rate_limiter['lock']:
         elapsed = time.monotonic() - rate_limiter['last_call']
         wait_time = (1.0 / REQUESTS_PER_SECOND) - elapsed
         if wait_time > 0: time.sleep(wait_time)
         rate_limiter['last_call'] = time.monotonic()
 
-    print(f"  [作業開始] {name} ({source})")
+    host = urlparse(url).netloc
+    # [変更] ページ間隔はホストごとに全プロセスで共有し、そのホストの応答結果だけで調整する (AIMD)
+    on_outcome = lambda ok, latency: record_host_outcome(rate_limiter, host, ok, latency)
+    before_request = lambda: wait_host_slot(rate_limiter, host)
+
+    print(f"  [作業開始] {name} ({source})" + (f" ページ{start_page}から再開" if start_page > 1 else ""))
 
     reviews_with_dates = []
-    page_num = 1
-    page_offset = 0
+    page_num = start_page
     last_page_first_review_text = None
 
     while True:
         try:
-            headers = { "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36" }
-            current_page_url = ""
-
-            # --- ソース別ページネーション (変更なし) ---
-            if source == "rakuten":
-                parsed_url = urlparse(url); query_params = parse_qs(parsed_url.query)
-                query_params['f_next'] = [str(page_offset)]
-                new_query = urlencode(query_params, doseq=True)
-                current_page_url = parsed_url._replace(query=new_query).geturl()
-            elif source == "jalan":
-                if page_num == 1: current_page_url = url
+            current_page_url = build_review_page_url(url, source, page_num)
+            parsed = fetch_page_with_retry(current_page_url, source, page_num, on_outcome, budget, before_request)
+            if parsed is None: break
+
+            page_reviews, first_text, _ = parsed
+            if is_repeated_page(source, page_num, first_text, last_page_first_review_text):
+                print("-> 前のページと同じ内容を検出しました。このセクションの取得を完了します。")
+                break
+            last_page_first_review_text = first_text
+
+            if not page_reviews: break
+            if known_fingerprints is not None:
+                page_reviews = split_new_reviews(page_reviews, known_fingerprints)
+                if not page_reviews: break # 既知のレビューのみのページに到達
+            reviews_with_dates.extend(page_reviews)
+
+            # 次ページへ (間隔は次のリクエストの直前に wait_host_slot で待つ)
+            page_num += 1
+
+        except scrape_scheduler.BudgetExhausted:
+            # [NEW] 予算切れ: 取得済みの分を再開位置付きで返し、残りは次回へ持ち越す
+            return failed_result(unique_id, data, reviews_with_dates, scrape_scheduler.BUDGET_EXHAUSTED_ERROR, page_num)
+        except requests.RequestException as e:
+            # [変更] 再試行しても失敗したページより前の取得分は、再開位置付きで返す
+            return failed_result(unique_id, data, reviews_with_dates, str(e), page_num)
+        except Exception as e_gen:
+            return failed_result(unique_id, data, reviews_with_dates, f"予期せぬエラー: {e_gen}", page_num)
+
+    return unique_id, data, reviews_with_dates, None, None # 日付付きリストを返す
+
+class HotelPages:
+    """
+    asyncモードで1軒のホテルのページ取得状況を管理する。
+    ページは順不同で完了するため、最後にページ番号順に並べ直して結合する。
+    """
+
+    def __init__(self, unique_id, data, known_fingerprints=None, start_page=1):
+        self.unique_id = unique_id
+        self.data = data
+        self.source = data['source']
+        self.known = known_fingerprints # 差分取得時のみ既知レビューの指紋セット
+        self.start_page = start_page    # 前回の続きから取得する場合は再開ページ
+        self.pages = {}          # page_num -> (reviews, first_text) / 最終ページ超過(404)は None
+        self.pending = 0         # キューに積まれていて未完了のページ数
+        self.last_planned = None # 取得予定の最終ページ番号 (総数不明なら None)
+        self.error = None
+        self.failed_page = None  # 再試行しても取得できなかった最小のページ番号
+
+    def fail(self, page_num, error):
+        """ページの取得失敗を記録する。以降はこれより後ろのページを取得しない。"""
+        if self.failed_page is None or page_num < self.failed_page:
+            self.failed_page = page_num
+            self.error = error
+
+    def wants(self, page_num):
+        """失敗したページより前なら、エラー後も取得を続ける (部分結果を長く残すため)"""
+        return self.failed_page is None or page_num < self.failed_page
+
+    def plan_from_total(self, total_count):
+        """レビュー総数から必要なページ数を決め、2ページ目以降の番号を返す"""
+        per_page = REVIEWS_PER_PAGE[self.source]
+        self.last_planned = max(1, -(-total_count // per_page))
+        return list(range(2, self.last_planned + 1))
+
+    def next_pages_after(self, page_num):
+        """
+        page_num の完了を受けて、追加で積むべきページ番号を返す。
+        総数が不明なホテルは1ページずつ順に、予定より実際の件数が多い場合は予定の末尾を延長する。
+        """
+        page = self.pages.get(page_num)
+        if page is None or not page[0]: return []
+        if self.is_repeated(page_num): return []
+        if self.known is not None and not split_new_reviews(page[0], self.known): return []
+        if self.last_planned is None:
+            return [page_num + 1]
+        if page_num == self.last_planned and len(page[0]) >= REVIEWS_PER_PAGE[self.source]:
+            self.last_planned += 1
+            return [self.last_planned]
+        return []
+
+    def is_repeated(self, page_num):
+        prev = self.pages.get(page_num - 1)
+        page = self.pages.get(page_num)
+        if prev is None or page is None: return False
+        return is_repeated_page(self.source, page_num, page[1], prev[1])
+
+    def assemble(self):
+        """
+        取得済みページを番号順に結合する。空ページ/404/重複ページ/欠番で打ち切る。
+        戻り値: (レビュー, 欠番で打ち切った場合はそのページ番号 / 最後まで読めた場合は None)
+        """
+        reviews_with_dates = []
+        page_num = self.start_page
+        while page_num in self.pages:
+            page = self.pages[page_num]
+            if page is None: break
+            if self.is_repeated(page_num):
+                print(f"-> {self.data['hotel_name']}: 前のページと同じ内容を検出しました。このセクションの取得を完了します。")
+                break
+            if not page[0]: break
+            page_reviews = page[0]
+            if self.known is not None:
+                page_reviews = split_new_reviews(page_reviews, self.known)
+                if not page_reviews: break
+            reviews_with_dates.extend(page_reviews)
+            page_num += 1
+        else:
+            return reviews_with_dates, page_num
+        return reviews_with_dates, None
+
+    def result(self):
+        reviews_with_dates, missing_page = self.assemble()
+        if self.error and missing_page is not None:
+            # 失敗ページの手前まで (欠番の直前まで) を部分結果とし、欠番から再開する
+            return failed_result(self.unique_id, self.data, reviews_with_dates, self.error, missing_page)
+        # 失敗したのが実際の最終ページより後ろだけなら、取得は完了している
+        return self.unique_id, self.data, reviews_with_dates, None, None
+
+
+async def page_worker(queue, states, buckets, executor, on_result, budget=None):
+    """
+    【非同期作業員】共有キューから (優先順位, page_num, unique_id) を1件ずつ取り出して処理する。
+    どのホテルのページでも受け持つため、巨大なホテル1軒に作業員が張り付くことはない。
+    キューは優先度付きなので、優先順位の高いホテルのページから先に取得される。
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        rank, page_num, unique_id = await queue.get()
+        state = states[unique_id]
+        cancelled = False
+        try:
+            if state.wants(page_num):
+                url = state.data['url']
+                page_url = build_review_page_url(url, state.source, page_num)
+                bucket = bucket_for(buckets, urlparse(url).netloc)
+                parsed = await fetch_page_with_retry_async(loop, executor, bucket, page_url, state.source, page_num, budget)
+
+                if parsed is None:
+                    state.pages[page_num] = None
+                    new_pages = []
                 else:
-                    parsed_url = urlparse(url); path = parsed_url.path.rstrip('/')
-                    base_kuchikomi_path = path.rsplit('/', 1)[0] if '/archive' in path else path
-                    if not base_kuchikomi_path.endswith('kuchikomi'): # 念のため
-                         base_kuchikomi_path += '/kuchikomi'
-                    
-                    new_path_segment = f"{page_num}.HTML"
-                    # アーカイブパスを維持
-                    if '/archive' in path:
-                         new_path = f"{base_kuchikomi_path}/archive/{new_path_segment}"
+                    page_reviews, first_text, total_count = parsed
+                    state.pages[page_num] = (page_reviews, first_text)
+                    # 差分取得では全ページを先に積まず、既知ページに当たるまで1ページずつ進める
+                    if page_num == 1 and page_reviews and total_count is not None and state.known is None:
+                        print(f"  [作業開始] {state.data['hotel_name']} ({state.source}): 全{total_count}件")
+                        new_pages = state.plan_from_total(total_count)
+                        new_pages += state.next_pages_after(page_num)
                     else:
-                         new_path = f"{base_kuchikomi_path}/{new_path_segment}"
-
-                    current_page_url = urlunparse(parsed_url._replace(path=new_path))
-            else: return unique_id, data, None, "不明なソース"
-
-            response = requests.get(current_page_url, headers=headers, timeout=20)
-            if source == "jalan" and response.status_code == 404: break
-            response.raise_for_status()
-
-            # --- 文字コード処理 (変更なし) ---
-            encoding_to_use = None
-            if source == 'jalan' and page_num == 1:
-                 temp_soup = BeautifulSoup(response.content, 'html.parser')
-                 if '件' not in temp_soup.get_text(): encoding_to_use = 'CP932'
-            soup = BeautifulSoup(response.content, 'html.parser', from_encoding=encoding_to_use)
-
-            # --- [変更] レビュー抽出 (じゃらんの日付取得を正確に実装) ---
-            review_elements_found_on_page = False
-            if source == "rakuten":
-                review_blocks = soup.select('dl.commentReputation')
-                if not review_blocks: break
-                for block in review_blocks:
-                    date_element = block.select_one('dt > span.time')
-                    text_element = block.select_one('dd > p.commentSentence')
-                    if date_element and text_element:
-                        raw_date_str = date_element.get_text(strip=True)
-                        review_text = text_element.get_text(strip=True)
-                        formatted_date = parse_review_date(raw_date_str, source)
-                        if review_text:
-                            reviews_with_dates.append({"date": formatted_date, "text": review_text})
-                            review_elements_found_on_page = True
-
-            elif source == "jalan":
-                 # HTMLスニペットに基づいてセレクタを正確に指定
-                 review_blocks = soup.select('div.jlnpc-kuchikomiCassette__contWrap')
-                 if not review_blocks: break
-
-                 # Jalan無限ループ防止のための準備
-                 if review_blocks:
-                      current_first_text_el = review_blocks[0].select_one('p.jlnpc-kuchikomiCassette__postBody')
-                      current_first = current_first_text_el.get_text(strip=True) if current_first_text_el else None
-                      # 最初のページ以外で、かつ最初のレビューが前回と同じならループ終了
-                      if page_num > 1 and current_first == last_page_first_review_text:
-                           print("-> 前のページと同じ内容を検出しました。このセクションの取得を完了します。")
-                           break
-                      last_page_first_review_text = current_first
-
-                 for block in review_blocks:
-                     # 日付要素: div.jlnpc-kuchikomiCassette__rightArea p.jlnpc-kuchikomiCassette__postDate
-                     date_element = block.select_one('div.jlnpc-kuchikomiCassette__rightArea p.jlnpc-kuchikomiCassette__postDate')
-                     # 本文要素: div.jlnpc-kuchikomiCassette__rightArea p.jlnpc-kuchikomiCassette__postBody
-                     text_element = block.select_one('div.jlnpc-kuchikomiCassette__rightArea p.jlnpc-kuchikomiCassette__postBody')
-
-                     if text_element: # 本文があれば処理
-                         raw_date_str = date_element.get_text(strip=True) if date_element else None
-                         review_text = text_element.get_text(strip=True)
-                         
-                         formatted_date = parse_review_date(raw_date_str, source)
-
-                         if review_text:
-                             reviews_with_dates.append({"date": formatted_date, "text": review_text})
-                             review_elements_found_on_page = True
-
-            if not review_elements_found_on_page: break
-
-            # 次ページへ
-            if source == "rakuten": page_offset += 20
-            elif source == "jalan": page_num += 1
-
-            time.sleep(0.5)
-
+                        new_pages = state.next_pages_after(page_num)
+
+                for next_page in new_pages:
+                    state.pending += 1
+                    queue.put_nowait((rank, next_page, unique_id))
+        except asyncio.CancelledError:
+            # 中断時は未完了のまま残す (完了扱いにしてジャーナルへ書かない)
+            cancelled = True
+            raise
+        except scrape_scheduler.BudgetExhausted:
+            # 予算切れ: このページ以降は取得せず、次回の実行へ持ち越す
+            state.fail(page_num, scrape_scheduler.BUDGET_EXHAUSTED_ERROR)
         except requests.RequestException as e:
-            return unique_id, data, None, str(e)
+            state.fail(page_num, str(e))
         except Exception as e_gen:
-             return unique_id, data, None, f"予期せぬエラー: {e_gen}"
+            state.fail(page_num, f"予期せぬエラー: {e_gen}")
+        finally:
+            state.pending -= 1
+            if state.pending == 0 and not cancelled:
+                # ホテルが完了したらすぐに結果を渡し、保持していたページを解放する
+                del states[unique_id]
+                on_result(state.result())
+            queue.task_done()
+
+async def run_async_scrape(todo_hotels, on_result, known=None, resume_pages=None, budget=None):
+    """
+    asyncモードの司令塔。全ホテルの1ページ目を共有キューに積み、
+    1ページ目で判明した総数から残りのページを独立したタスクとして追加していく。
+    todo_hotels の並び順がそのまま優先順位になる (先頭のホテルのページほど先に取得)。
+    known (ユニークID -> 既知指紋セット) に含まれるホテルは差分取得となる。
+    resume_pages (ユニークID -> 再開ページ) に含まれるホテルは、そのページから1ページずつ取得する。
+    ホテルが1軒完了するたびに on_result((unique_id, data, reviews, error, resume_page)) を呼ぶ。
+    """
+    known = known or {}
+    resume_pages = resume_pages or {}
+    buckets = build_host_buckets()
+    queue = asyncio.PriorityQueue()
+    states = {}
+
+    for rank, (unique_id, data) in enumerate(todo_hotels.items()):
+        if data['source'] not in REVIEWS_PER_PAGE:
+            on_result((unique_id, data, None, "不明なソース", None))
+            continue
+        start_page = resume_pages.get(unique_id, 1)
+        states[unique_id] = HotelPages(unique_id, data, known.get(unique_id), start_page)
+        states[unique_id].pending = 1
+        queue.put_nowait((rank, start_page, unique_id))
+
+    with ThreadPoolExecutor(max_workers=ASYNC_FETCH_THREADS) as executor:
+        workers = [
+            asyncio.create_task(page_worker(queue, states, buckets, executor, on_result, budget))
+            for _ in range(ASYNC_PAGE_WORKERS)
+        ]
+        await queue.join()
+        for worker in workers: worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+def pool_task(args):
+    """Poolの子プロセスで作業員を動かし、結果とHTTPキャッシュ統計を親に返す"""
+    http_cache.take_stats()
+    result = scrape_hotel_reviews_worker(args)
+    return result, http_cache.take_stats()
+
+def run_pool_scrape(todo_hotels, on_result, known=None, resume_pages=None, budget=None):
+    """
+    Poolモードの司令塔 (従来方式)。todo_hotels の並び順に作業員へ渡す。
+    結果は imap_unordered で完了順に受け取り、1軒ごとに on_result を呼ぶ。
+    """
+    known = known or {}
+    resume_pages = resume_pages or {}
+    manager = Manager()
+    rate_limiter = manager.dict({'lock': manager.Lock(), 'last_call': time.monotonic(),
+                                 **pool_host_rates(build_host_buckets())})
+    if budget is not None:
+        # 使ったリクエスト数を子プロセス間で共有する
+        budget.shared = manager.dict({'lock': manager.Lock(), 'requests': 0})
+    tasks = [(uid, data, rate_limiter, known.get(uid), resume_pages.get(uid, 1), budget)
+             for uid, data in todo_hotels.items()]
 
-    return unique_id, data, reviews_with_dates, None # 日付付きリストを返す
+    # [追加] Windows環境でのmultiprocessing問題を回避するためのおまじない
+    freeze_support()
 
-def main():
+    with Pool(processes=MAX_WORKERS) as pool:
+        for result, cache_stats in pool.imap_unordered(pool_task, tasks):
+            http_cache.merge_stats(cache_stats)
+            on_result(result)
+
+def publish_queue(queue, todo_hotels, known, resume_pages):
+    """
+    [NEW] 更新対象のホテルを共有キューに登録する (司令塔)。並び順 (期待新着数順) がそのまま優先順位になる。
+    差分取得用の既知指紋と再開ページもタスクに含め、レビューDBを持たない作業ノードでも同じ取得ができるようにする。
+    """
+    tasks = []
+    for rank, (unique_id, data) in enumerate(todo_hotels.items()):
+        payload = {'data': data, 'resume_page': resume_pages.get(unique_id)}
+        if unique_id in known: payload['known'] = sorted(known[unique_id])
+        tasks.append((unique_id, payload, rank))
+    return queue.publish(tasks)
+
+def run_queue_worker(queue, node_id, budget=None):
+    """
+    [NEW] 共有キューの作業ノード。ホテルを優先順に QUEUE_BATCH_SIZE 件ずつ借り、asyncモードで取得して結果をキューへ返す。
+    処理中は貸出期限を定期的に延長し、ノードが落ちた場合は期限切れ後に他のノードが取り直す
+    (途中まで取れていたページは、次のマージ後に再開ページから続きを取得する)。
+    戻り値: {'completed': 完了, 'released': 予算切れで返却, 'lost': 期限切れで他ノードに取られた}
+    """
+    counts = {'completed': 0, 'released': 0, 'lost': 0}
+    in_flight = set()
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(work_queue.LEASE_SECONDS / 3):
+            with lock: task_ids = list(in_flight)
+            queue.heartbeat(node_id, task_ids)
+        queue.close() # このスレッドの接続
+
+    def on_result(result):
+        unique_id, data, reviews_with_dates, error, resume_page = result
+        with lock: in_flight.discard(unique_id)
+        if error == scrape_scheduler.BUDGET_EXHAUSTED_ERROR and not reviews_with_dates:
+            queue.release(node_id, unique_id, count_attempt=False) # 未着手のまま他のノード (または次回) へ
+            counts['released'] += 1
+            return
+        if error: print(f"  [エラー] {data['hotel_name']} ({data['source']}): {error}")
+        if queue.complete(node_id, unique_id, {'reviews': reviews_with_dates, 'error': error, 'resume_page': resume_page}):
+            counts['completed'] += 1
+        else:
+            print(f"  [警告] {data['hotel_name']}: 貸出期限が切れて他のノードに渡ったため、結果を破棄しました。")
+            counts['lost'] += 1
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    try:
+        while not (budget and budget.exhausted()):
+            tasks = queue.claim(node_id, QUEUE_BATCH_SIZE)
+            if not tasks: break
+            todo_hotels, known, resume_pages = {}, {}, {}
+            for unique_id, payload in tasks:
+                todo_hotels[unique_id] = payload['data']
+                if 'known' in payload: known[unique_id] = set(payload['known'])
+                if payload.get('resume_page'): resume_pages[unique_id] = payload['resume_page']
+            with lock: in_flight.update(todo_hotels)
+            print(f"-> {len(todo_hotels)}件を借りました (ノード {node_id})。")
+            asyncio.run(run_async_scrape(todo_hotels, on_result, known, resume_pages, budget))
+    finally:
+        stop.set()
+    return counts
+
+def merge_queue_results(queue, existing_data):
+    """
+    [NEW] 作業ノードが完了したタスクの結果をレビューDBに反映し、キュー上をマージ済みにする (司令塔)。
+    戻り値: 件数の内訳 (save_and_report 用) と、マージしたユニークIDのリスト
+    """
+    counts = {'success': 0, 'partial': 0, 'deferred': 0, 'no_reviews': 0, 'error': 0, 'new_reviews': 0}
+    merged = []
+    for unique_id, payload, result in queue.done_results():
+        known = {unique_id} if 'known' in payload else set() # apply_scrape_result は差分取得かどうかだけを見る
+        status, _, new_reviews = apply_scrape_result(
+            (unique_id, payload['data'], result['reviews'], result['error'], result['resume_page']), existing_data, known)
+        counts[status] += 1
+        counts['new_reviews'] += new_reviews
+        merged.append(unique_id)
+    return counts, merged
+
+def apply_scrape_result(result, existing_data, known):
+    """
+    1軒分の結果をレビューDB (existing_data) に反映する。変更したホテルのシャードだけが書き込まれる。
+    途中で失敗したホテルは取得できた分をマージし、再開ページ (resume_page) 付きで保存する。
+    戻り値: (状態 'success' / 'partial' / 'deferred' / 'no_reviews' / 'error', 保存したエントリ, 新着レビュー数)
+    """
+    unique_id, data, reviews_with_dates, error, resume_page = result
+    if error == scrape_scheduler.BUDGET_EXHAUSTED_ERROR and not reviews_with_dates:
+        return 'deferred', None, 0 # 取得前に予算切れ。保存データは変えずに次回へ持ち越す
+    if error and not reviews_with_dates:
+        return 'error', None, 0
+
+    meta = existing_data.meta(unique_id) or {}
+    resuming = bool(meta.get('resume_page'))
+    if reviews_with_dates is not None and (unique_id in known or resuming or error):
+        # 差分取得 / 部分結果 / 再開: 取得分を保存済みリストにマージ (新着0件でも鮮度は更新)
+        stored_reviews = []
+        if meta.get('review_count') and meta.get('review_format') == review_store.REVIEW_FORMAT:
+            stored_reviews = existing_data[unique_id].get('reviews', [])
+        if resuming:
+            reviews_to_store = merge_reviews(stored_reviews, reviews_with_dates) # 続きは古い側に足す
+        else:
+            reviews_to_store = merge_reviews(reviews_with_dates, stored_reviews)
+        # 再開時に取得するのは古い側のページなので新着には数えない
+        new_reviews = len(reviews_with_dates) if unique_id in known and not resuming else 0
+    elif reviews_with_dates and all(isinstance(r, dict) for r in reviews_with_dates):
+        reviews_to_store = reviews_with_dates # 日付付きリストを保存
+        new_reviews = 0
+    else:
+        return 'no_reviews', None, 0
+
+    entry = {
+        'hotel_name': data['hotel_name'],
+        'url': data['url'],
+        'source': data['source'],
+        'reviews': reviews_to_store,
+        'last_updated': datetime.now().isoformat()
+    }
+    if error: entry['resume_page'] = resume_page
+    existing_data[unique_id] = entry
+    return ('partial' if error else 'success'), entry, new_reviews
+
+def replay_journal(existing_data, todo_hotels):
+    """
+    前回強制終了した実行のジャーナルがあれば、完了済みホテルを更新対象から外す。
+    結果のシャードは反映した時点で書き込み済みのため、manifest (強制終了で書き出されていない) だけをシャードから作り直す。
+    戻り値: 復元した件数の内訳
+    """
+    records = scrape_journal.load_journal(JOURNAL_FILE)
+    if not records: return None
+
+    counts = {'success': 0, 'partial': 0, 'deferred': 0, 'no_reviews': 0, 'error': 0, 'new_reviews': 0}
+    for unique_id, record in records.items():
+        if record['status'] in ('success', 'partial'): # 成功と部分結果はシャードを信頼する
+            existing_data.refresh_meta(unique_id)
+        counts[record['status']] += 1
+        counts['new_reviews'] += record.get('new_reviews', 0)
+
+    for unique_id in scrape_journal.finished_ids(records):
+        todo_hotels.pop(unique_id, None)
+    counts['error'] = counts['partial'] = 0 # エラー・途中だったホテルは今回再取得する
+    print(f"-> 前回中断した実行のジャーナルから{counts['success'] + counts['no_reviews']}件の完了済みホテルを復元しました。")
+    return counts
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="楽天・じゃらん統合レビュー収集エンジン")
+    parser.add_argument('--mode', choices=['async', 'pool'], default=SCRAPE_MODE,
+                        help="async: asyncio+ホスト別トークンバケット / pool: 従来のmultiprocessing.Pool")
+    parser.add_argument('--full', action='store_true',
+                        help="差分取得を行わず、全ページを再取得して保存済みレビューを置き換える")
+    parser.add_argument('--time-budget', type=float, default=None, metavar='SECONDS',
+                        help="この秒数を過ぎたら新しいページの取得をやめ、残りを次回へ持ち越す")
+    parser.add_argument('--request-budget', type=int, default=None, metavar='N',
+                        help="送るリクエスト数の上限。使い切ったら残りを次回へ持ち越す")
+    parser.add_argument('--queue', choices=['publish', 'work', 'merge'], default=None,
+                        help="複数ノードで分担する場合の役割。publish: 更新対象を共有キューに登録 / "
+                             "work: キューから借りて取得 (何台でも可) / merge: 完了分をレビューDBに反映")
+    parser.add_argument('--queue-dsn', default=WORK_QUEUE_DSN,
+                        help="共有キューの接続先 (sqlite:///パス または postgresql://...)")
+    parser.add_argument('--node-id', default=work_queue.default_node_id(),
+                        help="作業ノードの識別子 (既定: ホスト名-プロセスID)")
+    return parser.parse_args(argv)
+
+def make_budget(args):
+    """--time-budget / --request-budget から実行予算を作る (指定なしなら None)"""
+    if not (args.time_budget or args.request_budget): return None
+    budget = scrape_scheduler.ScrapeBudget(args.time_budget, args.request_budget)
+    print(f"-> 実行予算: {budget.describe()} (期待新着数の多いホテルから取得し、残りは次回へ持ち越します)")
+    return budget
+
+def main(argv=None):
     """
     【司令塔】楽天とじゃらんのデータを統合し、並列処理でレビューを取得する。
     """
-    existing_data = load_existing_data(DATA_FILE)
+    args = parse_args(argv)
+    if args.queue == 'work':
+        # [NEW] 作業ノードはレビューDBもマスターリストも読まない (キューのタスクに必要な情報が入っている)
+        queue = work_queue.WorkQueue(args.queue_dsn)
+        worker_counts = run_queue_worker(queue, args.node_id, make_budget(args))
+        print(f"\n作業ノード {args.node_id} の処理が完了: 完了{worker_counts['completed']}件, "
+              f"返却{worker_counts['released']}件, 破棄{worker_counts['lost']}件")
+        return
+
+    existing_data = review_store.open_store(STORE_DIR, DATA_FILE)
+    if args.queue == 'merge':
+        queue = work_queue.WorkQueue(args.queue_dsn)
+        counts, merged = merge_queue_results(queue, existing_data)
+        if save_and_report(existing_data, counts): queue.mark_merged(merged)
+        print(f"共有キューの状態: {queue.status_counts()}")
+        return
+
     target_hotels = load_target_hotels(RAKUTEN_MASTER_FILE, JALAN_MASTER_FILE)
 
     if not target_hotels: return
 
     todo_hotels = determine_scrape_targets(target_hotels, existing_data)
+    # キューに登録するだけの場合、前回のジャーナルは次の単独実行に残しておく
+    resumed_counts = replay_journal(existing_data, todo_hotels) if args.queue != 'publish' else None
 
     if not todo_hotels:
+        if resumed_counts:
+            save_and_report(existing_data, resumed_counts)
+            return
         print("更新対象のホテルはありません。処理を終了します。")
         return
 
-    manager = Manager()
-    rate_limiter = manager.dict({'lock': manager.Lock(), 'last_call': time.monotonic()})
-    tasks = [(uid, data, rate_limiter) for uid, data in todo_hotels.items()]
-
-    print(f"\n{MAX_WORKERS}並列でスクレイピングを開始します ({len(tasks)}件)...")
-
-    # [追加] Windows環境でのmultiprocessing問題を回避するためのおまじない
-    freeze_support()
-
-    with Pool(processes=MAX_WORKERS) as pool:
-        results = pool.map(scrape_hotel_reviews_worker, tasks)
-
-    print("\n全ワーカーの処理が完了。結果を集約します...")
-
-    success_count = 0
-    no_review_count = 0
-    error_count = 0
-    for unique_id, data, reviews_with_dates, error in results:
-        if error:
+    known = {}
+    if DELTA_MODE and not args.full:
+        known = build_known_fingerprints(todo_hotels, existing_data)
+        print(f"-> うち{len(known)}件は差分取得 (既知レビューに到達した時点で巡回終了) を行います。")
+
+    # [NEW] 前回途中で失敗したホテルは、保存済みの再開ページから続きを取得する
+    resume_pages = {}
+    for unique_id in todo_hotels:
+        meta = existing_data.meta(unique_id)
+        if meta and meta.get('resume_page'): resume_pages[unique_id] = meta['resume_page']
+    if resume_pages:
+        print(f"-> うち{len(resume_pages)}件は前回失敗したページから続きを取得します。")
+
+    # [NEW] 期待新着数の多い順に並べ、予算内で価値の高いホテルから取得する
+    todo_hotels = scrape_scheduler.rank_targets(todo_hotels, existing_data)
+    if args.queue == 'publish':
+        published = publish_queue(work_queue.WorkQueue(args.queue_dsn), todo_hotels, known, resume_pages)
+        print(f"-> {published}件を共有キューに登録しました (処理中・未マージの{len(todo_hotels) - published}件は据え置き)。")
+        return
+    budget = make_budget(args)
+
+    counts = resumed_counts or {'success': 0, 'partial': 0, 'deferred': 0, 'no_reviews': 0, 'error': 0, 'new_reviews': 0}
+
+    def on_result(result):
+        """1軒分の結果を反映し、すぐにジャーナルへ追記する"""
+        unique_id, data, reviews_with_dates, error, resume_page = result
+        status, _, new_reviews = apply_scrape_result(result, existing_data, known)
+        if status == 'deferred':
+            counts['deferred'] += 1 # 未着手のまま持ち越し (ジャーナルには書かない)
+            return
+        if status == 'error':
             print(f"  [エラー] {data['hotel_name']} ({data['source']}): {error}")
-            error_count += 1
-        elif reviews_with_dates and all(isinstance(r, dict) for r in reviews_with_dates):
-            existing_data[unique_id] = {
-                'hotel_name': data['hotel_name'],
-                'url': data['url'],
-                'source': data['source'],
-                'reviews': reviews_with_dates, # 日付付きリストを保存
-                'last_updated': datetime.now().isoformat()
-            }
-            success_count += 1
-        else:
+        elif status == 'partial':
+            print(f"  [途中保存] {data['hotel_name']} ({data['source']}): {len(reviews_with_dates)}件を保存、"
+                  f"次回はページ{resume_page}から再開します。({error})")
+        elif status == 'no_reviews':
             print(f"  [警告] {data['hotel_name']} ({data['source']}): レビューが見つからずスキップ。")
-            no_review_count += 1
-
+        counts[status] += 1
+        counts['new_reviews'] += new_reviews
+        scrape_journal.append_record(JOURNAL_FILE, unique_id, status, new_reviews)
+
+    if args.mode == 'pool':
+        print(f"\n{MAX_WORKERS}並列でスクレイピングを開始します ({len(todo_hotels)}件)...")
+        run_pool_scrape(todo_hotels, on_result, known, resume_pages, budget)
+    else:
+        print(f"\nasyncモードでスクレイピングを開始します ({len(todo_hotels)}件, 作業員{ASYNC_PAGE_WORKERS}, "
+              f"同時通信は最大{min(ASYNC_PAGE_WORKERS, ASYNC_FETCH_THREADS)}ページ)...")
+        asyncio.run(run_async_scrape(todo_hotels, on_result, known, resume_pages, budget))
+
+    print("\n全ワーカーの処理が完了。")
+    save_and_report(existing_data, counts)
+
+def save_and_report(existing_data, counts):
+    """レビューDBの manifest を書き出し、成功したらジャーナルを片付けて結果を表示する。書き出せたら True。"""
     try:
-        with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-            json.dump(existing_data, f, ensure_ascii=False, indent=2)
+        # シャードは結果を受け取った時点で書き込み済み。ここでは manifest だけを置き換える
+        existing_data.flush()
+        scrape_journal.clear_journal(JOURNAL_FILE)
         print("\n" + "="*40); print("処理完了。")
-        print(f"  - 成功 (データ更新): {success_count}件")
-        print(f"  - 警告 (レビュー無し): {no_review_count}件")
-        print(f"  - エラー: {error_count}件")
-        print(f"最新データが {OUTPUT_FILE} に保存されました。"); print("="*40)
+        print(f"  - 成功 (データ更新): {counts['success']}件 (差分取得の新着レビュー: {counts['new_reviews']}件)")
+        print(f"  - 途中保存 (次回再開): {counts.get('partial', 0)}件")
+        if counts.get('deferred'):
+            print(f"  - 予算切れで次回へ持ち越し: {counts['deferred']}件")
+        print(f"  - 警告 (レビュー無し): {counts['no_reviews']}件")
+        print(f"  - エラー: {counts['error']}件")
+        print(f"最新データが {STORE_DIR} に保存されました。")
+        http_cache.print_stats(); http_cache.prune(); print("="*40)
+        return True
     except IOError as e:
         print(f"エラー: ファイルの書き込みに失敗しました。 {e}")
+        return False
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,200 @@
+import gzip
+import json
+import os
+from datetime import date
+
+# --- 設定項目 ---
+STORE_DIR = '../data/processed/review_store'                # srcフォルダからの相対パス
+LEGACY_DATA_FILE = '../data/processed/hotel_review_data.json' # 旧形式 (単一JSON) のレビューDB
+SCHEMA_VERSION = 3                   # 2: manifest に review_format を追加 / 3: 投稿ペース (reviews_per_day) を追加
+REVIEW_FORMAT = 2                    # 現行のレビュー形式 ({"date": "YYYY-MM-DD", "text": ...})
+REVIEW_RATE_WINDOW_DAYS = 365        # 投稿ペースを計算する直近の期間（日）
+REVIEW_RATE_MIN_SPAN_DAYS = 30       # 投稿歴が短いホテルでもこの日数以上で割る (ペースの過大評価を防ぐ)
+
+
+def has_old_review_format(reviews_data, source):
+    """レビュー形式が古いか、日付が取れていないレビューを含むかを判定する"""
+    # [修正] レビュー形式が古いか、日付がNoneかチェック
+    return any(
+        isinstance(r, str) or
+        (isinstance(r, dict) and r.get('date') is None and source == 'jalan') or # Jalanで日付がNoneなら更新対象
+        (isinstance(r, dict) and 'date' not in r) # dateキー自体がない
+        for r in reviews_data
+    )
+
+
+def review_rate(reviews_data, today=None):
+    """
+    保存済みレビューの投稿日から、直近の投稿ペース (件/日) と最新の投稿日を返す。
+    戻り値: (件/日, 最新投稿日 "YYYY-MM-DD" / 日付付きレビューが無ければ None)
+    """
+    today = today or date.today()
+    dates = []
+    for r in reviews_data:
+        if not isinstance(r, dict) or not r.get('date'): continue
+        try:
+            dates.append(date.fromisoformat(r['date']))
+        except ValueError:
+            continue
+    if not dates: return 0.0, None
+
+    recent = [d for d in dates if (today - d).days <= REVIEW_RATE_WINDOW_DAYS]
+    span_days = min(REVIEW_RATE_WINDOW_DAYS, max(REVIEW_RATE_MIN_SPAN_DAYS, (today - min(dates)).days))
+    return len(recent) / span_days, max(dates).isoformat()
+
+
+class ReviewStore:
+    """
+    ホテル (unique_id) ごとに圧縮シャードを1つ持つレビューDB。
+    manifest.json にホテル名・ソース・最終更新日・レビュー件数・スキーマ版を保持し、
+    辞書と同じ書き方 (store[uid], store[uid] = entry, uid in store) で読み書きできる。
+    読み書きするのは触ったシャードだけで、manifest は flush() でまとめて書き出す。
+    """
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        self.shard_dir = os.path.join(store_dir, 'shards')
+        self.manifest_path = os.path.join(store_dir, 'manifest.json')
+        self.manifest = self._load_manifest()
+        self._dirty = False
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {'schema_version': SCHEMA_VERSION, 'hotels': {}}
+
+    def _shard_path(self, unique_id):
+        return os.path.join(self.shard_dir, f"{unique_id}.json.gz")
+
+    @property
+    def hotels(self):
+        """unique_id -> manifest のメタデータ"""
+        return self.manifest['hotels']
+
+    def __contains__(self, unique_id):
+        return unique_id in self.hotels
+
+    def __len__(self):
+        return len(self.hotels)
+
+    def __iter__(self):
+        return iter(list(self.hotels))
+
+    def __getitem__(self, unique_id):
+        if unique_id not in self.hotels: raise KeyError(unique_id)
+        with gzip.open(self._shard_path(unique_id), 'rt', encoding='utf-8') as f:
+            return json.load(f)
+
+    def get(self, unique_id, default=None):
+        try:
+            return self[unique_id]
+        except (KeyError, FileNotFoundError):
+            return default
+
+    def __setitem__(self, unique_id, entry):
+        os.makedirs(self.shard_dir, exist_ok=True)
+        path = self._shard_path(unique_id)
+        tmp_path = path + '.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self.hotels[unique_id] = self.build_meta(entry)
+        self._dirty = True
+
+    def build_meta(self, entry):
+        """
+        シャードの内容から manifest 用のメタデータを作る。
+        レビュー形式の判定は書き込み時に1回だけ行い、更新対象の抽出は manifest だけで済ませる。
+        """
+        reviews = entry.get('reviews', [])
+        is_old_format = has_old_review_format(reviews, entry.get('source'))
+        reviews_per_day, newest_review_date = review_rate(reviews)
+        return {
+            'hotel_name': entry.get('hotel_name'),
+            'source': entry.get('source'),
+            'url': entry.get('url'),
+            'last_updated': entry.get('last_updated'),
+            'review_count': len(reviews),
+            'review_format': 1 if is_old_format else REVIEW_FORMAT,
+            'resume_page': entry.get('resume_page'), # 途中で失敗したホテルの再開ページ (完了済みは None)
+            'reviews_per_day': round(reviews_per_day, 4), # 更新の優先度付けに使う直近の投稿ペース
+            'newest_review_date': newest_review_date,
+            'schema_version': SCHEMA_VERSION,
+        }
+
+    def meta(self, unique_id):
+        return self.hotels.get(unique_id)
+
+    def refresh_meta(self, unique_id):
+        """
+        シャードを読み直して manifest のメタデータを作り直す (manifest を書き出す前に強制終了した場合の復元用)。
+        manifest に無いホテルでもシャードがあれば登録する。シャードが無ければ False。
+        """
+        try:
+            with gzip.open(self._shard_path(unique_id), 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, EOFError, json.JSONDecodeError):
+            return False
+        self.hotels[unique_id] = self.build_meta(entry)
+        self._dirty = True
+        return True
+
+    def items(self):
+        """(unique_id, エントリ) を1件ずつ読み出す (全件を同時にメモリに載せない)"""
+        for unique_id in self:
+            entry = self.get(unique_id)
+            if entry is not None:
+                yield unique_id, entry
+
+    def flush(self):
+        """変更があれば manifest を書き出す (一時ファイル経由で置き換え)"""
+        if not self._dirty: return
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+        self._dirty = False
+
+    def upgrade_manifest(self):
+        """
+        古いスキーマの manifest を現行版に上げる (該当ホテルのシャードを1回だけ読み直す)。
+        戻り値: 更新したホテル数
+        """
+        stale_ids = [uid for uid, meta in self.hotels.items() if meta.get('schema_version') != SCHEMA_VERSION]
+        for unique_id in stale_ids:
+            entry = self.get(unique_id)
+            if entry is None: continue
+            self.hotels[unique_id] = self.build_meta(entry)
+            self._dirty = True
+        self.manifest['schema_version'] = SCHEMA_VERSION
+        self.flush()
+        return len(stale_ids)
+
+    def import_legacy(self, legacy_path):
+        """旧形式の単一JSON (hotel_review_data.json) を取り込む。取り込んだ件数を返す。"""
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                legacy_data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return 0
+        for unique_id, entry in legacy_data.items():
+            self[unique_id] = entry
+        self.flush()
+        return len(legacy_data)
+
+
+def open_store(store_dir=STORE_DIR, legacy_path=LEGACY_DATA_FILE):
+    """
+    レビューDBを開く。まだ空で旧形式のJSONがあれば、初回のみ移行する。
+    """
+    store = ReviewStore(store_dir)
+    if len(store) == 0 and legacy_path and os.path.exists(legacy_path):
+        imported = store.import_legacy(legacy_path)
+        print(f"旧形式のレビューDB ({legacy_path}) から {imported}件をシャード形式に移行しました。")
+    elif store.manifest.get('schema_version') != SCHEMA_VERSION:
+        upgraded = store.upgrade_manifest()
+        print(f"レビューDBの manifest を v{SCHEMA_VERSION} に更新しました ({upgraded}件)。")
+    return store
@@ -0,0 +1,143 @@
+from datetime import date
+
+import numpy as np
+
+# --- 設定項目 ---
+HISTORY_MONTHS = 24                  # スコア推移を出す月数 (今月を含む)
+HISTORY_WINDOW_MONTHS = 12           # 推移の各点で集計する直近の月数 (ローリング期間)
+NO_DAY = 0                           # 日付が不正なレビューの日番号 (date.toordinal は1以上なので、どの期間にも入らない)
+
+
+def mask_dtype(category_count):
+    """カテゴリ数が収まる最小のビットマスクの型 (通常は uint16)"""
+    for dtype in (np.uint16, np.uint32, np.uint64):
+        if category_count <= np.iinfo(dtype).bits: return dtype
+    raise ValueError(f"カテゴリが多すぎます ({category_count}件, 上限64件)")
+
+
+class ReviewTable:
+    """
+    全ホテル (グループ) のレビューを列ごとの配列で持つ表。
+    hotel: ホテル番号 (int32), day: 投稿日の日番号 (int32), mask: カテゴリのビットマスク (uint16)。
+    期間別スコアとスコア推移を、ホテルごとのループ無しで NumPy でまとめて計算する。
+    """
+
+    def __init__(self, keys, hotel, day, mask, matcher):
+        self.keys = keys # ホテル番号 -> キー
+        self.hotel, self.day, self.mask = hotel, day, mask
+        self.matcher = matcher
+
+    @classmethod
+    def from_masks(cls, hotel_masks, matcher):
+        """
+        hotel_masks: キー -> [(ビットマスクのリスト, 日番号のリスト), ...] (名寄せしたグループならメンバーごと)。
+        日番号の None は不正な日付。
+        """
+        keys = list(hotel_masks)
+        sizes = [sum(len(masks) for masks, _ in parts) for parts in hotel_masks.values()]
+        hotel = np.repeat(np.arange(len(keys), dtype=np.int32), sizes)
+        day = np.fromiter((NO_DAY if d is None else d for parts in hotel_masks.values() for _, days in parts for d in days),
+                          dtype=np.int32, count=sum(sizes))
+        mask = np.fromiter((m for parts in hotel_masks.values() for masks, _ in parts for m in masks),
+                           dtype=mask_dtype(len(matcher.categories)), count=sum(sizes))
+        return cls(keys, hotel, day, mask, matcher)
+
+    def __len__(self):
+        return len(self.hotel)
+
+    def category_hits(self, bucket, bucket_count):
+        """
+        bucket (行ごとの集計先の番号、-1 は集計しない) ごとの (レビュー件数, カテゴリ別ヒット数) を数える。
+        戻り値: (bucket_count,) と (bucket_count, カテゴリ数) の int64 配列
+        """
+        selected = bucket >= 0
+        bucket, mask = bucket[selected], self.mask[selected]
+        totals = np.bincount(bucket, minlength=bucket_count).astype(np.int64)
+        hits = np.empty((bucket_count, len(self.matcher.categories)), dtype=np.int64)
+        for bit in range(len(self.matcher.categories)):
+            hits[:, bit] = np.bincount(bucket, weights=(mask >> bit) & 1, minlength=bucket_count)
+        return totals, hits
+
+    def window_counts(self, cutoff):
+        """直近の期間 (cutoff 以降の日番号、None は全期間) のホテルごとの件数とヒット数"""
+        bucket = self.hotel if cutoff is None else np.where(self.day >= cutoff, self.hotel, -1)
+        return self.category_hits(bucket, len(self.keys))
+
+    def scores(self, cutoff, score_mapping, fatal_risks, wow_factors):
+        """ホテルごとの calculate_score と同じタプルのリスト (キーの並び)"""
+        totals, hits = self.window_counts(cutoff)
+        columns = score_columns(totals, hits, self.matcher, score_mapping)
+        return [score_tuple(i, totals, hits, columns, self.matcher, fatal_risks, wow_factors) for i in range(len(self.keys))]
+
+    def monthly_history(self, score_mapping, today=None, months=HISTORY_MONTHS, window_months=HISTORY_WINDOW_MONTHS):
+        """
+        月ごとのローリングスコア (各月末までの直近 window_months か月) を累積和で計算する。
+        戻り値: (['YYYY-MM', ...], スコアの配列 (ホテル数, 月数, 丸め前), レビュー件数の配列 (ホテル数, 月数))
+        """
+        today = today or date.today()
+        last_month = today.year * 12 + today.month - 1
+        first_month = last_month - (months - 1) - (window_months - 1) # 最初の点の集計に必要な最古の月
+        span = last_month - first_month + 1
+
+        review_months = month_index(self.day)
+        offset = review_months - first_month
+        in_range = (self.day != NO_DAY) & (offset >= 0) & (offset < span)
+        bucket = np.where(in_range, self.hotel.astype(np.int64) * span + offset, -1)
+        totals, hits = self.category_hits(bucket, len(self.keys) * span)
+
+        # 月方向の累積和の差で、各月の直近 window_months か月分を求める
+        totals = rolling_sum(totals.reshape(len(self.keys), span), window_months)[:, -months:]
+        hits = rolling_sum(hits.reshape(len(self.keys), span, len(self.matcher.categories)), window_months)[:, -months:]
+        columns = score_columns(totals, hits, self.matcher, score_mapping)
+        return month_labels(today, months), columns['score'], totals
+
+
+def month_labels(today, months=HISTORY_MONTHS):
+    """スコア推移の各点の月 ('YYYY-MM'、今月まで months か月分)"""
+    last_month = today.year * 12 + today.month - 1
+    return [f"{m // 12}-{m % 12 + 1:02d}" for m in range(last_month - months + 1, last_month + 1)]
+
+
+def month_index(day):
+    """日番号の配列 -> 年*12+月-1 の配列"""
+    days_since_epoch = day.astype(np.int64) - date(1970, 1, 1).toordinal()
+    return days_since_epoch.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64) + 1970 * 12
+
+
+def rolling_sum(values, window):
+    """軸1 (月) の方向に直近 window 個の和をとる (累積和の差)"""
+    cumulative = np.cumsum(values, axis=1)
+    rolled = cumulative.copy()
+    rolled[:, window:] -= cumulative[:, :-window]
+    return rolled
+
+
+def score_columns(totals, hits, matcher, score_mapping):
+    """
+    件数とヒット数の配列から、リスク/加点ポイント・割合・スコアをまとめて計算する (score_from_counts と同じ式)。
+    ヒット数の最後の軸がカテゴリ。件数が0の要素のスコアは 50.0。
+    """
+    risk_weights = np.array([abs(score_mapping[c]) if is_risk else 0 for c, is_risk in zip(matcher.categories, matcher.is_risk)])
+    wow_weights = np.array([0 if is_risk else score_mapping[c] for c, is_risk in zip(matcher.categories, matcher.is_risk)])
+    risk_points = (hits * risk_weights).sum(axis=-1)
+    wow_points = (hits * wow_weights).sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        risk_rate = np.where(totals > 0, risk_points / totals, 0.0)
+        wow_rate = np.where(totals > 0, wow_points / totals, 0.0)
+    score = np.where(totals > 0, 50 - (risk_rate * 10) + (wow_rate * 10), 50.0)
+    return {'risk_points': risk_points, 'wow_points': wow_points, 'risk_rate': risk_rate, 'wow_rate': wow_rate, 'score': score}
+
+
+def score_tuple(i, totals, hits, columns, matcher, fatal_risks, wow_factors):
+    """i 番目のホテルの calculate_score と同じタプル (丸めは Python の round で行い、逐次計算と一致させる)"""
+    total = int(totals[i])
+    if total == 0:
+        return 50.0, 0, {}, {}, 0.0, 0.0, 0, 0
+    risk_counts = {category: 0 for category in fatal_risks.keys()}
+    wow_counts = {category: 0 for category in wow_factors.keys()}
+    for category, is_risk, count in zip(matcher.categories, matcher.is_risk, hits[i].tolist()):
+        if is_risk: risk_counts[category] += count
+        else: wow_counts[category] += count
+    return (round(float(columns['score'][i]), 1), total, risk_counts, wow_counts,
+            round(float(columns['risk_rate'][i]), 3), round(float(columns['wow_rate'][i]), 3),
+            columns['risk_points'][i].item(), columns['wow_points'][i].item())
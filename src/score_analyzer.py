@@ -1,93 +1,82 @@
+import argparse
+import gzip
+import hashlib
 import json
+import math
+import os
 import yaml
-import mojimoji  # 半角/全角変換ライブラリ
-import re       # 正規表現ライブラリ
 from datetime import datetime, timedelta
+from functools import lru_cache
+from multiprocessing import Pool
+
+try:
+    import entity_resolver
+    import keyword_matcher
+    import match_cache
+    import name_normalizer
+    import review_store
+    import review_table
+except ImportError:
+    from src import entity_resolver, keyword_matcher, match_cache, name_normalizer, review_store, review_table
 
 # --- ファイル設定 ---
-INPUT_FILE = "../data/processed/hotel_review_data.json"
+STORE_DIR = review_store.STORE_DIR   # レビューDB (ホテルごとのシャード + manifest)
+INPUT_FILE = "../data/processed/hotel_review_data.json" # 旧形式。レビューDBが空なら一度だけ取り込む
 OUTPUT_FILE = "../data/output/analysis_results.json"
 CONFIG_FILE = "../config/config.yml"
+NAME_CACHE_FILE = name_normalizer.NAME_CACHE_FILE # [NEW] ホテル名の正規化結果のキャッシュ (None で無効)
+MATCH_CACHE_FILE = match_cache.MATCH_CACHE_FILE # [NEW] レビューごとの照合結果のキャッシュ (None で無効)
+STATE_FILE = "../data/processed/analysis_state.json.gz" # [NEW] 差分分析用の状態 (ホテルごとのビットマスクと日番号、グループごとの結果)
+STATE_VERSION = 2                    # 2: gzip の JSON Lines (ヘッダ行 + ホテル・グループごとの行)。ストリーミング分析で順に読み書きする
+ENTITY_MAP_FILE = entity_resolver.MAPPING_FILE # [NEW] 名寄せ結果の対応表 (None で保存しない)
+FUZZY_GROUPING = True                # [NEW] 正規化名の完全一致に加えて、表記ゆれ (n-gram の類似度) でも名寄せする
+HISTORY_FILE = "../data/output/score_history.json" # [NEW] グループごとの月次ローリングスコアの推移 (None で出力しない)
 
-# --- [正規化用] 除去する接頭辞/接尾辞のパターン (最終版) ---
-PREFIX_SUFFIX_PATTERNS = [
-    # 具体的なフレーズ
-    r'^那須高原ペットと泊まれる宿', r'那須高原ペットと泊まれる宿$',
-    r'^ペットと泊まれる宿', r'ペットと泊まれる宿$',
-    r'^犬と遊べるペンション', r'犬と遊べるペンション$',
-    r'^那須温泉', r'那須温泉$',
-    # 一般的な単語
-    r'^ホテル', r'ホテル$',
-    r'^ぺんしょん', r'ぺんしょん$', r'^ペンション', r'ペンション$',
-    r'^旅館', r'旅館$',
-    r'^温泉', r'温泉$',
-    r'^高原', r'高原$',
-    r'^の宿', r'の宿$',
-    r'^ｉｎｎ', r'ｉｎｎ$', r'^イン', r'イン$',
-    r'^りぞーと', r'りぞーと$', r'^リゾート', r'リゾート$'
-]
-PREFIX_SUFFIX_REGEX = re.compile(r'|'.join(PREFIX_SUFFIX_PATTERNS))
-
-def normalize_name(name):
-    """
-    【v3.2 Final Fix】ホテル名を正規化（すっぴん化）する関数。
-    バグ修正: 記号除去を強化。
-    """
-    if not name: return ""
-    
-    normalized = mojimoji.han_to_zen(name, kana=True, ascii=True, digit=True).lower()
-    normalized = re.sub(r'[（\(][^（）()]*[）\)]', '', normalized)
-    
-    # --- [修正] 記号除去リストにハイフンと両方のアポストロフィを追加 ---
-    symbols_to_remove = '・＆～★＊！？／♪☆　・＆~★*!?/♪☆-' # 長音符 'ー' は除去しない
-    symbols_to_remove += ' '  # 半角スペース
-    symbols_to_remove += '’' # 特殊アポストロフィ
-    symbols_to_remove += '\'' # 通常アポストロフィ
-    symbols_to_remove += '-'  # ハイフン
-    normalized = ''.join(c for c in normalized if c not in symbols_to_remove)
-    # -----------------------------------------------------------------
-    
-    # [修正] 空白除去を先に実行
-    normalized = re.sub(r'\s+', '', normalized) 
-    
-    for _ in range(3): 
-        prev_normalized = normalized
-        normalized = PREFIX_SUFFIX_REGEX.sub('', normalized)
-        if normalized == prev_normalized: break
-    
-    # [修正] カタカナは全角のまま、英数のみ半角に戻す
-    normalized = mojimoji.zen_to_han(normalized, ascii=True, digit=True, kana=False) 
+# --- [NEW] 並列スコア計算 ---
+SCORE_WORKERS = 1                    # スコア計算のプロセス数 (1 は逐次。--workers で上書き)
+PARALLEL_PIECE_REVIEWS = 5000        # これより多いレビューを持つホテルは、この件数ずつに分けて別々のプロセスで照合する
+CHUNKS_PER_WORKER = 4                # 1プロセスあたりのチャンク数 (多いほど処理の偏りを後から吸収しやすい)
+
+# --- [NEW] 集計期間 (config.yml の score_windows が無い場合の既定値) ---
+# 名前 -> 日数 (None は全期間)。結果のキーは anshin_score_<名前> / total_reviews_<名前> など
+DEFAULT_SCORE_WINDOWS = {'alltime': None, '1year': 365}
 
-    return normalized
+# --- [変更] ホテル名の正規化は name_normalizer に移動 (変換表での一括処理と、正規化結果のキャッシュ) ---
+normalize_name = name_normalizer.normalize_name
 
-def calculate_score(reviews_list, score_mapping, fatal_risks, wow_factors):
+def calculate_score(reviews_list, score_mapping, fatal_risks, wow_factors, matcher=None):
     """
     与えられたレビューリストからv0.4スコアを計算する関数。
+    [変更] キーワード照合は KeywordMatcher で1レビュー1回にまとめる (matcher は main で一度だけコンパイルして渡す)。
     """
     total_reviews = len(reviews_list)
     if total_reviews == 0:
         return 50.0, 0, {}, {}, 0.0, 0.0, 0, 0 # score, total_reviews, risk_counts, wow_counts, risk_rate, wow_rate, risk_points, wow_points
 
-    risk_counts = {category: 0 for category in fatal_risks.keys()}
-    wow_counts = {category: 0 for category in wow_factors.keys()}
-    all_categories = {**fatal_risks, **wow_factors}
+    if matcher is None: matcher = keyword_matcher.KeywordMatcher(score_mapping, fatal_risks, wow_factors)
 
+    # 1レビューにつき、各カテゴリは最初の1ヒットだけを数える (ビットマスクなので重複しない)
+    hit_counts = [0] * len(matcher.categories)
     for review_entry in reviews_list:
         review_text = review_entry.get("text", "")
         if not review_text: continue
+        for bit in matcher.bits(matcher.match(review_text)): hit_counts[bit] += 1
+    return score_from_counts(total_reviews, hit_counts, matcher, score_mapping, fatal_risks, wow_factors)
 
-        found_categories_in_this_review = set()
-        for category, keywords in all_categories.items():
-            if category in found_categories_in_this_review: continue
-            for keyword in keywords:
-                if keyword in review_text:
-                    score_value = score_mapping.get(category)
-                    if score_value is None: continue 
-
-                    if category in risk_counts: risk_counts[category] += 1
-                    elif category in wow_counts: wow_counts[category] += 1
-                    found_categories_in_this_review.add(category)
-                    break
+
+def score_from_counts(total_reviews, hit_counts, matcher, score_mapping, fatal_risks, wow_factors):
+    """
+    レビュー件数とカテゴリごとのヒット数 (matcher.categories の順) からスコアを計算する。
+    戻り値は calculate_score と同じ。
+    """
+    if total_reviews == 0:
+        return 50.0, 0, {}, {}, 0.0, 0.0, 0, 0
+
+    risk_counts = {category: 0 for category in fatal_risks.keys()}
+    wow_counts = {category: 0 for category in wow_factors.keys()}
+    for category, is_risk, count in zip(matcher.categories, matcher.is_risk, hit_counts):
+        if is_risk: risk_counts[category] += count
+        else: wow_counts[category] += count
 
     total_risk_points = sum(risk_counts[cat] * abs(score_mapping.get(cat, 0)) for cat in fatal_risks if score_mapping.get(cat) is not None)
     total_wow_points = sum(wow_counts[cat] * score_mapping.get(cat, 0) for cat in wow_factors if score_mapping.get(cat) is not None)
@@ -99,11 +88,523 @@ def calculate_score(reviews_list, score_mapping, fatal_risks, wow_factors):
     return round(final_score, 1), total_reviews, risk_counts, wow_counts, round(risk_rate, 3), round(wow_rate, 3), total_risk_points, total_wow_points
 
 
-def main():
+@lru_cache(maxsize=None)
+def review_day(date_str):
+    """投稿日 ('YYYY-MM-DD') を日番号 (date.toordinal) に変換する。不正なら None。同じ日付は使い回す。"""
+    try:
+        return datetime.strptime(date_str, '%Y-%m-%d').toordinal()
+    except (ValueError, TypeError):
+        return None
+
+
+def window_cutoff_day(now, days):
+    """
+    直近 days 日の集計に含める最初の日番号 (None は全期間)。
+    投稿日 (0時) >= now - days 日 となる最初の日。
+    """
+    if days is None: return None
+    cutoff = now - timedelta(days=days)
+    return cutoff.toordinal() + (0 if cutoff.time() == datetime.min.time() else 1)
+
+
+def match_reviews(reviews, matcher, cache=None):
+    """
+    [NEW] レビューごとに本文を1回だけ照合し、(カテゴリのビットマスク, 日番号) のリストにする。
+    以降の期間別集計はこのリストだけで行い、本文は読み直さない。
+    cache (MatchCache) を渡すと、前回までに照合済みの本文は照合しない。
+    """
+    if cache is not None:
+        masks = cache.match_texts([review.get('text') for review in reviews])
+        return [(mask, review_day(review.get('date'))) for mask, review in zip(masks, reviews)]
+    return [(matcher.match(review['text']) if review.get('text') else 0, review_day(review.get('date')))
+            for review in reviews]
+
+
+def score_windows(review_masks, windows, matcher, score_mapping, fatal_risks, wow_factors, now=None):
+    """
+    [NEW] (ビットマスク, 日番号) のリストから、全ての集計期間のスコアを一度に計算する。
+    windows: 名前 -> 日数 (None は全期間)。日付が不正なレビューは全期間にだけ含める。
+    戻り値: 名前 -> calculate_score と同じタプル
+    """
+    now = now or datetime.now()
+    cutoffs = [window_cutoff_day(now, days) for days in windows.values()]
+    totals, hits = window_counts(review_masks, cutoffs, matcher)
+    return {name: score_from_counts(totals[i], hits[i], matcher, score_mapping, fatal_risks, wow_factors)
+            for i, name in enumerate(windows)}
+
+
+def window_counts(review_masks, cutoffs, matcher):
+    """
+    [NEW] (ビットマスク, 日番号) のリストを集計期間ごとに数える。cutoffs は window_cutoff_day の並び。
+    戻り値: (期間ごとのレビュー件数, 期間ごとのカテゴリ別ヒット数)。レビューを分けて数えた結果は足し合わせられる。
+    """
+    totals = [0] * len(cutoffs)
+    hits = [[0] * len(matcher.categories) for _ in cutoffs]
+    for mask, day in review_masks:
+        bits = matcher.bits(mask)
+        for i, cutoff in enumerate(cutoffs):
+            if cutoff is not None and (day is None or day < cutoff): continue
+            totals[i] += 1
+            window_hits = hits[i]
+            for bit in bits: window_hits[bit] += 1
+    return totals, hits
+
+
+def window_result(results, sources):
+    """期間別のスコアを analysis_results.json の1ホテル分のキーに展開する (従来のキーの並びを保つ)"""
+    entry = {f"anshin_score_{name}": result[0] for name, result in results.items()}
+    entry.update({f"total_reviews_{name}": result[1] for name, result in results.items()})
+    entry["sources"] = sources
+    for name, (_, _, _, _, risk_rate, wow_rate, risk_points, wow_points) in results.items():
+        entry[f"risk_details_{name}"] = {"total_risk_points": risk_points, "risk_rate": risk_rate}
+        entry[f"wow_details_{name}"] = {"total_wow_points": wow_points, "wow_rate": wow_rate}
+    return entry
+
+
+def dictionary_signature(matcher):
+    """キーワード辞書の署名。変わると保存済みのビットマスクは使えない (カテゴリの並びとキーワード集合で決まる)"""
+    payload = [STATE_VERSION, matcher.categories, [match_cache.keyword_set_hash(keywords) for keywords in matcher.keyword_lists]]
+    return hashlib.sha1(json.dumps(payload, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def score_config_signature(score_mapping, windows, fatal_risks, wow_factors):
+    """スコアの重み・集計期間・加点/減点の割り当ての署名。変わるとグループの結果は作り直す (本文の照合は不要)"""
+    payload = [score_mapping, windows, sorted(fatal_risks), sorted(wow_factors)]
+    return hashlib.sha1(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class StateReader:
+    """
+    前回の分析状態 (gzip の JSON Lines) を先頭から順に読む。
+    1行目のヘッダに書き込み順のホテル一覧 (unique_id, 最終更新日) があり、以降はホテルの行
+    {'hotel', 'masks', 'days'} とグループの行 {'group', 'members', 'name', 'entry'} が続く。
+    """
+
+    def __init__(self, path):
+        self.file = gzip.open(path, 'rt', encoding='utf-8')
+        self.header = json.loads(self.file.readline())
+        self.last_updated = dict(self.header['hotels'])
+        self.position = {unique_id: i for i, (unique_id, _) in enumerate(self.header['hotels'])}
+        self._pending = None # 先読みしたホテルの行
+
+    def records(self):
+        for line in self.file:
+            yield json.loads(line)
+
+    def _next_hotel(self):
+        if self._pending is None:
+            for record in self.records():
+                if 'hotel' in record:
+                    self._pending = record
+                    break
+        return self._pending
+
+    def hotel(self, unique_id):
+        """
+        ホテルの行を順に読み進めて unique_id の {'last_updated', 'masks', 'days'} を返す (手前の行は捨てる)。
+        既に読み過ごした・行が無いホテルは None。書き込み時と同じ順に問い合わせれば、全ての行を1回ずつ読むだけで済む。
+        """
+        target = self.position.get(unique_id)
+        if target is None: return None
+        while True:
+            record = self._next_hotel()
+            if record is None or self.position[record['hotel']] > target: return None
+            self._pending = None
+            if record['hotel'] == unique_id:
+                return {'last_updated': self.last_updated[unique_id], 'masks': record['masks'], 'days': record['days']}
+
+    def read_all(self, keep):
+        """keep に含まれるホテルの状態と、全グループの結果を読み込む"""
+        hotels, groups = {}, {}
+        for record in self.records():
+            if 'group' in record:
+                groups[record.pop('group')] = record
+            elif record['hotel'] in keep:
+                hotels[record['hotel']] = {'last_updated': self.last_updated[record['hotel']], 'masks': record['masks'], 'days': record['days']}
+        return hotels, groups
+
+    def close(self):
+        self.file.close()
+
+
+def open_state(path, signature):
+    """前回の分析状態を開く。無い・壊れている・形式や辞書が変わった場合は None (全件を照合し直す)"""
+    try:
+        reader = StateReader(path)
+    except (FileNotFoundError, OSError, EOFError, json.JSONDecodeError, KeyError, TypeError):
+        return None
+    if reader.header.get('version') != STATE_VERSION or reader.header.get('signature') != signature:
+        reader.close()
+        return None
+    return reader
+
+
+class StateWriter:
+    """分析状態を1行ずつ書き出す (一時ファイルに書き、commit で置き換える)。ホテルの行はヘッダと同じ順に書く"""
+
+    def __init__(self, path, header):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path, self.tmp_path = path, path + '.tmp'
+        self.file = gzip.open(self.tmp_path, 'wt', encoding='utf-8')
+        self._write(header)
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def hotel(self, unique_id, hotel_state):
+        self._write({'hotel': unique_id, 'masks': hotel_state['masks'], 'days': hotel_state['days']})
+
+    def group(self, norm_key, group_state):
+        self._write({'group': norm_key, **group_state})
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+
+def save_state(path, header, hotel_states, group_states):
+    """全ホテル・全グループの状態をまとめて書き出す (グループごとに、メンバーの行のあとにグループの行)"""
+    order = [uid for group in group_states.values() for uid in group['members']]
+    order += [uid for uid in hotel_states if uid not in set(order)]
+    writer = StateWriter(path, {**header, 'hotels': [[uid, hotel_states[uid]['last_updated']] for uid in order]})
+    for norm_key, group in group_states.items():
+        for unique_id in group['members']: writer.hotel(unique_id, hotel_states[unique_id])
+        writer.group(norm_key, group)
+    grouped = {uid for group in group_states.values() for uid in group['members']}
+    for unique_id in hotel_states:
+        if unique_id not in grouped: writer.hotel(unique_id, hotel_states[unique_id])
+    writer.commit()
+
+
+class JsonObjectWriter:
+    """
+    [NEW] json.dump(辞書) と同じ書式で、辞書の要素を1件ずつファイルに書き出す (全体をメモリに持たない)。
+    prefix / suffix で外側の辞書の一部として書くこともできる。一時ファイルに書き、close で置き換える。
+    """
+
+    def __init__(self, path, indent=None, prefix='', suffix=''):
+        self.path, self.tmp_path = path, path + '.tmp'
+        self.indent, self.suffix = indent, suffix
+        self.file = open(self.tmp_path, 'w', encoding='utf-8')
+        self.file.write(prefix + '{')
+        self.count = 0
+
+    def write(self, key, value):
+        if self.indent is None:
+            text = json.dumps(key, ensure_ascii=False) + ': ' + json.dumps(value, ensure_ascii=False)
+            self.file.write((', ' if self.count else '') + text)
+        else:
+            text = json.dumps({key: value}, ensure_ascii=False, indent=self.indent)[2:-2] # 外側の "{\n" と "\n}" を除く
+            self.file.write((',\n' if self.count else '\n') + text)
+        self.count += 1
+
+    def close(self):
+        self.file.write(('\n}' if self.indent is not None and self.count else '}') + self.suffix)
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+
+def group_hotels(store):
+    """
+    [変更] manifest のホテル名だけで名寄せする (シャードは開かない)。
+    ホテル名はまとめて正規化し、前回までに正規化した名前は計算しない (NAME_CACHE_FILE)。
+    戻り値: 正規化名 -> [{'unique_id', 'original_name', 'source', 'normalized'}, ...] (manifest の並び順)
+    """
+    hotel_groups = {}
+    normalized_names = name_normalizer.normalize_names([meta.get('hotel_name') for meta in store.hotels.values()], NAME_CACHE_FILE)
+    for (unique_id, meta), normalized_key in zip(store.hotels.items(), normalized_names):
+        original_name = meta.get('hotel_name')
+        if not original_name or not normalized_key: continue
+        hotel_groups.setdefault(normalized_key, []).append({
+            'unique_id': unique_id,
+            'original_name': original_name,
+            'source': meta.get('source') or 'unknown',
+            'normalized': normalized_key,
+        })
+    return hotel_groups
+
+
+def merge_similar_groups(hotel_groups):
+    """
+    [NEW] 正規化名が完全一致しなくても、表記ゆれの範囲 (entity_resolver の n-gram 類似度) で
+    同じホテルとみなせるグループを統合する。統合先は先に現れたグループで、並び順は変わらない。
+    戻り値: (統合後のグループ, [(統合した正規化名, 統合先の正規化名, 類似度), ...])
     """
-    日付付きレビューデータを読み込み、全期間スコアと直近1年スコアを算出する。
+    keys = list(hotel_groups)
+    roots, merges = entity_resolver.resolve(keys, [{m['source'] for m in hotel_groups[key]} for key in keys])
+    merged = {}
+    for key, root in zip(keys, roots):
+        merged.setdefault(keys[root], []).extend(hotel_groups[key])
+    return merged, [(keys[i], keys[j], similarity) for i, j, similarity in merges]
+
+
+def hotel_review_masks(store, unique_id, matcher, cache=None):
     """
-    print(f"時間軸分析エンジン v4.0.1 (バグ修正版) を起動します...")
+    1軒分のシャードを読み、日付と本文を持つレビューを照合して {'last_updated', 'masks', 'days'} を返す。
+    シャードが読めなければ None。
+    """
+    entry = store.get(unique_id)
+    if entry is None: return None
+    valid_reviews = [r for r in entry.get('reviews', []) if isinstance(r, dict) and 'date' in r and 'text' in r]
+    review_masks = match_reviews(valid_reviews, matcher, cache)
+    return {'last_updated': store.meta(unique_id).get('last_updated'),
+            'masks': [mask for mask, _ in review_masks], 'days': [day for _, day in review_masks]}
+
+
+def representative_name(members):
+    """グループの代表名 (楽天のホテル名を優先)"""
+    rakuten_member = next((m for m in members if m['source'] == 'rakuten'), None)
+    return rakuten_member['original_name'] if rakuten_member else members[0]['original_name']
+
+
+# --- [NEW] 並列スコア計算 (グループをレビュー件数で均等なチャンクに分け、プロセスプールで数える) ---
+_worker = {}
+
+
+def _init_worker(config, store_dir, cache_path, cutoffs):
+    """ワーカーの初期化。キーワード辞書のコンパイルとレビューDB・照合キャッシュを開くのは1プロセス1回だけ"""
+    matcher = keyword_matcher.compile_config(config)
+    _worker.update(matcher=matcher, store=review_store.ReviewStore(store_dir), cutoffs=cutoffs,
+                   cache=match_cache.MatchCache(matcher, cache_path) if cache_path else None)
+
+
+def _score_chunk(pieces):
+    """
+    チャンク内の各ピースを数える。ピースは (グループ, ホテル, 番号, 分割数, ビットマスク, 日番号)。
+    ビットマスクが None のピースはシャードを読んで、分割数で等分したうちの番号番目のレビューだけを照合する。
+    戻り値: ([(グループ, ホテル, 番号, 照合したビットマスク, 日番号, 件数, ヒット数)], 照合キャッシュの統計)
+    """
+    matcher, store, cache = _worker['matcher'], _worker['store'], _worker['cache']
+    before = dict(cache.stats) if cache else {}
+    counted = []
+    for norm_key, unique_id, part, parts, masks, days in pieces:
+        matched = masks is None
+        if matched:
+            entry = store.get(unique_id)
+            if entry is None: # シャードが読めないホテルはグループから外す
+                counted.append((norm_key, unique_id, part, None, None, None, None))
+                continue
+            valid_reviews = [r for r in entry.get('reviews', []) if isinstance(r, dict) and 'date' in r and 'text' in r]
+            start, stop = len(valid_reviews) * part // parts, len(valid_reviews) * (part + 1) // parts
+            review_masks = match_reviews(valid_reviews[start:stop], matcher, cache)
+            if cache: cache.commit() # 他のプロセスを待たせないよう、書き込みはピースごとに確定する
+        else:
+            review_masks = list(zip(masks, days))
+        totals, hits = window_counts(review_masks, _worker['cutoffs'], matcher)
+        counted.append((norm_key, unique_id, part,
+                        [mask for mask, _ in review_masks] if matched else None,
+                        [day for _, day in review_masks] if matched else None, totals, hits))
+    return counted, {key: value - before[key] for key, value in cache.stats.items()} if cache else {}
+
+
+def split_pieces(norm_key, unique_id, review_count, hotel_state=None):
+    """1軒分のレビューを PARALLEL_PIECE_REVIEWS 件以下のピースに分ける (巨大なホテル1軒が最後まで残らないように)"""
+    parts = max(1, math.ceil(review_count / PARALLEL_PIECE_REVIEWS))
+    pieces = []
+    for part in range(parts):
+        if hotel_state is None:
+            pieces.append((norm_key, unique_id, part, parts, None, None))
+            continue
+        start, stop = review_count * part // parts, review_count * (part + 1) // parts
+        pieces.append((norm_key, unique_id, part, parts, hotel_state['masks'][start:stop], hotel_state['days'][start:stop]))
+    return pieces
+
+
+def balanced_chunks(pieces, weights, chunk_count):
+    """重い順に、その時点で一番軽いチャンクへ割り当てる (LPT)。同じ入力なら常に同じ分け方になる"""
+    chunks = [[] for _ in range(min(chunk_count, len(pieces)))]
+    loads = [0] * len(chunks)
+    for i in sorted(range(len(pieces)), key=lambda i: (-weights[i], i)):
+        lightest = loads.index(min(loads))
+        chunks[lightest].append(pieces[i])
+        loads[lightest] += weights[i]
+    return chunks
+
+
+def score_groups_parallel(store, hotel_groups, hotel_states, changed_ids, previous_groups,
+                          config, matcher, windows, now, workers, cache_path=None):
+    """
+    [NEW] 再計算が必要なグループをホテル単位 (大きなホテルはさらに分割) のピースに分け、
+    レビュー件数で均等になるようチャンクにまとめてプロセスプールで照合・集計する。
+    件数とヒット数は整数の足し算なので、分け方によらず逐次計算と同じ結果になる。
+    照合したホテルのビットマスクは hotel_states に追加する。
+    戻り値: (analysis_results, group_states, 再計算したグループ数, 照合キャッシュの統計)
+    """
+    recompute = {}
+    pieces, weights = [], []
+    for norm_key, group_members in hotel_groups.items():
+        member_ids = [m['unique_id'] for m in group_members]
+        previous = previous_groups.get(norm_key)
+        if (previous and previous['members'] == member_ids and not changed_ids.intersection(member_ids)
+                and all(uid in hotel_states for uid in member_ids)):
+            continue
+        recompute[norm_key] = True
+        for unique_id in member_ids:
+            hotel_state = hotel_states.get(unique_id)
+            review_count = len(hotel_state['masks']) if hotel_state else (store.meta(unique_id).get('review_count') or 0)
+            for piece in split_pieces(norm_key, unique_id, review_count, hotel_state):
+                pieces.append(piece)
+                weights.append(len(piece[4]) if hotel_state else review_count / piece[3])
+
+    counted = {}
+    cache_stats = {}
+    if pieces:
+        cutoffs = [window_cutoff_day(now, days) for days in windows.values()]
+        chunks = balanced_chunks(pieces, weights, workers * CHUNKS_PER_WORKER)
+        print(f"-> {len(recompute)}グループを{len(pieces)}ピース・{len(chunks)}チャンクに分け、{workers}プロセスで計算します。")
+        with Pool(workers, initializer=_init_worker, initargs=(config, store.store_dir, cache_path, cutoffs)) as pool:
+            for chunk_counted, stats in pool.imap_unordered(_score_chunk, chunks):
+                for item in chunk_counted: counted[item[:3]] = item[3:]
+                for key, value in stats.items(): cache_stats[key] = cache_stats.get(key, 0) + value
+
+    # 照合したホテルのビットマスクはピースの番号順につなぎ、件数とヒット数はグループごとに足し合わせる
+    group_counts = {}
+    for (norm_key, unique_id, part), (masks, days, totals, hits) in sorted(counted.items()):
+        if totals is None: continue # シャードが読めないホテル
+        if masks is not None:
+            hotel_state = hotel_states.setdefault(unique_id, {'last_updated': store.meta(unique_id).get('last_updated'), 'masks': [], 'days': []})
+            hotel_state['masks'].extend(masks)
+            hotel_state['days'].extend(days)
+        if norm_key not in group_counts:
+            group_counts[norm_key] = ([0] * len(windows), [[0] * len(matcher.categories) for _ in windows])
+        group_totals, group_hits = group_counts[norm_key]
+        for i in range(len(windows)):
+            group_totals[i] += totals[i]
+            group_hits[i] = [a + b for a, b in zip(group_hits[i], hits[i])]
+
+    analysis_results, group_states = {}, {}
+    for norm_key, group_members in hotel_groups.items():
+        members = [m for m in group_members if m['unique_id'] in hotel_states]
+        if not members: continue
+        member_ids = [m['unique_id'] for m in members]
+        if norm_key not in recompute:
+            previous = previous_groups[norm_key] # 変化なし: 前回の結果をそのまま使う
+            group_states[norm_key] = previous
+            analysis_results[previous['name']] = previous['entry']
+            continue
+        totals, hits = group_counts[norm_key]
+        results = {name: score_from_counts(totals[i], hits[i], matcher, config['scores'], config['fatal_risks'], config['wow_factors'])
+                   for i, name in enumerate(windows)}
+        name, entry = group_entry(members, results)
+        analysis_results[name] = entry
+        group_states[norm_key] = {'members': member_ids, 'name': name, 'entry': entry}
+    return analysis_results, group_states, len(recompute), cache_stats
+
+
+def group_entry(members, results):
+    """グループの代表名と analysis_results.json の1ホテル分のエントリ (分析完了の行も出力する)"""
+    sources_included = {m['source'] for m in members}
+    name = representative_name(members)
+    scores_text = ', '.join(f"{window}: {result[0]:.1f}" for window, result in results.items())
+    print(f"  - {name} の分析完了。スコア({scores_text}) (Sources: {', '.join(sources_included)})")
+    return name, window_result(results, sorted(list(sources_included)))
+
+
+def group_table(group_member_ids, hotel_states, matcher):
+    """[NEW] グループ (正規化名 -> メンバーの unique_id) のレビューを列ごとの配列の表にまとめる"""
+    return review_table.ReviewTable.from_masks(
+        {norm_key: [(hotel_states[uid]['masks'], hotel_states[uid]['days']) for uid in member_ids]
+         for norm_key, member_ids in group_member_ids.items()}, matcher)
+
+
+def score_history(table, group_states, score_mapping, today=None):
+    """
+    [NEW] グループごとの月次ローリングスコア (各月末までの直近12か月) の推移。
+    戻り値: {'months': ['YYYY-MM', ...], 'window_months': 12, 'hotels': {代表名: {'anshin_score': [...], 'total_reviews': [...]}}}
+    """
+    months, scores, totals = table.monthly_history(score_mapping, today)
+    hotels = {group_states[norm_key]['name']: history_entry(scores[row], totals[row]) for row, norm_key in enumerate(table.keys)}
+    return {'months': months, 'window_months': review_table.HISTORY_WINDOW_MONTHS, 'hotels': hotels}
+
+
+def history_entry(scores, totals):
+    return {'anshin_score': [round(score, 1) for score in scores.tolist()], 'total_reviews': totals.tolist()}
+
+
+def history_writer(path, today):
+    """[NEW] score_history と同じ書式で、グループごとのスコア推移を1件ずつ書き出す"""
+    prefix = (f'{{"months": {json.dumps(review_table.month_labels(today))}, '
+              f'"window_months": {review_table.HISTORY_WINDOW_MONTHS}, "hotels": ')
+    return JsonObjectWriter(path, prefix=prefix, suffix='}')
+
+
+def stream_groups(store, hotel_groups, reader, changed_ids, matcher, score_mapping, fatal_risks, wow_factors,
+                  windows, now, cache, state_header):
+    """
+    [NEW] ストリーミング分析。グループを1つずつ処理し、そのグループのホテルのシャード (または前回の状態の行) だけを読んで
+    スコアと推移を計算し、結果・推移・状態をその場でファイルに書き出す。メモリに載るのは一番大きなグループの分だけ。
+    前回の状態は書き込み時と同じ順に先頭から読むため、状態全体も読み込まない。
+    戻り値: 書き出したグループ数
+    """
+    planned = [m['unique_id'] for members in hotel_groups.values() for m in members]
+    last_updated = {uid: (reader.last_updated[uid] if reader and uid in reader.last_updated and uid not in changed_ids
+                          else store.meta(uid).get('last_updated')) for uid in planned}
+    state_writer = StateWriter(STATE_FILE, {**state_header, 'hotels': [[uid, last_updated[uid]] for uid in planned]})
+    output = JsonObjectWriter(OUTPUT_FILE, indent=2)
+    history = history_writer(HISTORY_FILE, now.date()) if HISTORY_FILE else None
+
+    for norm_key, group_members in hotel_groups.items():
+        members, parts = [], []
+        for member in group_members:
+            unique_id = member['unique_id']
+            hotel_state = reader.hotel(unique_id) if reader and unique_id not in changed_ids else None
+            if hotel_state is None: hotel_state = hotel_review_masks(store, unique_id, matcher, cache)
+            if hotel_state is None: continue # シャードが読めないホテル
+            state_writer.hotel(unique_id, hotel_state)
+            members.append(member)
+            parts.append((hotel_state['masks'], hotel_state['days']))
+        if not members: continue
+
+        review_masks = [pair for masks, days in parts for pair in zip(masks, days)]
+        results = score_windows(review_masks, windows, matcher, score_mapping, fatal_risks, wow_factors, now)
+        name, entry = group_entry(members, results)
+        output.write(name, entry)
+        state_writer.group(norm_key, {'members': [m['unique_id'] for m in members], 'name': name, 'entry': entry})
+        if history:
+            _, scores, totals = review_table.ReviewTable.from_masks({norm_key: parts}, matcher).monthly_history(score_mapping, now.date())
+            history.write(name, history_entry(scores[0], totals[0]))
+
+    output.close()
+    if history: history.close()
+    state_writer.commit()
+    return output.count
+
+
+def write_results(analysis_results, hotel_states, group_states, state_header, matcher, score_mapping, now):
+    """結果・分析状態・スコア推移を書き出す"""
+    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
+        json.dump(analysis_results, f, ensure_ascii=False, indent=2)
+    save_state(STATE_FILE, state_header, hotel_states, group_states)
+    if HISTORY_FILE:
+        # [NEW] 全グループのスコア推移 (保存済みのビットマスクから累積和で計算する)
+        history_table = group_table({norm_key: group['members'] for norm_key, group in group_states.items()}, hotel_states, matcher)
+        with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
+            json.dump(score_history(history_table, group_states, score_mapping, now.date()), f, ensure_ascii=False)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="時間軸分析エンジン (あんしんスコアの算出)")
+    parser.add_argument('--full', action='store_true',
+                        help="前回の分析状態を使わず、全ホテルの本文を照合し直す")
+    parser.add_argument('--rescore', action='store_true',
+                        help="本文を読まず、保存済みのビットマスクと日番号から全グループのスコアだけを計算し直す (日付の繰り上がり・重みの変更用)")
+    parser.add_argument('--workers', type=int, default=SCORE_WORKERS,
+                        help="スコア計算のプロセス数 (1 は逐次)")
+    parser.add_argument('--stream', action='store_true',
+                        help="グループを1つずつ読み込んで計算し、結果を順に書き出す (メモリ使用量が最大のグループの分で済む)")
+    args = parser.parse_args(argv)
+    if args.stream and args.workers > 1: parser.error("--stream と --workers は同時に指定できません")
+    return args
+
+
+def main(argv=None):
+    """
+    日付付きレビューデータを読み込み、config.yml の集計期間 (全期間・直近1年など) ごとのスコアを算出する。
+    [NEW] 前回の分析状態があれば、最終更新日が変わったホテルだけを照合し、影響を受けたグループだけを再計算して
+    前回の結果に反映する。日付が変わった場合は、本文を読まずにビットマスクから全グループを計算し直す。
+    """
+    args = parse_args(argv)
+    print(f"時間軸分析エンジン v4.1.0 (差分分析対応) を起動します...")
 
     # --- 1. 設定ファイルの読み込み ---
     try:
@@ -112,97 +613,133 @@ def main():
         SCORE_MAPPING = config['scores']
         FATAL_RISKS = config['fatal_risks']
         WOW_FACTORS = config['wow_factors']
+        # [NEW] キーワード辞書は起動時に一度だけコンパイルする
+        MATCHER = keyword_matcher.compile_config(config)
+        SCORE_WINDOWS = config.get('score_windows') or DEFAULT_SCORE_WINDOWS
     except Exception as e:
         print(f"エラー: 設定ファイル({CONFIG_FILE})の読み込みに失敗しました。 {e}")
         return
 
-    # --- 2. レビューデータの読み込み ---
+    # --- 2. レビューデータの読み込み (シャードは必要なホテルだけ1軒ずつ読む) ---
     try:
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-            all_hotel_data = json.load(f)
+        all_hotel_data = review_store.open_store(STORE_DIR, INPUT_FILE)
     except Exception as e:
-        print(f"エラー: データファイル({INPUT_FILE})の読み込みに失敗しました。 {e}")
+        print(f"エラー: レビューDB({STORE_DIR})の読み込みに失敗しました。 {e}")
         return
 
-    if not isinstance(all_hotel_data, dict):
-        print(f"エラー: {INPUT_FILE} のデータ形式が不正です。")
+    if len(all_hotel_data) == 0:
+        print(f"エラー: レビューDB({STORE_DIR})にデータがありません。")
         return
 
+    # --- [NEW] 前回の分析状態と、最終更新日が変わったホテル ---
+    signature = dictionary_signature(MATCHER)
+    score_config = score_config_signature(SCORE_MAPPING, SCORE_WINDOWS, FATAL_RISKS, WOW_FACTORS)
+    now = datetime.now()
+    state_header = {'version': STATE_VERSION, 'signature': signature, 'score_config': score_config, 'scored_on': now.date().isoformat()}
+    reader = None if args.full else open_state(STATE_FILE, signature)
+    previous_updated = reader.last_updated if reader else {}
+    if args.rescore:
+        changed_ids = {uid for uid in all_hotel_data.hotels if uid not in previous_updated}
+    else:
+        changed_ids = {uid for uid, meta in all_hotel_data.hotels.items()
+                       if uid not in previous_updated or meta.get('last_updated') is None
+                       or previous_updated[uid] != meta.get('last_updated')}
+    # 結果を再利用できるのは、同じ日に同じ重み・集計期間で計算したグループだけ
+    reusable = (not args.rescore and reader is not None and reader.header.get('score_config') == score_config
+                and reader.header.get('scored_on') == state_header['scored_on'])
+    hotel_states, previous_groups = {}, {}
+    if reader and not args.stream:
+        hotel_states, previous_groups = reader.read_all(set(all_hotel_data.hotels) - changed_ids)
+        reader.close()
+        if not reusable: previous_groups = {}
+    if reader is None:
+        print("-> 前回の分析状態が無い (または辞書が変わった) ため、全ホテルを照合します。")
+    else:
+        print(f"-> 前回の分析状態から差分分析します (照合するホテル: {len(changed_ids)}件"
+              f"{'' if reusable else '、日付または重みが変わったため全グループのスコアを再計算'})。")
+
+    # [NEW] 前回までの照合結果 (キーワードを変えたカテゴリの分は自動で無効になる)
+    cache = match_cache.MatchCache(MATCHER, MATCH_CACHE_FILE) if MATCH_CACHE_FILE and (changed_ids or args.stream) else None
+
     # --- 3. ホテルマッチング（名寄せ） ---
     print("ホテル名の正規化とグループ化を開始します...")
-    hotel_groups = {}
-    for unique_id, data in all_hotel_data.items():
-        original_name = data.get('hotel_name')
-        if not original_name: continue
-        normalized_key = normalize_name(original_name)
-        if not normalized_key: continue
-
-        if normalized_key not in hotel_groups:
-            hotel_groups[normalized_key] = []
-        hotel_groups[normalized_key].append({
-            'unique_id': unique_id,
-            'original_name': original_name,
-            'source': data.get('source', 'unknown'),
-            'reviews': data.get('reviews', [])
-        })
+    hotel_groups = group_hotels(all_hotel_data)
+    merges = []
+    if FUZZY_GROUPING:
+        hotel_groups, merges = merge_similar_groups(hotel_groups)
+        for name, into, similarity in merges:
+            print(f"  - 表記ゆれで統合: {name} -> {into} (類似度 {similarity:.2f})")
+    if ENTITY_MAP_FILE: entity_resolver.save_mapping(ENTITY_MAP_FILE, hotel_groups, merges)
     print(f"-> {len(all_hotel_data)}件のデータを{len(hotel_groups)}グループにまとめました。")
 
-    # --- 4. グループごとにスコア算出 (全期間 + 1年) ---
+    # --- 4. グループごとにスコア算出 (集計期間ごと) ---
     analysis_results = {}
-    print("\n各グループのレビューを統合し、スコア計算を開始します...")
+    group_states = {}
+    recomputed = 0
+    print(f"\n各グループのレビューを統合し、スコア計算を開始します... (集計期間: {', '.join(SCORE_WINDOWS)})")
 
-    one_year_ago = datetime.now() - timedelta(days=365)
+    if args.stream:
+        try:
+            recomputed = stream_groups(all_hotel_data, hotel_groups, reader, changed_ids, MATCHER, SCORE_MAPPING, FATAL_RISKS,
+                                       WOW_FACTORS, SCORE_WINDOWS, now, cache, state_header)
+        except IOError as e:
+            print(f"エラー: 結果ファイルの書き込みに失敗しました。 {e}")
+            return
+        finally:
+            if reader: reader.close()
+    elif args.workers > 1:
+        analysis_results, group_states, recomputed, cache_stats = score_groups_parallel(
+            all_hotel_data, hotel_groups, hotel_states, changed_ids, previous_groups, config, MATCHER,
+            SCORE_WINDOWS, now, args.workers, MATCH_CACHE_FILE if cache is not None else None)
+        if cache is not None:
+            for key, value in cache_stats.items(): cache.stats[key] += value
+    else:
+        pending = [] # (正規化名, メンバー, 再利用する前回の結果)
+        for norm_key, group_members in hotel_groups.items():
+            for member in group_members:
+                unique_id = member['unique_id']
+                if unique_id not in hotel_states:
+                    hotel_state = hotel_review_masks(all_hotel_data, unique_id, MATCHER, cache)
+                    if hotel_state is not None: hotel_states[unique_id] = hotel_state
+            members = [m for m in group_members if m['unique_id'] in hotel_states] # シャードが読めたホテルだけ
+            if not members: continue
+            member_ids = [m['unique_id'] for m in members]
+            previous = previous_groups.get(norm_key)
+            unchanged = previous and previous['members'] == member_ids and not changed_ids.intersection(member_ids)
+            pending.append((norm_key, members, previous if unchanged else None))
 
-    for norm_key, group_members in hotel_groups.items():
+        # [変更] 本文の照合は1レビュー1回。再計算するグループのビットマスクと日番号を1つの表にまとめ、
+        # 全ての集計期間のスコアを全グループ分まとめて NumPy で計算する
+        table = group_table({norm_key: [m['unique_id'] for m in members] for norm_key, members, previous in pending if previous is None},
+                            hotel_states, MATCHER)
+        window_scores = {name: table.scores(window_cutoff_day(now, days), SCORE_MAPPING, FATAL_RISKS, WOW_FACTORS)
+                         for name, days in SCORE_WINDOWS.items()}
+        rows = {norm_key: row for row, norm_key in enumerate(table.keys)}
 
-        representative_name = None
-        rakuten_member = next((m for m in group_members if m['source'] == 'rakuten'), None)
-        representative_name = rakuten_member['original_name'] if rakuten_member else group_members[0]['original_name']
+        for norm_key, members, previous in pending:
+            if previous:
+                group_states[norm_key] = previous # 変化なし: 前回の結果をそのまま使う
+                analysis_results[previous['name']] = previous['entry']
+                continue
+            results = {name: scores[rows[norm_key]] for name, scores in window_scores.items()}
+            name, entry = group_entry(members, results)
+            analysis_results[name] = entry
+            group_states[norm_key] = {'members': [m['unique_id'] for m in members], 'name': name, 'entry': entry}
+            recomputed += 1
 
-        integrated_reviews_with_dates = []
-        sources_included = set()
-        for member in group_members:
-            valid_reviews = [r for r in member['reviews'] if isinstance(r, dict) and 'date' in r and 'text' in r]
-            integrated_reviews_with_dates.extend(valid_reviews)
-            sources_included.add(member['source'])
-
-        # --- 全期間スコア算出 ---
-        score_all, total_all, risks_all_counts, wows_all_counts, risk_rate_all, wow_rate_all, total_risk_points_all, total_wow_points_all = calculate_score(
-            integrated_reviews_with_dates, SCORE_MAPPING, FATAL_RISKS, WOW_FACTORS
-        )
-
-        # --- 1年以内レビュー抽出 & スコア算出 ---
-        one_year_reviews = []
-        for review in integrated_reviews_with_dates:
-            if review.get('date'):
-                 try:
-                      review_date = datetime.strptime(review['date'], '%Y-%m-%d')
-                      if review_date >= one_year_ago:
-                           one_year_reviews.append(review)
-                 except (ValueError, TypeError):
-                      continue
-
-        score_1yr, total_1yr, risks_1yr_counts, wows_1yr_counts, risk_rate_1yr, wow_rate_1yr, total_risk_points_1yr, total_wow_points_1yr = calculate_score(
-            one_year_reviews, SCORE_MAPPING, FATAL_RISKS, WOW_FACTORS
-        )
-
-        analysis_results[representative_name] = {
-            "anshin_score_alltime": score_all,
-            "anshin_score_1year": score_1yr,
-            "total_reviews_alltime": total_all,
-            "total_reviews_1year": total_1yr,
-            "sources": sorted(list(sources_included)),
-            "risk_details_alltime": {"total_risk_points": total_risk_points_all, "risk_rate": risk_rate_all},
-            "wow_details_alltime": {"total_wow_points": total_wow_points_all, "wow_rate": wow_rate_all},
-            "risk_details_1year": {"total_risk_points": total_risk_points_1yr, "risk_rate": risk_rate_1yr},
-            "wow_details_1year": {"total_wow_points": total_wow_points_1yr, "wow_rate": wow_rate_1yr}
-        }
-        print(f"  - {representative_name} の分析完了。スコア(全期間): {score_all:.1f}, スコア(1年): {score_1yr:.1f} (Sources: {', '.join(sources_included)})")
-
-    # --- 5. 最終結果を書き出し ---
+    if args.stream:
+        print(f"-> {recomputed}グループを1つずつ計算し、結果を順に書き出しました。")
+    else:
+        print(f"-> 再計算 {recomputed}グループ / 前回の結果を再利用 {len(group_states) - recomputed}グループ")
+    if cache is not None:
+        cache.close()
+        print(cache.describe())
+
+    # --- 5. 最終結果を書き出し (ストリーミング分析では書き出し済み) ---
     try:
-        with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-            json.dump(analysis_results, f, ensure_ascii=False, indent=2)
+        if not args.stream:
+            write_results(analysis_results, hotel_states, group_states, state_header, MATCHER, SCORE_MAPPING, now)
+        if HISTORY_FILE: print(f"スコア推移 ({review_table.HISTORY_MONTHS}か月分) を {HISTORY_FILE} に保存しました。")
         print("=" * 40)
         print(f"時間軸分析完了。最終結果を {OUTPUT_FILE} に保存しました。")
         print("=" * 40)
@@ -211,4 +748,3 @@ def main():
 
 if __name__ == '__main__':
     main()
-
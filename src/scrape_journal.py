@@ -0,0 +1,61 @@
+import json
+import os
+from datetime import datetime
+
+# --- 設定項目 ---
+JOURNAL_FILE = '../data/processed/scrape_journal.jsonl'
+
+# 再実行時にスキップしてよい (完了済みの) 状態
+FINISHED_STATUSES = ('success', 'no_reviews')
+
+
+def load_journal(path=JOURNAL_FILE):
+    """
+    ジャーナルを読み込み、ユニークID -> 最新の記録 を返す。
+    強制終了で書きかけになった末尾の行は無視する。
+    """
+    records = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line: continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                records[record['unique_id']] = record
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def append_record(path, unique_id, status, new_reviews=0):
+    """
+    1軒分の結果をジャーナルに追記し、ディスクに書き出す (fsync)。
+    レビュー本体はシャードに書き込み済みのため、ジャーナルには状態と新着数だけを残す。
+    """
+    record = {
+        'unique_id': unique_id,
+        'status': status,
+        'new_reviews': new_reviews,
+        'finished_at': datetime.now().isoformat(),
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def finished_ids(records):
+    """再実行時にスキップしてよいユニークIDの集合 (エラーは再取得する)"""
+    return {uid for uid, record in records.items() if record['status'] in FINISHED_STATUSES}
+
+
+def clear_journal(path=JOURNAL_FILE):
+    """最終データの保存に成功したらジャーナルを消す"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
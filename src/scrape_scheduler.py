@@ -0,0 +1,107 @@
+import threading
+import time
+from datetime import datetime
+
+try:
+    import review_store
+except ImportError:
+    from src import review_store
+
+# --- 設定項目 ---
+NEW_HOTEL_EXPECTED_REVIEWS = 100     # 未取得・取得途中・旧形式のホテルの期待新着数 (スコアに直結するため高めに置く)
+EARLY_REFRESH_REVIEWS = 20           # 鮮度期限前でも、これ以上の新着が見込めるホテルは更新対象にする
+EARLY_REFRESH_MIN_DAYS = 1           # 上記の前倒し更新は、最終更新からこの日数以上たったホテルに限る
+BUDGET_EXHAUSTED_ERROR = "実行予算切れ"  # 予算切れで取得を打ち切ったホテルのエラー文言
+
+
+def days_since_update(meta, now=None):
+    """最終更新からの経過日数 (小数)。最終更新日が無い・不正なら None。"""
+    now = now or datetime.now()
+    try:
+        return max(0.0, (now - datetime.fromisoformat(meta['last_updated'])).total_seconds() / 86400)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def expected_new_reviews(meta, now=None):
+    """
+    manifest のメタデータから、今取得した場合に増えそうなレビュー件数を見積もる。
+    直近の投稿ペース (件/日) x 最終更新からの経過日数。データが不完全なホテルは固定値。
+    """
+    if meta is None or meta.get('resume_page') or meta.get('review_format') != review_store.REVIEW_FORMAT:
+        return float(NEW_HOTEL_EXPECTED_REVIEWS)
+    elapsed = days_since_update(meta, now)
+    if elapsed is None: return float(NEW_HOTEL_EXPECTED_REVIEWS)
+    return meta.get('reviews_per_day', 0.0) * elapsed
+
+
+def rank_targets(todo_hotels, store, now=None):
+    """
+    更新対象を期待新着数の多い順に並べ替えて返す (同点なら最終更新が古い順)。
+    戻り値: 並べ替えた {unique_id: data}
+    """
+    now = now or datetime.now()
+
+    def priority(unique_id):
+        meta = store.meta(unique_id)
+        elapsed = days_since_update(meta, now) if meta else None
+        return (-expected_new_reviews(meta, now), -(elapsed if elapsed is not None else float('inf')))
+
+    return {unique_id: todo_hotels[unique_id] for unique_id in sorted(todo_hotels, key=priority)}
+
+
+class BudgetExhausted(Exception):
+    """実行予算を使い切ったため、リクエストを送らずに打ち切ったことを示す"""
+
+
+class ScrapeBudget:
+    """
+    1回の実行で使ってよい時間 (秒) とリクエスト数。どちらも None なら無制限。
+    Poolモードでは shared (Manager の dict、'lock' と 'requests' を持つ) で子プロセス間の使用数を共有する。
+    """
+
+    def __init__(self, time_budget=None, request_budget=None, shared=None):
+        self.deadline = time.time() + time_budget if time_budget else None
+        self.request_budget = request_budget
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._used = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock'] # Poolの子プロセスへ渡すため (共有は shared 側で行う)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def used(self):
+        return self.shared['requests'] if self.shared is not None else self._used
+
+    def try_spend(self):
+        """
+        リクエスト1件分の予算を確保する。使い切っていれば False を返す。
+        判定と計上を同じロック内で行うため、多数の作業員が同時に呼んでも上限を超えない。
+        """
+        if self.shared is not None:
+            with self.shared['lock']:
+                if self.exhausted(): return False
+                self.shared['requests'] += 1
+        else:
+            with self._lock:
+                if self.exhausted(): return False
+                self._used += 1
+        return True
+
+    def exhausted(self):
+        """時間かリクエスト数のどちらかを使い切っていれば True"""
+        if self.deadline is not None and time.time() >= self.deadline: return True
+        return self.request_budget is not None and self.used >= self.request_budget
+
+    def describe(self):
+        parts = []
+        if self.deadline is not None: parts.append(f"残り{max(0, self.deadline - time.time()):.0f}秒")
+        if self.request_budget is not None: parts.append(f"リクエスト{self.used}/{self.request_budget}件")
+        return ', '.join(parts) or '無制限'
@@ -0,0 +1,182 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+# --- 設定項目 ---
+DEFAULT_DSN = 'sqlite:///../data/processed/work_queue.sqlite3'  # srcフォルダからの相対パス。'postgresql://...' も可
+LEASE_SECONDS = 300                  # 取得したタスクの貸出期限（秒）。期限切れは他のノードが取り直す
+MAX_ATTEMPTS = 5                     # これ以上貸し出したタスクは諦める (壊れたページでノードが落ち続けるのを防ぐ)
+
+TABLE_NAME = 'scrape_tasks'
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+    task_id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    lease_owner TEXT,
+    lease_expires DOUBLE PRECISION,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    updated_at DOUBLE PRECISION
+)
+"""
+# status: pending (未着手) -> leased (貸出中) -> done (結果あり・未マージ) -> merged (レビューDBに反映済み)
+
+
+def default_node_id():
+    """ノードID (ホスト名-プロセスID)"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    複数ノードでスクレイピングを分担するための共有タスクキュー (貸出期限付き)。
+    SQLite (1台 / ローカル検証用) と PostgreSQL (複数台) のどちらでも同じSQLで動く。
+    接続はスレッドごとに持つ (ハートビートを別スレッドから送るため)。
+    """
+
+    def __init__(self, dsn=DEFAULT_DSN):
+        self.dsn = dsn
+        self.is_postgres = dsn.startswith(('postgres://', 'postgresql://'))
+        self._local = threading.local()
+        self._execute(SCHEMA)
+
+    # --- 接続とSQL実行 ---
+    def _connect(self):
+        if self.is_postgres:
+            import psycopg2 # db_loader と同じドライバ (PostgreSQL を使う場合のみ必要)
+            return psycopg2.connect(self.dsn)
+        path = self.dsn[len('sqlite:///'):] if self.dsn.startswith('sqlite:///') else self.dsn
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    @property
+    def conn(self):
+        if getattr(self._local, 'conn', None) is None:
+            self._local.conn = self._connect()
+        return self._local.conn
+
+    def _execute(self, query, params=(), fetch=False, many=False):
+        """
+        1文を1トランザクションで実行する (SQLite は書き込みロックを先に取る)。
+        many=True なら params の各要素で繰り返し実行し、変更行数の合計を返す。
+        """
+        if self.is_postgres:
+            with self.conn, self.conn.cursor() as cur:
+                query = query.replace('?', '%s')
+                cur.executemany(query, params) if many else cur.execute(query, params)
+                return cur.fetchall() if fetch else cur.rowcount
+        cur = self.conn.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            cur.executemany(query, params) if many else cur.execute(query, params)
+            result = cur.fetchall() if fetch else cur.rowcount
+            cur.execute('COMMIT')
+            return result
+        except Exception:
+            cur.execute('ROLLBACK')
+            raise
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # --- 登録 (司令塔) ---
+    def publish(self, tasks):
+        """
+        (task_id, payload, priority) のリストを登録する。登録・更新した数を返す。
+        - マージ済み: 新しい内容で未着手に戻す
+        - 未着手・貸出期限切れ: 内容と優先順位 (既知指紋・再開ページ) を新しくする
+        - 上記のうち試行回数を使い切ったもの (abandoned): 試行回数を 0 に戻して再び貸し出せるようにする
+        - 貸出中 (期限内)・完了済み (未マージ): そのままにする
+        """
+        now = time.time()
+        rows = [(task_id, json.dumps(payload, ensure_ascii=False), priority, now) for task_id, payload, priority in tasks]
+        if not rows: return 0
+        table = TABLE_NAME
+        return self._execute(
+            f"INSERT INTO {table} (task_id, payload, priority, status, attempts, updated_at) "
+            f"VALUES (?, ?, ?, 'pending', 0, ?) "
+            f"ON CONFLICT (task_id) DO UPDATE SET payload = excluded.payload, priority = excluded.priority, "
+            f"status = 'pending', lease_owner = NULL, lease_expires = NULL, result = NULL, "
+            f"attempts = CASE WHEN {table}.status = 'merged' OR {table}.attempts >= {int(MAX_ATTEMPTS)} "
+            f"THEN 0 ELSE {table}.attempts END, updated_at = excluded.updated_at "
+            f"WHERE {table}.status IN ('merged', 'pending') "
+            f"OR ({table}.status = 'leased' AND {table}.lease_expires < excluded.updated_at)",
+            rows, many=True)
+
+    # --- 貸出・延長・完了 (各ノード) ---
+    def claim(self, node_id, limit, lease_seconds=LEASE_SECONDS):
+        """
+        未着手か貸出期限切れのタスクを優先順に最大 limit 件借りる。
+        戻り値: [(task_id, payload), ...]
+        """
+        now = time.time()
+        skip_locked = ' FOR UPDATE SKIP LOCKED' if self.is_postgres else ''
+        rows = self._execute(
+            f"UPDATE {TABLE_NAME} SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+            f"attempts = attempts + 1, updated_at = ? "
+            f"WHERE task_id IN (SELECT task_id FROM {TABLE_NAME} "
+            f"WHERE (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) AND attempts < ? "
+            f"ORDER BY priority, task_id LIMIT ?{skip_locked}) "
+            f"RETURNING task_id, payload, priority",
+            (node_id, now + lease_seconds, now, now, MAX_ATTEMPTS, limit), fetch=True)
+        rows.sort(key=lambda row: row[2]) # RETURNING の順序は保証されないため優先順に並べ直す
+        return [(task_id, json.loads(payload)) for task_id, payload, _ in rows]
+
+    def heartbeat(self, node_id, task_ids, lease_seconds=LEASE_SECONDS):
+        """処理中のタスクの貸出期限を延長する。延長できた (まだ自分が借りている) 件数を返す。"""
+        expires = time.time() + lease_seconds
+        rows = [(expires, task_id, node_id) for task_id in task_ids]
+        if not rows: return 0
+        return self._execute(
+            f"UPDATE {TABLE_NAME} SET lease_expires = ? WHERE task_id = ? AND lease_owner = ? AND status = 'leased'",
+            rows, many=True)
+
+    def complete(self, node_id, task_id, result):
+        """
+        結果を書き込んで完了にする。期限切れで他のノードに取られていた場合は False
+        (二重に取得した結果は後から完了した方を捨てる)。
+        """
+        return self._execute(
+            f"UPDATE {TABLE_NAME} SET status = 'done', result = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+            f"WHERE task_id = ? AND lease_owner = ? AND status = 'leased'",
+            (json.dumps(result, ensure_ascii=False), time.time(), task_id, node_id)) == 1
+
+    def release(self, node_id, task_id, count_attempt=True):
+        """タスクを未着手に戻し、他のノード (または次回) に任せる"""
+        attempts = 'attempts' if count_attempt else 'attempts - 1'
+        return self._execute(
+            f"UPDATE {TABLE_NAME} SET status = 'pending', lease_owner = NULL, lease_expires = NULL, "
+            f"attempts = {attempts}, updated_at = ? WHERE task_id = ? AND lease_owner = ? AND status = 'leased'",
+            (time.time(), task_id, node_id)) == 1
+
+    # --- 結果の回収 (司令塔) ---
+    def done_results(self):
+        """完了済み・未マージのタスクを [(task_id, payload, result), ...] で返す"""
+        rows = self._execute(
+            f"SELECT task_id, payload, result FROM {TABLE_NAME} WHERE status = 'done' ORDER BY priority, task_id",
+            fetch=True)
+        return [(task_id, json.loads(payload), json.loads(result)) for task_id, payload, result in rows]
+
+    def mark_merged(self, task_ids):
+        rows = [(time.time(), task_id) for task_id in task_ids]
+        if not rows: return
+        self._execute(f"UPDATE {TABLE_NAME} SET status = 'merged', result = NULL, updated_at = ? WHERE task_id = ?",
+                      rows, many=True)
+
+    def status_counts(self):
+        """状態ごとのタスク数 (上限回数まで失敗して放置されたものは 'abandoned')"""
+        rows = self._execute(
+            f"SELECT CASE WHEN attempts >= ? AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) "
+            f"THEN 'abandoned' ELSE status END, COUNT(*) FROM {TABLE_NAME} GROUP BY 1",
+            (MAX_ATTEMPTS, time.time()), fetch=True)
+        return dict(rows)
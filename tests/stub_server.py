@@ -0,0 +1,327 @@
+"""
+楽天トラベル / じゃらんの代替となるローカルHTTPサーバー (テスト・ベンチマーク用)。
+
+本番と同じマークアップ (li.htl-list-card / .p-yadoCassette / dl.commentReputation /
+jlnpc-kuchikomiCassette) とページ送り (f_page / idx / f_next / N.HTML) で合成ページを返す。
+じゃらんのクチコミは CP932 (charset 指定なし) で返し、最終ページ超過時は 404 か
+最終ページの繰り返し (無限ループ) のどちらかになる。遅延とエラー (429 / 5xx) も注入できる。
+
+使い方:
+    with StubServer(StubSites(rakuten_hotels=50, jalan_hotels=50)) as server:
+        http_client.HOST_OVERRIDES.update(server.host_overrides())
+        ...
+
+単体で起動する場合 (リポジトリ直下で):
+    python tests/stub_server.py --port 8765
+    SCRAPER_HOST_OVERRIDES=... python review_scraper.py   # 起動時に表示される値を使う
+"""
+import argparse
+import hashlib
+import random
+import re
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+RAKUTEN_SEARCH_HOST = 'search.travel.rakuten.co.jp'
+RAKUTEN_REVIEW_HOST = 'review.travel.rakuten.co.jp'
+JALAN_HOST = 'www.jalan.net'
+
+SEARCH_PAGE_SIZE = 30
+REVIEWS_PER_PAGE = {'rakuten': 20, 'jalan': 10}
+PHRASES = [
+    'ドッグランが広くて最高でした。', '犬用アメニティが充実。', '部屋が少し狭い。', '清掃が行き届いていました。',
+    '温泉が気持ちよかったです。', 'おやつビュッフェが嬉しい。', 'レストラン同伴可で助かりました。',
+    '追加料金がかかりました。', 'また利用したいと思います。',
+]
+# 本番ページと同程度の解析コストにするためのヘッダー (グローバルナビ)
+NAV_HTML = '<header><ul class="gnav">' + ''.join(
+    f'<li class="gnav__item"><a href="/area/{i}/">エリア{i}</a></li>' for i in range(60)) + '</ul></header>'
+
+RAKUTEN_REVIEW_PATH = re.compile(r'^/hotel/voice/(\d+)/?$')
+JALAN_REVIEW_PATH = re.compile(r'^/yad(\d+)/kuchikomi(?:/archive)?/?(?:(\d+)\.HTML)?$')
+
+
+def default_review_count(index):
+    """ホテルごとのレビュー件数 (0件のホテルも含めて 0〜120件にばらつかせる)"""
+    return (index * 53) % 121
+
+
+class StubSites:
+    """
+    代替サーバーが返すホテルとレビューの内容 (乱数を使わず、同じ設定なら毎回同じページになる)。
+    regions: 地域名 -> (開始インデックス, 終了インデックス)。検索URLの region パラメータで選ぶ。
+    """
+
+    def __init__(self, rakuten_hotels=60, jalan_hotels=60, review_count=default_review_count,
+                 rakuten_regions=None, jalan_regions=None, base_date=date(2025, 9, 30)):
+        self.rakuten_ids = [100000 + i * 37 for i in range(rakuten_hotels)]
+        self.jalan_ids = [300000 + i * 11 for i in range(jalan_hotels)]
+        self.review_count = review_count
+        self.rakuten_regions = rakuten_regions or {'all': (0, rakuten_hotels)}
+        self.jalan_regions = jalan_regions or {'all': (0, jalan_hotels)}
+        self.base_date = base_date
+
+    # --- ホテル・レビューの内容 ---
+    def total_reviews(self, source, hotel_id):
+        ids = self.rakuten_ids if source == 'rakuten' else self.jalan_ids
+        return self.review_count(ids.index(hotel_id))
+
+    def jalan_end_mode(self, hotel_id):
+        """じゃらんの最終ページ超過時の挙動: IDが偶数なら 404、奇数なら最終ページを繰り返す"""
+        return '404' if hotel_id % 2 == 0 else 'repeat'
+
+    def review(self, source, hotel_id, index):
+        """index 番目 (0 が最新) のレビューの (投稿日, 本文)"""
+        posted = self.base_date - timedelta(days=index * 3 + hotel_id % 5)
+        words = [PHRASES[(hotel_id + index * k) % len(PHRASES)] for k in range(1, 6)]
+        return posted, f"{source}{hotel_id}-{index} " + ''.join(words)
+
+    def region_ids(self, source, region):
+        ids, regions = (self.rakuten_ids, self.rakuten_regions) if source == 'rakuten' else (self.jalan_ids, self.jalan_regions)
+        start, end = regions.get(region or 'all', (0, len(ids)))
+        return ids[start:end]
+
+    # --- ページの組み立て ---
+    def rakuten_search_page(self, region, page):
+        ids = self.region_ids('rakuten', region)
+        chunk = ids[(page - 1) * SEARCH_PAGE_SIZE: page * SEARCH_PAGE_SIZE]
+        cards = ''.join(
+            f'<li class="htl-list-card"><div class="htl-list-card__body"><h2 class="hotel-list__title-text">'
+            f'<a href="https://travel.rakuten.co.jp/HOTEL/{hotel_id}/{hotel_id}.html">ペンション わんわん{hotel_id}</a></h2>\n'
+            f'<p class="htl-list-card__address">栃木県那須郡那須町{hotel_id}</p></div></li>'
+            for hotel_id in chunk)
+        body = f'<main><p class="hotel-count">{len(ids)}件</p><ul class="htl-list">{cards}</ul></main>'
+        return self._page(body, 'utf-8')
+
+    def jalan_search_page(self, region, idx):
+        ids = self.region_ids('jalan', region)
+        if ids and idx >= len(ids):
+            # 最終ページを超えると、最終ページと同じ内容を返し続ける
+            idx = (len(ids) - 1) // SEARCH_PAGE_SIZE * SEARCH_PAGE_SIZE
+        chunk = ids[idx: idx + SEARCH_PAGE_SIZE]
+        cassettes = ''.join(
+            f'<div class="p-yadoCassette p-searchResultItem js-searchResultItem"><div class="p-searchResultItem__summary">\n'
+            f'<h2 class="p-searchResultItem__facilityName">那須高原 犬の宿{hotel_id}</h2>\n'
+            f'<a class="p-searchResultItem__mapButton" href="javascript:void(0);" onclick="openMap(\'yadNo={hotel_id}\');">地図</a>\n'
+            f'</div></div>'
+            for hotel_id in chunk)
+        body = f'<main><p class="jlnpc-searchResultCount">検索結果 <span>{len(ids)}</span>件</p>{cassettes}</main>'
+        return self._page(body, 'cp932', meta_charset=False)
+
+    def rakuten_review_page(self, hotel_id, offset):
+        total = self.total_reviews('rakuten', hotel_id)
+        blocks = []
+        for index in range(offset, min(total, offset + REVIEWS_PER_PAGE['rakuten'])):
+            posted, text = self.review('rakuten', hotel_id, index)
+            blocks.append(
+                f'<dl class="commentReputation">\n<dt><span class="user">user{index}さん [30代/男性]</span>'
+                f'<span class="time">{posted:%Y年%m月%d日} 12:10:00</span></dt>\n'
+                f'<dd><p class="commentTitle">タイトル{index}</p><p class="commentSentence">{text}</p></dd></dl>')
+        body = (f'<main><div class="reviewSummary"><p class="pagingNumber">全<span>{total}</span>件中</p></div>'
+                f'<div id="commentArea">{"".join(blocks)}</div></main>')
+        return self._page(body, 'utf-8')
+
+    def jalan_review_page(self, hotel_id, page):
+        """じゃらんのクチコミページ。最終ページ超過なら None (404) を返す場合がある。"""
+        total = self.total_reviews('jalan', hotel_id)
+        per_page = REVIEWS_PER_PAGE['jalan']
+        last_page = max(1, -(-total // per_page))
+        if page > last_page:
+            if self.jalan_end_mode(hotel_id) == '404': return None
+            page = last_page
+        cassettes = []
+        for index in range((page - 1) * per_page, min(total, page * per_page)):
+            posted, text = self.review('jalan', hotel_id, index)
+            cassettes.append(
+                f'<div class="jlnpc-kuchikomiCassette"><div class="jlnpc-kuchikomiCassette__contWrap">\n'
+                f'<div class="jlnpc-kuchikomiCassette__leftArea"><p class="jlnpc-kuchikomiCassette__user">ゲスト{index}</p></div>\n'
+                f'<div class="jlnpc-kuchikomiCassette__rightArea"><p class="jlnpc-kuchikomiCassette__title">題名{index}</p>\n'
+                f'<p class="jlnpc-kuchikomiCassette__postBody">{text}</p>\n'
+                f'<p class="jlnpc-kuchikomiCassette__postDate">投稿日：{posted:%Y/%m/%d}</p></div></div></div>')
+        body = (f'<main><div class="jlnpc-kuchikomi__head"><p>クチコミ <span class="jlnpc-kuchikomi__count">{total}</span>件</p></div>'
+                f'{"".join(cassettes)}</main>')
+        return self._page(body, 'cp932', meta_charset=False)
+
+    def _page(self, body, encoding, meta_charset=True):
+        meta = f'<meta charset="{encoding.upper()}">' if meta_charset else ''
+        html = f'<!DOCTYPE html>\n<html lang="ja"><head>{meta}<title>stub</title></head><body>{NAV_HTML}{body}</body></html>'
+        return html.encode(encoding)
+
+
+class StubServer:
+    """
+    StubSites の内容を返すスレッド型HTTPサーバー。
+    latency / jitter: 応答ごとの遅延（秒）、error_rate: error_status を返す確率、
+    error_paths: パスにこの文字列を含むリクエストは常に error_status を返す、
+    recorded: パス (クエリ込み) -> (本文, Content-Type) で保存済みページをそのまま返す。
+    """
+
+    def __init__(self, sites=None, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503,
+                 retry_after=None, error_paths=(), recorded=None, etag=True, seed=0, port=0):
+        self.sites = sites or StubSites()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.error_paths = tuple(error_paths)
+        self.recorded = dict(recorded or {})
+        self.etag = etag
+        self.port = port
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'not_found': 0, 'not_modified': 0, 'bytes': 0}
+        self._httpd = None
+        self._thread = None
+
+    # --- 起動・停止 ---
+    def start(self):
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', self.port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is None: return
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def host_overrides(self):
+        """http_client.HOST_OVERRIDES に登録する辞書 (本番ホスト -> このサーバー)"""
+        return {host: self.base_url for host in (RAKUTEN_SEARCH_HOST, RAKUTEN_REVIEW_HOST, JALAN_HOST)}
+
+    def host_overrides_env(self):
+        """環境変数 SCRAPER_HOST_OVERRIDES に設定する文字列"""
+        return ','.join(f"{host}={target}" for host, target in self.host_overrides().items())
+
+    # --- 本番と同じ形式のURL ---
+    @staticmethod
+    def rakuten_search_url(region=None):
+        query = f"&region={region}" if region else ''
+        return f"https://{RAKUTEN_SEARCH_HOST}/ds/undated/search?f_dai=japan&f_pet=1{query}"
+
+    @staticmethod
+    def jalan_search_url(region=None):
+        query = f"&region={region}" if region else ''
+        return f"https://{JALAN_HOST}/uw/uwp2011/uww2011search.do?petFlg=1{query}"
+
+    @staticmethod
+    def rakuten_review_url(hotel_id):
+        return f"https://{RAKUTEN_REVIEW_HOST}/hotel/voice/{hotel_id}/?f_time=&f_sort=0&f_next=0"
+
+    @staticmethod
+    def jalan_review_url(hotel_id):
+        return f"https://{JALAN_HOST}/yad{hotel_id}/kuchikomi/"
+
+    # --- 応答の組み立て ---
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _inject(self, path):
+        """遅延を入れ、エラーを返すべきなら True"""
+        with self._lock:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            failing = self.error_rate and self._random.random() < self.error_rate
+        if delay: time.sleep(delay)
+        return failing or any(fragment in path for fragment in self.error_paths)
+
+    def render(self, raw_path):
+        """リクエストパスに対する (ステータス, 本文, Content-Type) を返す"""
+        if raw_path in self.recorded:
+            body, content_type = self.recorded[raw_path]
+            return 200, body, content_type
+        parsed = urlparse(raw_path)
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        html = 'text/html'
+
+        match = RAKUTEN_REVIEW_PATH.match(parsed.path)
+        if match:
+            body = self.sites.rakuten_review_page(int(match.group(1)), int(query.get('f_next', 0)))
+            return 200, body, html + '; charset=UTF-8'
+        match = JALAN_REVIEW_PATH.match(parsed.path)
+        if match:
+            body = self.sites.jalan_review_page(int(match.group(1)), int(match.group(2) or 1))
+            return (404, b'Not Found', html) if body is None else (200, body, html)
+        if parsed.path.startswith('/ds/'):
+            body = self.sites.rakuten_search_page(query.get('region'), int(query.get('f_page', 1)))
+            return 200, body, html + '; charset=UTF-8'
+        if parsed.path.startswith('/uw/'):
+            return 200, self.sites.jalan_search_page(query.get('region'), int(query.get('idx', 0))), html
+        return 404, b'Not Found', html
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # keep-alive を有効にする
+
+            def do_GET(self):
+                server._count('requests')
+                if server._inject(self.path):
+                    server._count('errors')
+                    headers = {'Retry-After': str(server.retry_after)} if server.retry_after is not None else {}
+                    return self._send(server.error_status, b'error', 'text/plain', headers)
+                status, body, content_type = server.render(self.path)
+                if status == 404: server._count('not_found')
+                headers = {}
+                if status == 200 and server.etag:
+                    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                    if self.headers.get('If-None-Match') == etag:
+                        server._count('not_modified')
+                        return self._send(304, b'', None, {'ETag': etag})
+                    headers['ETag'] = etag
+                self._send(status, body, content_type, headers)
+
+            def _send(self, status, body, content_type, headers):
+                self.send_response(status)
+                if content_type: self.send_header('Content-Type', content_type)
+                for key, value in headers.items(): self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                server._count('bytes', len(body))
+
+            def log_message(self, *args):
+                pass # テスト出力を汚さない
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="楽天トラベル / じゃらんの代替ローカルサーバー")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--hotels', type=int, default=60, help="各サイトのホテル数")
+    parser.add_argument('--latency', type=float, default=0.0, help="応答ごとの遅延（秒）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="503 を返す確率")
+    args = parser.parse_args()
+
+    sites = StubSites(rakuten_hotels=args.hotels, jalan_hotels=args.hotels)
+    server = StubServer(sites, latency=args.latency, error_rate=args.error_rate, port=args.port).start()
+    print(f"代替サーバーを起動しました: {server.base_url}")
+    print(f"SCRAPER_HOST_OVERRIDES={server.host_overrides_env()}")
+    print(f"楽天 検索URL: {server.rakuten_search_url()}")
+    print(f"じゃらん 検索URL: {server.jalan_search_url()}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
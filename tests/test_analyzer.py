@@ -10,7 +10,7 @@ except ImportError:
 
 # --- 1. normalize_name 関数のテスト ---
 
-@pytest.mark.parametrize("input_name, expected_normalized_name", [
+NORMALIZE_NAME_CASES = [
     # [修正] カタカナは全角のまま
     ("ホテルエピナール那須", "エピナール那須"),
     ("那須温泉　ホテルエピナール那須", "エピナール那須"), 
@@ -36,7 +36,10 @@ except ImportError:
     # [修正] 期待値を「除去済み」に変更
     ("ホテルA-B", "a-b"),
     ("ホテルA' B", "ab"),
-])
+]
+
+
+@pytest.mark.parametrize("input_name, expected_normalized_name", NORMALIZE_NAME_CASES)
 def test_normalize_name(input_name, expected_normalized_name):
     """
     normalize_name 関数が様々な表記ゆれを正しく処理できるかテストする (v3.2 Final Fix)。
@@ -118,4 +121,171 @@ def test_calculate_score_empty_reviews():
     assert r_points == 0
     assert w_points == 0
     assert r_rate == 0.0
-    assert w_rate == 0.0
\ No newline at end of file
+    assert w_rate == 0.0
+
+# --- 3. 期間別スコア (score_windows) のテスト ---
+try:
+    from src.score_analyzer import match_reviews, score_windows, window_cutoff_day
+    from src.keyword_matcher import KeywordMatcher
+except ImportError:
+    from score_analyzer import match_reviews, score_windows, window_cutoff_day
+    from keyword_matcher import KeywordMatcher
+
+
+def test_score_windows_match_separate_calculate_score_calls():
+    """ 1回の照合で集計した期間別スコアが、期間ごとに calculate_score を呼んだ結果と一致する。 """
+    now = datetime(2025, 10, 2, 9, 30)
+    reviews = sample_reviews_1 + sample_reviews_2 + [
+        {"date": "2024-10-02", "text": "追加料金が高い"},  # ちょうど1年前 (0時 < 9:30 なので1年以内に入らない)
+        {"date": "2024-10-03", "text": "手作りごはん"},
+        {"date": "不明", "text": "汚い"},               # 日付が不正なら全期間にだけ含める
+        {"date": "2025-10-01", "text": ""},
+    ]
+    matcher = KeywordMatcher(MOCK_SCORE_MAPPING, MOCK_FATAL_RISKS, MOCK_WOW_FACTORS)
+    windows = {'alltime': None, '1year': 365, '90days': 90}
+    results = score_windows(match_reviews(reviews, matcher), windows, matcher,
+                            MOCK_SCORE_MAPPING, MOCK_FATAL_RISKS, MOCK_WOW_FACTORS, now)
+
+    for name, days in windows.items():
+        expected_reviews = [r for r in reviews if days is None or (
+            r['date'][:1].isdigit() and datetime.strptime(r['date'], '%Y-%m-%d') >= now - timedelta(days=days))]
+        assert results[name] == calculate_score(expected_reviews, MOCK_SCORE_MAPPING, MOCK_FATAL_RISKS, MOCK_WOW_FACTORS), name
+    assert results['1year'][1] == 6
+
+
+def test_window_cutoff_day_at_midnight():
+    """ 0時ちょうどなら、期限の日の投稿も含める。 """
+    assert window_cutoff_day(datetime(2025, 10, 2), 1) == datetime(2025, 10, 1).toordinal()
+    assert window_cutoff_day(datetime(2025, 10, 2, 0, 0, 1), 1) == datetime(2025, 10, 2).toordinal()
+    assert window_cutoff_day(datetime(2025, 10, 2), None) is None
+
+
+# --- 4. 差分分析 (前回の状態から変わったグループだけを再計算) のテスト ---
+import json
+import os
+
+try:
+    from src import score_analyzer, review_store
+except ImportError:
+    import score_analyzer
+    import review_store
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'config.yml')
+
+
+def make_hotel(name, source, reviews, last_updated='2025-10-01'):
+    return {'hotel_name': name, 'source': source, 'last_updated': last_updated, 'reviews': reviews}
+
+
+@pytest.fixture
+def analyzer_env(tmp_path, monkeypatch):
+    """ 一時ディレクトリのレビューDBと出力先で score_analyzer.main を動かす。 """
+    for name, path in [('STORE_DIR', tmp_path / 'store'), ('OUTPUT_FILE', tmp_path / 'results.json'),
+                       ('STATE_FILE', tmp_path / 'state.json.gz'), ('MATCH_CACHE_FILE', tmp_path / 'cache.sqlite3'),
+                       ('HISTORY_FILE', tmp_path / 'history.json'), ('ENTITY_MAP_FILE', tmp_path / 'id_map.json'),
+                       ('NAME_CACHE_FILE', tmp_path / 'names.json')]:
+        monkeypatch.setattr(score_analyzer, name, str(path))
+    monkeypatch.setattr(score_analyzer, 'INPUT_FILE', None)
+    monkeypatch.setattr(score_analyzer, 'CONFIG_FILE', CONFIG_PATH)
+    store = review_store.ReviewStore(str(tmp_path / 'store'))
+    today = datetime.now().strftime('%Y-%m-%d')
+    store['r1'] = make_hotel('ホテル森の宿', 'rakuten', [{'date': today, 'text': '部屋が汚い'}, {'date': '2020-01-01', 'text': 'ドッグランが広い'}])
+    store['j1'] = make_hotel('森の宿', 'jalan', [{'date': today, 'text': '追加料金あり'}])
+    store['r2'] = make_hotel('ペンション湖畔', 'rakuten', [{'date': today, 'text': '普通'}])
+    store.flush()
+
+    def run(*argv):
+        score_analyzer.main(list(argv))
+        with open(score_analyzer.OUTPUT_FILE, encoding='utf-8') as f:
+            return f.read()
+    return store, run
+
+
+def test_incremental_run_matches_full_rebuild(analyzer_env, monkeypatch):
+    """ 1軒だけ更新したときの差分分析の結果が、全件の再計算と一致し、他のホテルのシャードは読まない。 """
+    store, run = analyzer_env
+    run()
+    store['j1'] = make_hotel('森の宿', 'jalan', [{'date': '2025-09-01', 'text': '部屋が広い'}], last_updated='2025-10-02')
+    store.flush()
+
+    read_ids = []
+    original_get = review_store.ReviewStore.get
+    monkeypatch.setattr(review_store.ReviewStore, 'get', lambda self, uid, default=None: read_ids.append(uid) or original_get(self, uid, default))
+    incremental = run()
+    assert read_ids == ['j1']
+    assert incremental == run('--full')
+    assert list(json.loads(incremental)) == ['ホテル森の宿', 'ペンション湖畔']
+
+
+def test_rescore_reads_no_shards(analyzer_env, monkeypatch):
+    """ --rescore (日付の繰り上がり用) は保存済みのビットマスクだけで計算し直す。 """
+    store, run = analyzer_env
+    full = run()
+    monkeypatch.setattr(review_store.ReviewStore, 'get', lambda self, uid, default=None: pytest.fail(uid))
+    assert run('--rescore') == full
+
+
+# --- 5. 並列スコア計算のテスト ---
+try:
+    from src.score_analyzer import balanced_chunks
+except ImportError:
+    from score_analyzer import balanced_chunks
+
+
+def test_balanced_chunks_spread_weight_evenly():
+    weights = [50, 10, 10, 10, 10, 10, 5, 5]
+    chunks = balanced_chunks(list(range(len(weights))), weights, 2)
+    assert sorted(sum(weights[i] for i in chunk) for chunk in chunks) == [55, 55]
+    assert chunks == balanced_chunks(list(range(len(weights))), weights, 2) # 同じ入力なら同じ分け方
+    assert len(balanced_chunks([0], [1], 4)) == 1
+
+
+def test_parallel_scoring_matches_serial(analyzer_env, monkeypatch):
+    """ ホテルをピースに分けてプロセスプールで数えた結果が、逐次計算と完全に一致する。 """
+    store, run = analyzer_env
+    today = datetime.now()
+    store['j2'] = make_hotel('湖畔', 'jalan', [
+        {'date': (today - timedelta(days=i * 40)).strftime('%Y-%m-%d'), 'text': ['部屋が汚い', 'ドッグランが広い', '追加料金', '普通'][i % 4]}
+        for i in range(30)])
+    store['x1'] = make_hotel('シャード無し', 'rakuten', [])
+    store.flush()
+    os.remove(store._shard_path('x1'))
+    monkeypatch.setattr(score_analyzer, 'PARALLEL_PIECE_REVIEWS', 4) # 湖畔 (30件) は8つのピースに分かれる
+
+    serial = run('--full')
+    assert run('--full', '--workers', '3') == serial
+    assert run('--rescore', '--workers', '3') == serial # 保存済みのビットマスクを分けて数えても同じ
+    assert run('--workers', '2') == serial              # 並列で作った状態から差分分析しても同じ
+
+
+# --- 6. ストリーミング分析のテスト ---
+def read_outputs():
+    with open(score_analyzer.HISTORY_FILE, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_stream_mode_matches_in_memory_mode(analyzer_env, monkeypatch):
+    """ グループを1つずつ書き出した結果・推移が通常の分析と同じで、状態も互いに引き継げる。 """
+    store, run = analyzer_env
+    expected = run('--full'), read_outputs()
+    assert (run('--full', '--stream'), read_outputs()) == expected
+
+    # ストリーミング分析の状態から差分分析: 更新したホテルのシャードだけを読む
+    store['r2'] = make_hotel('ペンション湖畔', 'rakuten', [{'date': '2025-09-01', 'text': '部屋が汚い'}], last_updated='2025-10-02')
+    store.flush()
+    read_ids = []
+    original_get = review_store.ReviewStore.get
+    monkeypatch.setattr(review_store.ReviewStore, 'get', lambda self, uid, default=None: read_ids.append(uid) or original_get(self, uid, default))
+    streamed = run('--stream'), read_outputs()
+    assert read_ids == ['r2']
+    assert (run(), read_outputs()) == streamed # ストリーミング分析の状態を通常の分析で読む
+    assert read_ids == ['r2']
+    assert (run('--full'), read_outputs()) == streamed
+
+
+def test_stream_mode_writes_empty_results(analyzer_env):
+    store, run = analyzer_env
+    for unique_id in list(store.hotels):
+        os.remove(store._shard_path(unique_id))
+    assert run('--stream') == '{}' == run('--full')
+    assert json.loads(read_outputs())['hotels'] == {}
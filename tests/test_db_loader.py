@@ -0,0 +1,185 @@
+import psycopg2
+
+# テスト対象のモジュールをインポート
+try:
+    from src import db_loader
+except ImportError:
+    import db_loader
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+    def close(self): pass
+
+    def execute(self, query, params=None):
+        self.conn.calls.append(('execute', params))
+        if params is None and 'SELECT' in repr(query):
+            self.conn.calls[-1] = ('select', None)
+            return
+        if isinstance(query, str):
+            self.conn.savepoint(query)
+            return
+        if params is None: return
+        if isinstance(params[0], str):
+            if params[0] in self.conn.bad_names: raise psycopg2.DataError("bad row")
+            self.conn.pending.append(params[0])
+
+    def fetchall(self):
+        return [(name,) for name in self.conn.db_names]
+
+    def copy_expert(self, query, buffer):
+        text = buffer.read()
+        self.conn.calls.append(('copy', text))
+        if any(name in text for name in self.conn.bad_names):
+            raise psycopg2.DataError("bad batch")
+        self.conn.pending.extend(line.split('\t')[0] for line in text.splitlines())
+
+
+class FakeConnection:
+    """
+    DBへの往復 (execute / COPY / commit) を記録するだけの接続。
+    書き込んだホテル名はコミットまで pending に置き、ロールバック・セーブポイントへのロールバックで取り消す。
+    db_names: SELECT で返す、DBに既にあるホテル名
+    """
+    def __init__(self, bad_names=(), db_names=()):
+        self.calls = []
+        self.bad_names = set(bad_names)
+        self.db_names = list(db_names)
+        self.pending, self.persisted, self.savepoints = [], [], []
+
+    def cursor(self): return FakeCursor(self)
+
+    def commit(self):
+        self.calls.append(('commit', None))
+        self.persisted.extend(self.pending)
+        self.pending, self.savepoints = [], []
+
+    def rollback(self):
+        self.calls.append(('rollback', None))
+        self.pending, self.savepoints = [], []
+
+    def savepoint(self, statement):
+        if statement.startswith('SAVEPOINT'): self.savepoints.append(len(self.pending))
+        elif statement.startswith('ROLLBACK TO'): del self.pending[self.savepoints[-1]:]
+        elif statement.startswith('RELEASE'): self.savepoints.pop()
+
+
+def make_entry(score, sources=('rakuten',)):
+    return {
+        'anshin_score_alltime': score, 'anshin_score_1year': None,
+        'total_reviews_alltime': 10, 'total_reviews_1year': 0, 'sources': list(sources),
+        'risk_details_alltime': {'total_risk_points': 3, 'risk_rate': 0.3},
+        'wow_details_alltime': {'total_wow_points': 1, 'wow_rate': 0.1},
+    }
+
+
+def test_copy_line_escapes_text_and_arrays():
+    values = db_loader.build_row("森\tの\\宿", make_entry(4.5, ['rakuten', 'ja"lan']))
+    fields = db_loader.copy_line(values).rstrip('\n').split('\t')
+    assert len(fields) == len(db_loader.COLUMNS)
+    assert fields[0] == "森\\tの\\\\宿"
+    assert fields[db_loader.COLUMNS.index('anshin_score_1year')] == '\\N'
+    assert fields[db_loader.COLUMNS.index('sources')] == '{"rakuten","ja\\\\"lan"}'
+    assert fields[db_loader.COLUMNS.index('risk_rate_alltime')] == '0.3'
+
+
+def test_bulk_upsert_round_trips_scale_with_batches():
+    data = {f"ホテル{i}": make_entry(i / 10) for i in range(25)}
+    data['壊れたデータ'] = dict(make_entry(1.0), sources='rakuten')
+    conn = FakeConnection()
+    assert db_loader.bulk_upsert_data(conn, data, batch_size=10) == 25
+    copies = [text for kind, text in conn.calls if kind == 'copy']
+    assert [len(text.splitlines()) for text in copies] == [10, 10, 5]
+    assert '壊れたデータ' not in ''.join(copies)
+    # バッチごとに 作成・COPY・UPSERT・コミット の4往復
+    assert len(conn.calls) == 3 * 4
+
+
+def test_failed_batch_falls_back_to_row_by_row():
+    data = {f"ホテル{i}": make_entry(1.0) for i in range(6)}
+    conn = FakeConnection(bad_names={"ホテル4"})
+    assert db_loader.bulk_upsert_data(conn, data, batch_size=3) == 5
+    row_names = [params[0] for kind, params in conn.calls if kind == 'execute' and params is not None]
+    assert row_names == ["ホテル3", "ホテル4", "ホテル5"]
+    # 失敗した行の前後の行も取り消されずに残る
+    assert sorted(conn.persisted) == sorted(set(data) - {"ホテル4"})
+
+
+def written_names(conn):
+    """COPY で送ったホテル名と DELETE したホテル名"""
+    copied = [line.split('\t')[0] for kind, text in conn.calls if kind == 'copy' for line in text.splitlines()]
+    deleted = [name for kind, params in conn.calls if kind == 'execute' and params and isinstance(params[0], list)
+               for name in params[0]]
+    return sorted(copied), sorted(deleted)
+
+
+def test_sync_sends_only_changed_and_deleted_hotels(tmp_path):
+    path = str(tmp_path / 'fingerprints.json')
+    data = {f"ホテル{i}": make_entry(i / 10) for i in range(5)}
+
+    conn = FakeConnection()
+    assert db_loader.sync_data(conn, data, path) == (5, 0)
+    assert written_names(conn) == (sorted(data), [])
+
+    # 変更が無ければDBには一切書き込まない
+    conn = FakeConnection()
+    assert db_loader.sync_data(conn, data, path) == (0, 0)
+    assert conn.calls == []
+
+    data['ホテル1'] = make_entry(9.9)
+    data['ホテル5'] = make_entry(1.0)
+    del data['ホテル2']
+    conn = FakeConnection()
+    assert db_loader.sync_data(conn, data, path) == (2, 1)
+    assert written_names(conn) == (['ホテル1', 'ホテル5'], ['ホテル2'])
+
+    conn = FakeConnection()
+    assert db_loader.sync_data(conn, data, path, full=True) == (5, 0)
+
+
+def test_sync_keeps_failed_rows_and_refuses_mass_delete(tmp_path):
+    path = str(tmp_path / 'fingerprints.json')
+    data = {f"ホテル{i}": make_entry(1.0) for i in range(4)}
+    # 一部の行の書き込みに失敗したら、その回の変更分は指紋に残さず次回もう一度送る
+    assert db_loader.sync_data(FakeConnection(bad_names={"ホテル3"}), data, path, batch_size=2) == (3, 0)
+    conn = FakeConnection()
+    assert db_loader.sync_data(conn, data, path) == (4, 0)
+    assert db_loader.sync_data(FakeConnection(), data, path) == (0, 0)
+
+    # 大半のホテルが消えた (分析の失敗らしい) ときは削除しない
+    conn = FakeConnection()
+    assert db_loader.sync_data(conn, {'ホテル0': data['ホテル0']}, path) == (0, 0)
+    assert conn.calls == []
+    conn = FakeConnection()
+    assert db_loader.sync_data(conn, {'ホテル0': data['ホテル0']}, path, allow_mass_delete=True) == (0, 3)
+
+
+def test_sync_without_fingerprints_deletes_rows_missing_from_db(tmp_path):
+    path = str(tmp_path / 'fingerprints.json')
+    data = {f"ホテル{i}": make_entry(1.0) for i in range(6)}
+    # 指紋ファイルが無い (初回・CI) ときは、DBにある行から消えたホテルを求める
+    conn = FakeConnection(db_names=list(data) + ['閉館した宿1', '閉館した宿2'])
+    assert db_loader.sync_data(conn, data, path) == (6, 2)
+    assert written_names(conn) == (sorted(data), ['閉館した宿1', '閉館した宿2'])
+
+    # 指紋ファイルがあれば DB は読まない
+    conn = FakeConnection(db_names=list(data) + ['閉館した宿3'])
+    assert db_loader.sync_data(conn, data, path) == (0, 0)
+    assert conn.calls == []
+    # --full では DB を読み直す
+    assert db_loader.sync_data(conn, data, path, full=True) == (6, 1)
+    assert written_names(conn)[1] == ['閉館した宿3']
+
+    # DBの大半が分析結果に無いときは、指紋が無くても削除しない
+    (tmp_path / 'fingerprints.json').unlink()
+    conn = FakeConnection(db_names=list(data) + [f"別の宿{i}" for i in range(10)])
+    assert db_loader.sync_data(conn, data, path) == (6, 0)
+    assert written_names(conn)[1] == []
+    # 削除しなかったホテルは指紋ファイルに残り、--allow-mass-delete を付ければ DB を読まずに削除される
+    conn = FakeConnection()
+    assert db_loader.sync_data(conn, data, path, allow_mass_delete=True) == (0, 10)
+    assert written_names(conn) == ([], [f"別の宿{i}" for i in range(10)])
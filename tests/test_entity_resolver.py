@@ -0,0 +1,38 @@
+import random
+import time
+
+# テスト対象のモジュールをインポート
+try:
+    from src.entity_resolver import candidate_pairs, ngrams, resolve
+    from src.score_analyzer import normalize_name
+except ImportError:
+    from entity_resolver import candidate_pairs, ngrams, resolve
+    from score_analyzer import normalize_name
+
+
+def test_spelling_variants_across_sites_are_merged():
+    names = [normalize_name('Ｒａｋｕｔｅｎ　ＳＴＡＹ　ＶＩＬＬＡ　日光'), normalize_name('Rakuten STAY VILLA 日光 ～ペット可～'),
+             normalize_name('森の宿'), normalize_name('湖畔荘')]
+    roots, merges = resolve(names, [{'rakuten'}, {'jalan'}, {'rakuten'}, {'jalan'}])
+    assert roots == [0, 0, 2, 3]
+    assert [(i, j) for i, j, _ in merges] == [(1, 0)]
+
+
+def test_same_site_listings_are_not_merged():
+    """ 同じサイトの似た名前 (本館・別館など) は別のホテルのまま。他サイトの1件は一番近い方にだけ付く。 """
+    names = ['わんわんリゾート那須本館', 'わんわんリゾート那須別館', 'わんわんリゾート那須本館ペット']
+    roots, _ = resolve(names, [{'rakuten'}, {'rakuten'}, {'jalan'}])
+    assert roots == [0, 1, 0]
+
+
+def test_blocking_stays_near_linear():
+    """ 候補の組が全ての組 (n^2/2) よりはるかに少なく、数万件でもすぐ終わる。 """
+    rng = random.Random(0)
+    chars = [chr(c) for c in range(0x4E00, 0x4E00 + 3000)]
+    for size in (2000, 20000):
+        names = [''.join(rng.choice(chars) for _ in range(8)) + '温泉' for _ in range(size)]
+        started = time.perf_counter()
+        pairs = list(candidate_pairs([ngrams(name) for name in names])) # 「温泉」のブロックは大きすぎるため使わない
+        resolve(names, [{'rakuten'}] * size)
+        assert time.perf_counter() - started < 10
+        assert len(pairs) < size * size / 2 / 1000
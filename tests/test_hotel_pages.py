@@ -0,0 +1,83 @@
+# テスト対象のモジュールをインポート
+try:
+    from src.review_scraper import HotelPages, review_fingerprint
+except ImportError:
+    from review_scraper import HotelPages, review_fingerprint
+
+RAKUTEN = {'hotel_name': 'R1', 'source': 'rakuten', 'url': 'https://review.travel.rakuten.co.jp/hotel/voice/1/'}
+JALAN = {'hotel_name': 'J1', 'source': 'jalan', 'url': 'https://www.jalan.net/yad1/kuchikomi/'}
+
+
+def page(page_num, count):
+    """page_num ページ目の (レビュー, 先頭レビューの本文)"""
+    reviews = [{'date': '2025-09-01', 'text': f'p{page_num}-{i}'} for i in range(count)]
+    return reviews, reviews[0]['text'] if reviews else None
+
+
+def texts(reviews):
+    return [r['text'] for r in reviews]
+
+
+def test_pages_completed_out_of_order_are_joined_in_page_order():
+    state = HotelPages('rakuten_1', RAKUTEN)
+    assert state.plan_from_total(45) == [2, 3]
+    for page_num, count in [(3, 5), (1, 20), (2, 20)]:
+        state.pages[page_num] = page(page_num, count)
+    reviews, _ = state.assemble()
+    assert texts(reviews) == texts(page(1, 20)[0] + page(2, 20)[0] + page(3, 5)[0])
+    assert state.result()[3:] == (None, None) # エラーが無ければ予定の最終ページまでで完了
+
+
+def test_gap_in_the_middle_resumes_from_the_missing_page():
+    state = HotelPages('rakuten_1', RAKUTEN)
+    state.plan_from_total(60)
+    state.pages[1] = page(1, 20)
+    state.pages[3] = page(3, 20) # 2ページ目は失敗
+    state.fail(2, 'timeout')
+    assert not state.wants(3) and state.wants(1)
+    unique_id, _, reviews, error, resume_page = state.result()
+    assert texts(reviews) == texts(page(1, 20)[0]) # 欠番の後ろのページは使わない
+    assert (error, resume_page) == ('timeout', 2)
+
+
+def test_404_or_repeated_page_ends_the_list():
+    state = HotelPages('jalan_1', JALAN)
+    state.pages[1] = page(1, 10)
+    state.pages[2] = None # 最終ページ超過 (404)
+    state.pages[3] = page(3, 10)
+    assert state.result()[2:] == (page(1, 10)[0], None, None)
+
+    # じゃらんの最終ページの繰り返し: 先頭レビューが前ページと同じなら打ち切る
+    state = HotelPages('jalan_1', JALAN)
+    state.pages[1] = page(1, 10)
+    state.pages[2] = page(1, 10)
+    assert state.is_repeated(2) and state.next_pages_after(2) == []
+    assert texts(state.assemble()[0]) == texts(page(1, 10)[0])
+
+
+def test_under_reported_count_extends_the_plan():
+    state = HotelPages('rakuten_1', RAKUTEN)
+    assert state.plan_from_total(20) == [] # 1ページの予定
+    state.pages[1] = page(1, 20)
+    assert state.next_pages_after(1) == [2] # 予定の最終ページが満杯なら延長する
+    state.pages[2] = page(2, 3)
+    assert state.next_pages_after(2) == []
+    assert len(state.assemble()[0]) == 23
+
+
+def test_unknown_count_chains_pages_one_by_one():
+    state = HotelPages('jalan_1', JALAN)
+    state.pages[1] = page(1, 10)
+    assert state.next_pages_after(1) == [2]
+    state.pages[2] = page(2, 0) # 空ページで終了
+    assert state.next_pages_after(2) == []
+    assert state.result()[2:] == (page(1, 10)[0], None, None)
+
+
+def test_delta_pages_stop_at_first_known_page():
+    known_page = page(2, 20)[0]
+    state = HotelPages('rakuten_1', RAKUTEN, known_fingerprints={review_fingerprint(r) for r in known_page})
+    state.pages[1] = page(1, 20)
+    state.pages[2] = (known_page, known_page[0]['text'])
+    assert state.next_pages_after(1) == [2] and state.next_pages_after(2) == []
+    assert texts(state.assemble()[0]) == texts(page(1, 20)[0])
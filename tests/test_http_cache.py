@@ -0,0 +1,103 @@
+import os
+import time
+
+import pytest
+
+# テスト対象のモジュールをインポート
+try:
+    from src import http_cache, http_client, review_scraper
+    from tests.stub_server import StubServer, StubSites
+except ImportError:
+    import http_cache, http_client, review_scraper
+    from stub_server import StubServer, StubSites
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """HTTPキャッシュを一時フォルダに向け、統計をゼロから数える"""
+    monkeypatch.setattr(http_cache, 'CACHE_DIR', str(tmp_path / 'cache'))
+    http_cache.take_stats()
+    yield
+    http_cache.take_stats()
+
+
+def serve(monkeypatch, server):
+    server.start()
+    monkeypatch.setattr(http_client, 'HOST_OVERRIDES', server.host_overrides())
+    return server
+
+
+def recording_getter(sent):
+    def getter(url, headers=None, timeout=None):
+        sent.append(dict(headers or {}))
+        return http_client.get(url, headers=headers, timeout=timeout)
+    return getter
+
+
+def fetch_and_parse_twice(monkeypatch, url):
+    """1回目は解析してキャッシュに保存し、2回目は解析せずに (解析すると失敗する状態で) 取得する"""
+    first = review_scraper.fetch_and_parse_page(url, 'rakuten', 1)
+    def fail_parse(*args, **kwargs): raise AssertionError("キャッシュがあるのに解析した")
+    monkeypatch.setattr(review_scraper, 'parse_review_page', fail_parse)
+    return first, review_scraper.fetch_and_parse_page(url, 'rakuten', 1)
+
+
+def test_not_modified_returns_cached_extraction(cache, monkeypatch):
+    server = serve(monkeypatch, StubServer(StubSites(rakuten_hotels=1, review_count=lambda i: 25), etag=True))
+    try:
+        url = StubServer.rakuten_review_url(server.sites.rakuten_ids[0])
+        sent = []
+        first = http_cache.fetch(url, getter=recording_getter(sent))
+        second = http_cache.fetch(url, getter=recording_getter(sent))
+        assert 'If-None-Match' not in sent[0] and sent[1]['If-None-Match'] == first.headers['ETag']
+        assert server.stats['not_modified'] == 1
+        assert second.status_code == 200 and second.unchanged and second.content == first.content
+        # 304 応答に無い Content-Type は保存しておいたものを使う
+        assert second.headers['Content-Type'] == first.headers['Content-Type'] == 'text/html; charset=UTF-8'
+
+        first_parsed, second_parsed = fetch_and_parse_twice(monkeypatch, url)
+        assert second_parsed == first_parsed and len(first_parsed[0]) == 20
+        stats = http_cache.take_stats()
+        assert stats['not_modified'] == 3 and stats['misses'] == 1 and stats['parse_skipped'] == 1
+        assert stats['bytes_saved'] == 3 * len(first.content)
+    finally:
+        server.stop()
+
+
+def test_unchanged_body_without_etag_is_a_hit(cache, monkeypatch):
+    server = serve(monkeypatch, StubServer(StubSites(rakuten_hotels=1, review_count=lambda i: 25), etag=False))
+    try:
+        url = StubServer.rakuten_review_url(server.sites.rakuten_ids[0])
+        first_parsed, second_parsed = fetch_and_parse_twice(monkeypatch, url)
+        assert second_parsed == first_parsed
+        stats = http_cache.take_stats()
+        assert stats == {'misses': 1, 'unchanged': 1, 'not_modified': 0, 'bytes_saved': 0, 'parse_skipped': 1}
+        assert server.stats['requests'] == 2 and server.stats['not_modified'] == 0
+    finally:
+        server.stop()
+
+
+def test_prune_removes_entries_not_fetched_recently(cache, monkeypatch):
+    server = serve(monkeypatch, StubServer(StubSites(rakuten_hotels=2, review_count=lambda i: 25), etag=True))
+    try:
+        old_url, fresh_url = (StubServer.rakuten_review_url(hotel_id) for hotel_id in server.sites.rakuten_ids)
+        for url in (old_url, fresh_url): http_cache.fetch(url)
+        old_meta, old_body = http_cache._entry_paths(old_url)
+        fresh_meta, fresh_body = http_cache._entry_paths(fresh_url)
+        stale = time.time() - 40 * 86400
+        os.utime(old_meta, (stale, stale))
+        orphan = os.path.join(os.path.dirname(old_meta), 'orphan.body.gz')
+        with open(orphan, 'wb') as f: f.write(b'x')
+        os.utime(orphan, (stale, stale))
+
+        # 304 で再取得したページは更新時刻が新しくなるため残る
+        os.utime(fresh_meta, (stale, stale))
+        http_cache.fetch(fresh_url)
+
+        removed, removed_bytes = http_cache.prune(max_age_days=30)
+        assert removed == 1 and removed_bytes > 0
+        assert not os.path.exists(old_meta) and not os.path.exists(old_body) and not os.path.exists(orphan)
+        assert os.path.exists(fresh_meta) and os.path.exists(fresh_body)
+        assert http_cache.prune(max_age_days=30) == (0, 0)
+    finally:
+        server.stop()
@@ -0,0 +1,76 @@
+import importlib
+import sys
+import threading
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# テスト対象のモジュールをインポート
+try:
+    from src import http_client
+except ImportError:
+    import http_client
+
+
+def test_session_is_reused_per_thread():
+    session = http_client.get_session()
+    assert http_client.get_session() is session
+    other = []
+    thread = threading.Thread(target=lambda: other.append(http_client.get_session()))
+    thread.start(); thread.join()
+    assert other[0] is not session
+
+
+def test_new_session_after_fork(monkeypatch):
+    session = http_client.get_session()
+    # fork 後の子プロセスではプロセスIDが変わる
+    monkeypatch.setattr(http_client.os, 'getpid', lambda: -1)
+    child_session = http_client.get_session()
+    assert child_session is not session
+    assert http_client.get_session() is child_session
+
+
+def test_default_headers_are_sent(monkeypatch):
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            received.append(dict(self.headers))
+            self.send_response(200)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'ok')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        monkeypatch.setattr(http_client, 'HOST_OVERRIDES',
+                            {'example.test': f"http://127.0.0.1:{server.server_address[1]}"})
+        response = http_client.get('http://example.test/page', headers={'If-None-Match': '"x"'})
+        assert response.status_code == 200
+    finally:
+        server.shutdown()
+        server.server_close()
+    headers = received[0]
+    for key in ('User-Agent', 'Accept', 'Accept-Language', 'Accept-Encoding'):
+        assert headers[key] == http_client.DEFAULT_HEADERS[key]
+    assert headers['If-None-Match'] == '"x"' # 呼び出し側のヘッダーは共通ヘッダーに追加される
+
+
+def reload_with_brotli(monkeypatch, available):
+    """brotli / brotlicffi の有無を切り替えて http_client を読み込み直す"""
+    with monkeypatch.context() as patch:
+        patch.setitem(sys.modules, 'brotli', types.ModuleType('brotli') if available else None)
+        patch.setitem(sys.modules, 'brotlicffi', None)
+        module = importlib.reload(http_client)
+        return module.BROTLI_AVAILABLE, module.DEFAULT_HEADERS['Accept-Encoding']
+
+
+def test_accept_encoding_includes_br_only_with_brotli(monkeypatch):
+    try:
+        assert reload_with_brotli(monkeypatch, True) == (True, 'gzip, deflate, br')
+        assert reload_with_brotli(monkeypatch, False) == (False, 'gzip, deflate')
+    finally:
+        importlib.reload(http_client) # 実際の環境の設定に戻す
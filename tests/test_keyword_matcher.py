@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+# テスト対象のモジュールをインポート
+try:
+    from src.keyword_matcher import KeywordMatcher
+except ImportError:
+    from keyword_matcher import KeywordMatcher
+
+SCORES = {'衛生': -15, '料金': -8, '遊び場': 3, '一緒': 3, '未設定': None}
+FATAL = {'衛生': ['汚い', '前の犬の毛', '犬の毛'], '料金': ['追加料金', '料金'], '未設定': ['犬']}
+WOW = {'遊び場': ['広い', '広々', 'ドッグラン'], '一緒': ['ずっと一緒', '一緒', 'ドッグランで一緒']}
+
+
+def reference_categories(text, score_mapping, fatal_risks, wow_factors):
+    """変更前の calculate_score と同じ総当たり (カテゴリごとに最初の1ヒット、スコア未設定は無視)"""
+    found = set()
+    for category, keywords in {**fatal_risks, **wow_factors}.items():
+        if score_mapping.get(category) is None: continue
+        if any(keyword in text for keyword in keywords): found.add(category)
+    return found
+
+
+def matched(matcher, text):
+    mask = matcher.match(text)
+    return {category for bit, category in enumerate(matcher.categories) if mask >> bit & 1}
+
+
+@pytest.mark.parametrize('backend', ['scan', 'aho-corasick'])
+def test_backends_agree_with_reference(backend):
+    matcher = KeywordMatcher(SCORES, FATAL, WOW, backend)
+    assert matcher.backend == backend
+    # 重なり合う・包含されるキーワードを含む本文をランダムに作る
+    pieces = ['汚', 'い', '前の犬の毛', '追加', '料金', '広', '々', 'ドッグラン', 'で', '一緒', 'ずっと', 'あ', '犬']
+    rng = random.Random(0)
+    for _ in range(500):
+        text = ''.join(rng.choice(pieces) for _ in range(rng.randint(1, 8)))
+        assert matched(matcher, text) == reference_categories(text, SCORES, FATAL, WOW), text
+
+
+def test_automaton_finds_keywords_hidden_inside_longer_ones():
+    matcher = KeywordMatcher(SCORES, FATAL, WOW, 'aho-corasick')
+    assert matched(matcher, 'ドッグランで一緒') == {'遊び場', '一緒'}
+    assert matched(matcher, '前の犬の毛が残っていた') == {'衛生'}
+    assert matched(matcher, '犬') == set() # スコア未設定のカテゴリは数えない
+
+
+def test_auto_backend_switches_on_dictionary_size():
+    assert KeywordMatcher(SCORES, FATAL, WOW, 'auto').backend == 'scan'
+    large = {'衛生': [f'語{i}' for i in range(500)]}
+    assert KeywordMatcher(SCORES, large, {}, 'auto').backend == 'aho-corasick'
@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+# テスト対象のモジュールをインポート
+try:
+    from src import master_index
+    from src.master_index import HotelIndex
+except ImportError:
+    import master_index
+    from master_index import HotelIndex
+
+NOW = datetime(2025, 10, 1, 12, 0, 0)
+
+
+def test_index_keeps_first_seen_and_drops_stale_hotels(tmp_path):
+    index = HotelIndex(str(tmp_path / 'index.json'))
+    index.see('1', '宿A', 'u1', NOW - timedelta(days=40))
+    index.see('2', '宿B', 'u2', NOW - timedelta(days=40))
+    index.see('2', '宿B (改名)', 'u2', NOW)
+    index.save()
+
+    index = HotelIndex(str(tmp_path / 'index.json'))
+    assert index.hotels['2']['first_seen'] == (NOW - timedelta(days=40)).isoformat()
+    assert index.master_rows(NOW) == [{'hotel_name': '宿B (改名)', 'url': 'u2'}] # 宿Aは30日以上見つかっていない
+
+
+def test_full_crawl_interval(tmp_path):
+    index = HotelIndex(str(tmp_path / 'index.json'))
+    assert index.needs_full_crawl('region', NOW)
+    index.mark_full_crawl('region', NOW - timedelta(days=1))
+    assert not index.needs_full_crawl('region', NOW)
+    assert index.needs_full_crawl('region', NOW + timedelta(days=master_index.FULL_CRAWL_DAYS))
+
+
+def test_write_master_csv_reports_diff(tmp_path):
+    path = str(tmp_path / 'master.csv')
+    rows = [{'hotel_name': '宿A', 'url': 'u1'}, {'hotel_name': '宿B', 'url': 'u2'}]
+    assert master_index.write_master_csv(path, rows) == {'added': 2, 'changed': 0, 'removed': 0}
+    assert master_index.write_master_csv(path, rows + [{'hotel_name': '宿C', 'url': 'u3'}])['added'] == 1
+    diff = master_index.write_master_csv(path, [{'hotel_name': '宿A2', 'url': 'u1'}, {'hotel_name': '宿C', 'url': 'u3'}])
+    assert diff == {'added': 0, 'changed': 1, 'removed': 1}
+    assert master_index.read_master_csv(path) == [{'hotel_name': '宿A2', 'url': 'u1'}, {'hotel_name': '宿C', 'url': 'u3'}]
+
+
+def test_seed_from_csv_only_when_index_is_empty(tmp_path):
+    path = str(tmp_path / 'master.csv')
+    master_index.write_master_csv(path, [{'hotel_name': '宿A', 'url': 'u/1'}, {'hotel_name': '宿B', 'url': 'u/2'}])
+    hotel_id = lambda url: url.split('/')[1]
+
+    index = HotelIndex(str(tmp_path / 'index.json'))
+    assert index.seed_from_csv(path, hotel_id, NOW) == 2
+    assert index.master_rows(NOW) == [{'hotel_name': '宿A', 'url': 'u/1'}, {'hotel_name': '宿B', 'url': 'u/2'}]
+    # 既にインデックスがあれば、CSVからは作り直さない
+    index = HotelIndex(str(tmp_path / 'index.json'))
+    index.see('3', '宿C', 'u/3', NOW)
+    assert index.seed_from_csv(path, hotel_id, NOW) == 0
+    assert list(index.hotels) == ['3']
@@ -0,0 +1,46 @@
+import copy
+
+# テスト対象のモジュールをインポート
+try:
+    from src.keyword_matcher import KeywordMatcher
+    from src.match_cache import MatchCache
+except ImportError:
+    from keyword_matcher import KeywordMatcher
+    from match_cache import MatchCache
+
+SCORES = {'衛生': -15, '料金': -8, '遊び場': 3}
+FATAL = {'衛生': ['汚い', '不潔'], '料金': ['追加料金']}
+WOW = {'遊び場': ['広い', 'ドッグラン']}
+TEXTS = ['部屋が汚い', '追加料金あり。ドッグランが広い', '普通', '', '不潔で追加料金', '部屋が汚い']
+
+
+def run(tmp_path, scores=SCORES, fatal=FATAL, wow=WOW):
+    matcher = KeywordMatcher(scores, fatal, wow)
+    cache = MatchCache(matcher, str(tmp_path / 'cache.sqlite3'))
+    masks = cache.match_texts(TEXTS)
+    cache.close()
+    assert masks == [matcher.match(text) if text else 0 for text in TEXTS]
+    return cache.stats
+
+
+def test_rerun_scans_nothing(tmp_path):
+    # 同じ本文は1回だけ照合する
+    assert run(tmp_path) == {'hits': 1, 'partial': 0, 'misses': 4}
+    assert run(tmp_path) == {'hits': 5, 'partial': 0, 'misses': 0}
+
+
+def test_editing_one_category_rescans_only_that_category(tmp_path):
+    run(tmp_path)
+    fatal = copy.deepcopy(FATAL)
+    fatal['料金'].append('別料金')
+    assert run(tmp_path, fatal=fatal) == {'hits': 1, 'partial': 4, 'misses': 0}
+    # 元の辞書に戻すと、以前の照合結果がそのまま使える
+    assert run(tmp_path) == {'hits': 5, 'partial': 0, 'misses': 0}
+
+
+def test_score_only_edits_keep_the_cache(tmp_path):
+    run(tmp_path)
+    scores = dict(SCORES, 衛生=-20, 遊び場=5)
+    assert run(tmp_path, scores=scores) == {'hits': 5, 'partial': 0, 'misses': 0}
+    # カテゴリを加点・減点の間で移しても照合結果は変わらない
+    assert run(tmp_path, fatal={'衛生': FATAL['衛生']}, wow={**WOW, '料金': FATAL['料金']})['hits'] == 5
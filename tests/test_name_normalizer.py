@@ -0,0 +1,61 @@
+import random
+import re
+
+import mojimoji
+import pytest
+
+# テスト対象のモジュールをインポート
+try:
+    from src import name_normalizer
+    from src.name_normalizer import PREFIX_SUFFIX_REGEX, normalize_name, normalize_names
+except ImportError:
+    import name_normalizer
+    from name_normalizer import PREFIX_SUFFIX_REGEX, normalize_name, normalize_names
+
+from test_analyzer import NORMALIZE_NAME_CASES
+
+
+def reference_normalize_name(name):
+    """変更前 (v3.2) の normalize_name"""
+    if not name: return ""
+    normalized = mojimoji.han_to_zen(name, kana=True, ascii=True, digit=True).lower()
+    normalized = re.sub(r'[（\(][^（）()]*[）\)]', '', normalized)
+    symbols_to_remove = '・＆～★＊！？／♪☆　・＆~★*!?/♪☆-' + ' ' + '’' + '\'' + '-'
+    normalized = ''.join(c for c in normalized if c not in symbols_to_remove)
+    normalized = re.sub(r'\s+', '', normalized)
+    for _ in range(3):
+        prev_normalized = normalized
+        normalized = PREFIX_SUFFIX_REGEX.sub('', normalized)
+        if normalized == prev_normalized: break
+    return mojimoji.zen_to_han(normalized, ascii=True, digit=True, kana=False)
+
+
+@pytest.mark.parametrize("input_name, expected_normalized_name", NORMALIZE_NAME_CASES)
+def test_batch_matches_existing_cases(input_name, expected_normalized_name, tmp_path):
+    """ test_analyzer.py の既存のケースで、変換表版・一括版とも同じ結果になる。 """
+    assert normalize_name(input_name) == expected_normalized_name
+    assert normalize_names([input_name], str(tmp_path / 'names.json')) == [expected_normalized_name]
+
+
+def test_random_names_match_reference():
+    """ 記号・空白・半角カナ・括弧・接頭辞を混ぜた名前で、変更前と同じ結果になる。 """
+    pieces = ['ホテル', '那須温泉', 'ペンション', 'ｲﾝ', 'ｶﾞｰﾃﾞﾝ', 'Ａｂｃ', 'inn', '（旧名）', '(別館)', '・', '　', ' ', '\t',
+              '’', "'", '-', '－', '～', '★', 'ー', '森', '犬', '12', '１２', 'リゾート', 'の宿', '　', '\xa0']
+    rng = random.Random(0)
+    for _ in range(3000):
+        name = ''.join(rng.choice(pieces) for _ in range(rng.randint(1, 8)))
+        assert normalize_name(name) == reference_normalize_name(name), name
+
+
+def test_cache_skips_known_names(tmp_path, monkeypatch):
+    path = str(tmp_path / 'names.json')
+    names = ['ホテル森の宿', 'ペンション湖畔', 'ホテル森の宿', None]
+    assert normalize_names(names, path) == ['森', '湖畔', '森', '']
+
+    monkeypatch.setattr(name_normalizer, 'normalize_name', lambda name: pytest.fail(name))
+    assert normalize_names(names, path) == ['森', '湖畔', '森', '']
+
+    # 規則の版が変わるとキャッシュは使わない
+    monkeypatch.setattr(name_normalizer, 'RULESET_VERSION', 'changed')
+    monkeypatch.setattr(name_normalizer, 'normalize_name', lambda name: 'x')
+    assert normalize_names(names, path) == ['x', 'x', 'x', '']
@@ -0,0 +1,85 @@
+import os
+import pytest
+
+# テスト対象の関数をインポート
+try:
+    from src import page_parser
+    from src.review_scraper import parse_review_page
+    from src.rakuten_master_builder import extract_hotels as extract_rakuten_hotels
+    from src.jalan_master_builder import extract_hotels as extract_jalan_hotels
+except ImportError:
+    import page_parser
+    from review_scraper import parse_review_page
+    from rakuten_master_builder import extract_hotels as extract_rakuten_hotels
+    from jalan_master_builder import extract_hotels as extract_jalan_hotels
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+BACKENDS = ['html.parser', 'lxml']
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name), 'rb') as f:
+        return f.read()
+
+
+# --- 1. 文字コード判定のテスト ---
+
+def test_decode_html_prefers_header_charset():
+    content = 'クチコミ 3件'.encode('cp932')
+    text, encoding = page_parser.decode_html(content, 'text/html; charset=Shift_JIS')
+    assert encoding == 'cp932'
+    assert text == 'クチコミ 3件'
+
+
+def test_decode_html_trial_decodes_undeclared_cp932():
+    """charset 宣言のない CP932 ページは UTF-8 で失敗し CP932 で読める"""
+    text, encoding = page_parser.decode_html(load_fixture('jalan_kuchikomi.html'), expect='件')
+    assert encoding == 'cp932'
+    assert '件' in text
+
+
+def test_decode_html_falls_back_when_declared_charset_is_wrong():
+    content = '<meta charset="utf-8">全5件'.encode('cp932')
+    text, encoding = page_parser.decode_html(content, expect='件')
+    assert encoding == 'cp932'
+    assert text.endswith('全5件')
+
+
+# --- 2. バックエンド間の抽出結果一致のテスト ---
+
+@pytest.mark.parametrize("backend_name", BACKENDS)
+def test_parse_rakuten_review_page(backend_name):
+    backend = page_parser.get_backend(backend_name)
+    reviews, first_text, total = parse_review_page(load_fixture('rakuten_review.html'), 'rakuten', 1, backend=backend)
+    assert len(reviews) == 20
+    assert total == 1234
+    assert all(r['date'] and r['date'].startswith('2025-') for r in reviews)
+    assert first_text is None
+
+
+@pytest.mark.parametrize("backend_name", BACKENDS)
+@pytest.mark.parametrize("fixture", ['jalan_kuchikomi.html', 'jalan_kuchikomi_xhtml.html'])
+def test_parse_jalan_review_page(backend_name, fixture):
+    """XML 宣言 (encoding="Shift_JIS") 付きの XHTML ページも同じように読める"""
+    backend = page_parser.get_backend(backend_name)
+    reviews, first_text, total = parse_review_page(load_fixture(fixture), 'jalan', 1, backend=backend)
+    assert len(reviews) == 10
+    assert total == 321
+    assert first_text == reviews[0]['text']
+
+
+def test_backends_extract_identical_results():
+    soup, lxml_backend = (page_parser.get_backend(name) for name in BACKENDS)
+    for name, source in [('rakuten_review.html', 'rakuten'), ('jalan_kuchikomi.html', 'jalan'),
+                         ('jalan_kuchikomi_xhtml.html', 'jalan')]:
+        content = load_fixture(name)
+        assert parse_review_page(content, source, 1, backend=soup) == parse_review_page(content, source, 1, backend=lxml_backend)
+
+    content = load_fixture('rakuten_search.html')
+    url = 'https://search.travel.rakuten.co.jp/ds/undated/search?f_page=1'
+    assert extract_rakuten_hotels(content, url, backend=soup) == extract_rakuten_hotels(content, url, backend=lxml_backend)
+    assert extract_rakuten_hotels(content, url, backend=soup)[0] == 30
+
+    content = load_fixture('jalan_search.html')
+    assert extract_jalan_hotels(content, backend=soup) == extract_jalan_hotels(content, backend=lxml_backend)
+    assert extract_jalan_hotels(content, backend=soup)[1][0] == ['300000', '那須高原 犬の宿0']
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+
+import requests
+
+# テスト対象の関数をインポート
+try:
+    from src import rate_control, review_scraper
+    from src.http_client import is_retryable_error, retry_after_seconds
+except ImportError:
+    import rate_control, review_scraper
+    from http_client import is_retryable_error, retry_after_seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def http_error(status_code, headers=None):
+    error = requests.HTTPError(str(status_code))
+    error.response = FakeResponse(status_code, headers)
+    return error
+
+
+def test_aimd_increases_slowly_and_halves_on_error():
+    rate = rate_control.aimd_next_rate(2.0, True, 0.1, max_rate=4.0)
+    assert rate == 2.0 + rate_control.AIMD_INCREASE
+    assert rate_control.aimd_next_rate(2.0, False) == 1.0
+    # 遅い応答は成功でも減速し、上下限を超えない
+    assert rate_control.aimd_next_rate(2.0, True, rate_control.SLOW_RESPONSE_SECONDS + 1) == 1.0
+    assert rate_control.aimd_next_rate(4.0, True, 0.1, max_rate=4.0) == 4.0
+    assert rate_control.aimd_next_rate(rate_control.MIN_RATE, False) == rate_control.MIN_RATE
+
+
+def test_adaptive_bucket_decreases_once_per_cooldown():
+    bucket = rate_control.AdaptiveTokenBucket(2.0)
+    bucket.on_error()
+    bucket.on_error() # 同時に失敗したリクエストでは1回しか減速しない
+    assert bucket.rate == 1.0
+    for _ in range(1000): bucket.on_success(0.1)
+    assert bucket.rate == bucket.max_rate == 4.0
+
+
+def test_backoff_delay_grows_with_jitter_and_honors_retry_after():
+    for attempt in range(6):
+        ceiling = min(rate_control.BACKOFF_MAX, rate_control.BACKOFF_BASE * 2 ** attempt)
+        assert ceiling / 2 <= rate_control.backoff_delay(attempt) <= ceiling
+    assert rate_control.backoff_delay(0, retry_after=7) == 7
+    assert rate_control.backoff_delay(0, retry_after=10_000) == rate_control.BACKOFF_MAX
+
+
+def test_retryable_errors():
+    assert is_retryable_error(requests.Timeout())
+    assert is_retryable_error(requests.ConnectionError())
+    assert is_retryable_error(http_error(429))
+    assert is_retryable_error(http_error(503))
+    assert not is_retryable_error(http_error(404))
+    assert retry_after_seconds(http_error(429, {'Retry-After': '12'})) == 12.0
+    assert retry_after_seconds(http_error(503)) is None
+
+
+def test_token_bucket_paces_after_burst():
+    bucket = rate_control.TokenBucket(20.0, capacity=2)
+
+    async def acquire_all(count):
+        started = time.monotonic()
+        for _ in range(count): await bucket.acquire()
+        return time.monotonic() - started
+
+    # 容量の2個はすぐに取れ、残りの4個は 1/20 秒ずつ待つ
+    elapsed = asyncio.run(acquire_all(6))
+    assert 4 / 20 - 0.02 <= elapsed < 4 / 20 + 0.15
+
+
+def pool_rate_limiter(rates):
+    """Poolモードの共有辞書の代わり (Manager の dict / Lock と同じ使い方ができる)"""
+    buckets = rate_control.build_host_buckets(rates)
+    return {'lock': threading.Lock(), **review_scraper.pool_host_rates(buckets)}
+
+
+def test_pool_mode_adapts_rate_per_host():
+    limiter = pool_rate_limiter({'www.jalan.net': 2.0, 'review.travel.rakuten.co.jp': 2.0})
+    review_scraper.record_host_outcome(limiter, 'www.jalan.net', False, None) # じゃらんの 429
+    review_scraper.record_host_outcome(limiter, 'www.jalan.net', False, None) # 同時に失敗した分は1回だけ
+    review_scraper.record_host_outcome(limiter, 'review.travel.rakuten.co.jp', True, 0.1)
+    assert limiter['rate:www.jalan.net'] == 1.0
+    assert limiter['rate:review.travel.rakuten.co.jp'] == 2.0 + rate_control.AIMD_INCREASE
+    for _ in range(1000): review_scraper.record_host_outcome(limiter, 'review.travel.rakuten.co.jp', True, 0.1)
+    assert limiter['rate:review.travel.rakuten.co.jp'] == 4.0 # 上限は設定レートの2倍
+
+
+def test_pool_mode_paces_each_host_across_workers():
+    limiter = pool_rate_limiter({'a.example': 20.0, 'b.example': 20.0})
+    started = time.monotonic()
+    # 4作業員が同じホストに2回ずつ: 合計8リクエストを 20 req/s で送る
+    workers = [threading.Thread(target=lambda: [review_scraper.wait_host_slot(limiter, 'a.example') for _ in range(2)])
+               for _ in range(4)]
+    for worker in workers: worker.start()
+    for worker in workers: worker.join()
+    assert 7 / 20 - 0.02 <= time.monotonic() - started < 7 / 20 + 0.2
+    # 別のホストは待たされない
+    started = time.monotonic()
+    review_scraper.wait_host_slot(limiter, 'b.example')
+    assert time.monotonic() - started < 0.02
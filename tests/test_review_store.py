@@ -0,0 +1,90 @@
+import json
+from datetime import date
+import os
+
+# テスト対象のクラスをインポート
+try:
+    from src.review_store import ReviewStore, open_store, review_rate, SCHEMA_VERSION
+except ImportError:
+    from review_store import ReviewStore, open_store, review_rate, SCHEMA_VERSION
+
+
+def make_entry(name, reviews, source='rakuten'):
+    return {'hotel_name': name, 'url': f'https://example.com/{name}', 'source': source,
+            'reviews': reviews, 'last_updated': '2025-10-01T00:00:00'}
+
+
+def test_round_trip_and_manifest(tmp_path):
+    store = ReviewStore(str(tmp_path))
+    entry = make_entry('ホテルA', [{'date': '2025-09-01', 'text': '広い'}])
+    store['rakuten_1'] = entry
+    store.flush()
+
+    reopened = ReviewStore(str(tmp_path))
+    assert 'rakuten_1' in reopened
+    assert reopened['rakuten_1'] == entry
+    assert reopened.meta('rakuten_1')['review_count'] == 1
+    assert reopened.meta('rakuten_1')['hotel_name'] == 'ホテルA'
+    assert reopened.get('missing') is None
+
+
+def test_only_changed_shards_are_written(tmp_path):
+    store = ReviewStore(str(tmp_path))
+    store['rakuten_1'] = make_entry('A', [])
+    store['jalan_2'] = make_entry('B', [], source='jalan')
+    store.flush()
+    untouched = os.path.join(str(tmp_path), 'shards', 'jalan_2.json.gz')
+    before = os.stat(untouched).st_mtime_ns
+
+    store['rakuten_1'] = make_entry('A', [{'date': None, 'text': '新着'}])
+    store.flush()
+    assert os.stat(untouched).st_mtime_ns == before
+    assert [uid for uid, _ in ReviewStore(str(tmp_path)).items()] == ['rakuten_1', 'jalan_2']
+
+
+def test_open_store_imports_legacy_json_once(tmp_path):
+    legacy_path = tmp_path / 'hotel_review_data.json'
+    legacy_path.write_text(json.dumps({'rakuten_1': make_entry('A', [])}, ensure_ascii=False), encoding='utf-8')
+    store_dir = str(tmp_path / 'store')
+
+    store = open_store(store_dir, str(legacy_path))
+    assert len(store) == 1
+
+    legacy_path.write_text(json.dumps({}), encoding='utf-8')
+    assert len(open_store(store_dir, str(legacy_path))) == 1
+
+
+def test_manifest_records_review_format(tmp_path):
+    store = ReviewStore(str(tmp_path))
+    store['rakuten_1'] = make_entry('A', [{'date': '2025-09-01', 'text': '良い'}])
+    store['rakuten_2'] = make_entry('B', ['文字列だけの旧形式'])
+    store['jalan_3'] = make_entry('C', [{'date': None, 'text': '日付なし'}], source='jalan')
+    assert store.meta('rakuten_1')['review_format'] == 2
+    assert store.meta('rakuten_2')['review_format'] == 1
+    assert store.meta('jalan_3')['review_format'] == 1
+
+
+def test_open_store_upgrades_old_manifest(tmp_path):
+    store = ReviewStore(str(tmp_path))
+    store['rakuten_1'] = make_entry('A', ['旧形式'])
+    # スキーマ v1 の manifest (review_format なし) を再現する
+    del store.hotels['rakuten_1']['review_format']
+    store.hotels['rakuten_1']['schema_version'] = 1
+    store.manifest['schema_version'] = 1
+    store.flush()
+
+    reopened = open_store(str(tmp_path), None)
+    assert reopened.meta('rakuten_1')['review_format'] == 1
+    assert ReviewStore(str(tmp_path)).manifest['schema_version'] == SCHEMA_VERSION
+
+
+def test_review_rate_uses_recent_window():
+    today = date(2025, 10, 1)
+    reviews = [{'date': '2025-09-01', 'text': 'a'}, {'date': '2025-08-01', 'text': 'b'},
+               {'date': '2020-01-01', 'text': '古い'}, {'date': None, 'text': '日付なし'}]
+    rate, newest = review_rate(reviews, today)
+    assert newest == '2025-09-01'
+    assert rate == 2 / 365
+    # 投稿歴が短いホテルは最低30日で割る
+    assert review_rate([{'date': '2025-09-30', 'text': 'a'}], today)[0] == 1 / 30
+    assert review_rate([], today) == (0.0, None)
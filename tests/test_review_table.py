@@ -0,0 +1,70 @@
+import random
+from datetime import date, datetime, timedelta
+
+# テスト対象のモジュールをインポート
+try:
+    from src.keyword_matcher import KeywordMatcher
+    from src.review_table import ReviewTable
+    from src.score_analyzer import score_windows, window_cutoff_day
+except ImportError:
+    from keyword_matcher import KeywordMatcher
+    from review_table import ReviewTable
+    from score_analyzer import score_windows, window_cutoff_day
+
+SCORES = {'衛生': -15, '料金': -8, '遊び場': 3, '一緒': 3}
+FATAL = {'衛生': ['汚い'], '料金': ['追加料金'], '未設定': ['犬']}
+WOW = {'遊び場': ['広い'], '一緒': ['一緒']}
+MATCHER = KeywordMatcher(SCORES, FATAL, WOW)
+TODAY = date(2025, 10, 15)
+
+
+def random_hotels(rng, count=40):
+    hotels = {}
+    for h in range(count):
+        parts = []
+        for _ in range(rng.randint(1, 2)): # 名寄せしたグループはメンバーごとに分かれている
+            size = rng.choice([0, 1, 5, 30])
+            masks = [rng.randrange(1 << len(MATCHER.categories)) for _ in range(size)]
+            days = [None if rng.random() < 0.1 else (TODAY - timedelta(days=rng.randint(0, 1200))).toordinal() for _ in range(size)]
+            parts.append((masks, days))
+        hotels[f"h{h}"] = parts
+    return hotels
+
+
+def test_vectorized_scores_match_score_windows():
+    """ 全ホテル分まとめて計算したスコアが、ホテルごとの score_windows と完全に一致する。 """
+    hotels = random_hotels(random.Random(0))
+    table = ReviewTable.from_masks(hotels, MATCHER)
+    now = datetime(2025, 10, 15, 8, 0)
+    windows = {'alltime': None, '1year': 365, '30days': 30}
+    vectorized = {name: table.scores(window_cutoff_day(now, days), SCORES, FATAL, WOW) for name, days in windows.items()}
+    for row, parts in enumerate(hotels.values()):
+        review_masks = [pair for masks, days in parts for pair in zip(masks, days)]
+        expected = score_windows(review_masks, windows, MATCHER, SCORES, FATAL, WOW, now)
+        assert {name: scores[row] for name, scores in vectorized.items()} == expected
+
+
+def test_monthly_history_matches_brute_force():
+    """ 累積和で求めた月次ローリングスコアが、月ごとに数え直した結果と一致する。 """
+    hotels = random_hotels(random.Random(1), count=10)
+    table = ReviewTable.from_masks(hotels, MATCHER)
+    months, scores, totals = table.monthly_history(SCORES, TODAY, months=6, window_months=3)
+    assert months == ['2025-05', '2025-06', '2025-07', '2025-08', '2025-09', '2025-10']
+
+    for row, parts in enumerate(hotels.values()):
+        review_masks = [pair for masks, days in parts for pair in zip(masks, days)]
+        for col, label in enumerate(months):
+            year, month = map(int, label.split('-'))
+            end = year * 12 + month - 1
+            in_window = [(mask, day) for mask, day in review_masks if day is not None
+                         and end - 2 <= date.fromordinal(day).year * 12 + date.fromordinal(day).month - 1 <= end]
+            expected = score_windows(in_window, {'w': None}, MATCHER, SCORES, FATAL, WOW)['w']
+            assert totals[row][col] == expected[1]
+            assert round(float(scores[row][col]), 1) == expected[0]
+
+
+def test_empty_table():
+    table = ReviewTable.from_masks({}, MATCHER)
+    assert table.scores(None, SCORES, FATAL, WOW) == []
+    months, scores, totals = table.monthly_history(SCORES, TODAY)
+    assert len(months) == 24 and scores.shape == (0, 24)
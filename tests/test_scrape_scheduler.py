@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+# テスト対象の関数をインポート
+try:
+    from src import scrape_scheduler
+    from src.review_store import ReviewStore
+except ImportError:
+    import scrape_scheduler
+    from review_store import ReviewStore
+
+NOW = datetime(2025, 10, 1, 12, 0, 0)
+
+
+def make_meta(reviews_per_day, days_ago, **extra):
+    meta = {'review_format': 2, 'reviews_per_day': reviews_per_day,
+            'last_updated': (NOW - timedelta(days=days_ago)).isoformat()}
+    meta.update(extra)
+    return meta
+
+
+def test_expected_new_reviews():
+    assert scrape_scheduler.expected_new_reviews(make_meta(0.5, 10), NOW) == 5.0
+    # 未取得・取得途中・旧形式は固定値
+    expected = scrape_scheduler.NEW_HOTEL_EXPECTED_REVIEWS
+    assert scrape_scheduler.expected_new_reviews(None, NOW) == expected
+    assert scrape_scheduler.expected_new_reviews(make_meta(0.5, 10, resume_page=3), NOW) == expected
+    assert scrape_scheduler.expected_new_reviews(make_meta(0.5, 10, review_format=1), NOW) == expected
+
+
+def test_rank_targets_orders_by_expected_new_reviews(tmp_path):
+    store = ReviewStore(str(tmp_path))
+    store.hotels.update({
+        'quiet': make_meta(0.01, 60),
+        'busy': make_meta(2.0, 31),
+        'busy_older': make_meta(1.0, 62),
+    })
+    todo = {uid: {} for uid in ('quiet', 'busy', 'busy_older', 'never')}
+    ranked = scrape_scheduler.rank_targets(todo, store, NOW)
+    # 期待新着数が同じ (62件) なら最終更新が古い方が先
+    assert list(ranked) == ['never', 'busy_older', 'busy', 'quiet']
+
+
+def test_budget_never_overspends():
+    budget = scrape_scheduler.ScrapeBudget(request_budget=3)
+    assert [budget.try_spend() for _ in range(5)] == [True, True, True, False, False]
+    assert budget.exhausted() and budget.used == 3
+    assert not scrape_scheduler.ScrapeBudget().exhausted()
+    assert scrape_scheduler.ScrapeBudget(time_budget=-1).try_spend() is False
@@ -0,0 +1,351 @@
+import asyncio
+import csv
+import threading
+from datetime import timedelta
+
+import pytest
+
+# テスト対象のモジュールをインポート
+try:
+    from src import rakuten_master_builder, jalan_master_builder, master_index, review_scraper
+    from src.rate_control import build_host_buckets
+    from src.review_store import ReviewStore
+    from src.work_queue import WorkQueue
+    from tests.stub_server import StubServer, StubSites
+except ImportError:
+    import rakuten_master_builder, jalan_master_builder, master_index, review_scraper
+    from rate_control import build_host_buckets
+    from review_store import ReviewStore
+    from work_queue import WorkQueue
+    from stub_server import StubServer, StubSites
+
+# 代替サーバー相手なので、レート制限は実質なしにする
+FAST_RATES = {'review.travel.rakuten.co.jp': 1000.0, 'www.jalan.net': 1000.0, 'search.travel.rakuten.co.jp': 1000.0}
+# 0件 / 1ページ未満 / ちょうど割り切れる / 複数ページ のホテルを混ぜる
+REVIEW_COUNTS = [0, 7, 20, 45, 10, 31, 120, 3]
+
+
+@pytest.fixture
+def offline(tmp_path, monkeypatch):
+    """HTTPキャッシュを一時フォルダに向け、本番ホストへの通信を代替サーバーに差し替える"""
+    monkeypatch.setattr(review_scraper.http_cache, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(review_scraper, 'build_host_buckets', lambda: build_host_buckets(FAST_RATES))
+    monkeypatch.setattr(master_index, 'build_host_buckets', lambda: build_host_buckets(FAST_RATES))
+    monkeypatch.setattr(review_scraper, 'backoff_delay', lambda attempt, retry_after=None: 0)
+
+    servers = []
+
+    def serve(server):
+        servers.append(server.start())
+        monkeypatch.setattr(review_scraper.http_client, 'HOST_OVERRIDES', server.host_overrides())
+        return server
+
+    yield serve
+    for server in servers: server.stop()
+
+
+def review_targets(sites):
+    targets = {}
+    for hotel_id in sites.rakuten_ids:
+        targets[f'rakuten_{hotel_id}'] = {'hotel_name': f'R{hotel_id}', 'source': 'rakuten',
+                                          'url': StubServer.rakuten_review_url(hotel_id)}
+    for hotel_id in sites.jalan_ids:
+        targets[f'jalan_{hotel_id}'] = {'hotel_name': f'J{hotel_id}', 'source': 'jalan',
+                                        'url': StubServer.jalan_review_url(hotel_id)}
+    return targets
+
+
+def run_scrape(todo, known=None, resume_pages=None):
+    results = {}
+    asyncio.run(review_scraper.run_async_scrape(todo, lambda r: results.__setitem__(r[0], r), known, resume_pages))
+    return results
+
+
+def make_sites(hotels=8):
+    return StubSites(rakuten_hotels=hotels, jalan_hotels=hotels, review_count=lambda i: REVIEW_COUNTS[i])
+
+
+def test_async_scrape_collects_every_review(offline):
+    sites = make_sites()
+    server = offline(StubServer(sites))
+    results = run_scrape(review_targets(sites))
+
+    for unique_id, (_, data, reviews, error, resume_page) in results.items():
+        source, hotel_id = unique_id.split('_')
+        assert error is None and resume_page is None
+        assert len(reviews or []) == sites.total_reviews(source, int(hotel_id)), unique_id
+        assert all(r['date'] for r in reviews or [])
+    # じゃらんの CP932 ページも文字化けせずに読めている
+    assert results['jalan_300022'][2][0]['text'].startswith('jalan300022-0 ')
+    assert server.stats['not_found'] > 0 # 404 で終わるじゃらんのホテルがある
+
+
+def test_retries_recover_from_injected_errors(offline):
+    sites = make_sites()
+    # 429 をランダムに混ぜても、再試行で全件取れる
+    offline(StubServer(sites, error_rate=0.2, error_status=429, retry_after=0, seed=1))
+    results = run_scrape(review_targets(sites))
+    assert all(r[3] is None for r in results.values())
+    assert sum(len(r[2] or []) for r in results.values()) == 2 * sum(REVIEW_COUNTS)
+
+
+def test_failing_page_is_saved_with_resume_cursor(offline):
+    sites = make_sites()
+    # 120件のホテル (6ページ) の4ページ目 (f_next=60) だけ常に 503 を返す
+    hotel_id = sites.rakuten_ids[6]
+    offline(StubServer(sites, error_paths=['f_next=60']))
+    unique_id = f'rakuten_{hotel_id}'
+    todo = {unique_id: review_targets(sites)[unique_id]}
+    _, _, reviews, error, resume_page = run_scrape(todo)[unique_id]
+    assert error is not None and resume_page == 4
+    assert len(reviews) == 60
+
+
+def test_two_queue_workers_split_the_crawl(offline, tmp_path, monkeypatch):
+    sites = make_sites()
+    offline(StubServer(sites, latency=0.01))
+    monkeypatch.setattr(review_scraper, 'QUEUE_BATCH_SIZE', 3)
+    dsn = f"sqlite:///{tmp_path / 'queue.sqlite3'}"
+    targets = review_targets(sites)
+    review_scraper.publish_queue(WorkQueue(dsn), targets, {}, {})
+
+    # 2台の作業ノードが同じキューから借りる (同じホテルを二重に取得しない)
+    worker_counts = {}
+    threads = [threading.Thread(target=lambda node: worker_counts.__setitem__(
+                   node, review_scraper.run_queue_worker(WorkQueue(dsn), node)), args=(node,))
+               for node in ('node1', 'node2')]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert sum(c['completed'] for c in worker_counts.values()) == len(targets)
+    assert not any(c['lost'] or c['released'] for c in worker_counts.values())
+    assert all(c['completed'] > 0 for c in worker_counts.values())
+
+    store = ReviewStore(str(tmp_path / 'store'))
+    queue = WorkQueue(dsn)
+    counts, merged = review_scraper.merge_queue_results(queue, store)
+    assert sorted(merged) == sorted(targets)
+    assert counts['success'] == sum(1 for n in REVIEW_COUNTS if n) * 2
+    assert sum(store.meta(uid)['review_count'] for uid in store) == 2 * sum(REVIEW_COUNTS)
+    queue.mark_merged(merged)
+    assert queue.status_counts() == {'merged': len(targets)}
+
+
+def test_rakuten_builder_walks_all_pages(offline, tmp_path, monkeypatch):
+    sites = StubSites(rakuten_hotels=45)
+    server = offline(StubServer(sites))
+    url_list = tmp_path / 'search_urls_rakuten.txt'
+    url_list.write_text(server.rakuten_search_url() + '\n', encoding='utf-8')
+    monkeypatch.setattr(rakuten_master_builder, 'URL_LIST_FILE', str(url_list))
+    monkeypatch.setattr(rakuten_master_builder, 'OUTPUT_FILE', str(tmp_path / 'rakuten.csv'))
+    monkeypatch.setattr(rakuten_master_builder, 'INDEX_FILE', str(tmp_path / 'index_rakuten.json'))
+
+    rakuten_master_builder.main()
+    with open(tmp_path / 'rakuten.csv', encoding='utf-8-sig') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['url'] for row in rows] == [
+        f"https://review.travel.rakuten.co.jp/hotel/voice/{hotel_id}/?f_time=&f_keyword=&f_age=0&f_sex=0&f_mem1=0&f_mem2=0&f_mem3=0&f_mem4=0&f_mem5=0&f_teikei=&f_version=2&f_static=1&f_point=0&f_sort=0&f_jrdp=0&f_next=0"
+        for hotel_id in sites.rakuten_ids]
+    assert server.stats['requests'] == 3 # 30件 + 15件 + 0件 (終了)
+
+
+def test_jalan_builder_stops_on_repeated_last_page(offline, tmp_path, monkeypatch):
+    sites = StubSites(jalan_hotels=45)
+    server = offline(StubServer(sites))
+    url_list = tmp_path / 'search_urls_jalan.txt'
+    url_list.write_text(server.jalan_search_url() + '\n', encoding='utf-8')
+    monkeypatch.setattr(jalan_master_builder, 'URL_LIST_FILE', str(url_list))
+    monkeypatch.setattr(jalan_master_builder, 'OUTPUT_FILE', str(tmp_path / 'jalan.csv'))
+    monkeypatch.setattr(jalan_master_builder, 'INDEX_FILE', str(tmp_path / 'index_jalan.json'))
+
+    jalan_master_builder.main()
+    with open(tmp_path / 'jalan.csv', encoding='utf-8-sig') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['hotel_name'] for row in rows] == [f'那須高原 犬の宿{hotel_id}' for hotel_id in sites.jalan_ids]
+    assert server.stats['requests'] == 3 # 30件 + 15件 + 最終ページの繰り返し (終了)
+
+
+def test_rakuten_builder_dedups_and_updates_incrementally(offline, tmp_path, monkeypatch):
+    # 2地域が20件重なる (70件 + 50件 = ユニーク100件)
+    sites = StubSites(rakuten_hotels=100, rakuten_regions={'a': (0, 70), 'b': (50, 100)})
+    server = offline(StubServer(sites))
+    url_list = tmp_path / 'search_urls_rakuten.txt'
+    url_list.write_text(server.rakuten_search_url('a') + '\n' + server.rakuten_search_url('b') + '\n', encoding='utf-8')
+    output = tmp_path / 'rakuten.csv'
+    monkeypatch.setattr(rakuten_master_builder, 'URL_LIST_FILE', str(url_list))
+    monkeypatch.setattr(rakuten_master_builder, 'OUTPUT_FILE', str(output))
+    monkeypatch.setattr(rakuten_master_builder, 'INDEX_FILE', str(tmp_path / 'index.json'))
+
+    def read_ids():
+        with open(output, encoding='utf-8-sig') as f:
+            return [int(row['url'].split('/')[5]) for row in csv.DictReader(f)]
+
+    rakuten_master_builder.main()
+    assert read_ids() == sites.rakuten_ids
+    assert server.stats['requests'] == 7 # a: 30+30+10+0件, b: 30+20+0件
+
+    # 全巡回した直後は差分巡回: 1ページ目が既知のホテルだけなので各地域1リクエストで終わり、CSVも書き換えない
+    before = output.stat().st_mtime_ns
+    rakuten_master_builder.main()
+    assert server.stats['requests'] == 9
+    assert output.stat().st_mtime_ns == before
+
+    # 全巡回の日に新しいホテルが見つかれば、CSVの末尾に追記される
+    server.sites = StubSites(rakuten_hotels=105, rakuten_regions={'a': (0, 70), 'b': (50, 105)})
+    monkeypatch.setattr(master_index, 'FULL_CRAWL_DAYS', 0)
+    rakuten_master_builder.main()
+    assert read_ids() == server.sites.rakuten_ids
+
+
+@pytest.mark.parametrize('builder', [rakuten_master_builder, jalan_master_builder])
+def test_first_run_keeps_csv_rows_of_failed_region(offline, tmp_path, monkeypatch, builder):
+    # インデックスが無い初回実行で、地域 b の検索ページが全て失敗する
+    sites = StubSites(rakuten_hotels=60, jalan_hotels=60,
+                      rakuten_regions={'a': (0, 30), 'b': (30, 60)}, jalan_regions={'a': (0, 30), 'b': (30, 60)})
+    server = offline(StubServer(sites, error_paths=('region=b',)))
+    if builder is rakuten_master_builder:
+        search_url, ids = server.rakuten_search_url, sites.rakuten_ids
+        make_row = lambda hotel_id: {'hotel_name': f'ペンション わんわん{hotel_id}', 'url':
+                                     f"https://review.travel.rakuten.co.jp/hotel/voice/{hotel_id}/?f_time=&f_keyword=&f_age=0&f_sex=0&f_mem1=0&f_mem2=0&f_mem3=0&f_mem4=0&f_mem5=0&f_teikei=&f_version=2&f_static=1&f_point=0&f_sort=0&f_jrdp=0&f_next=0"}
+    else:
+        search_url, ids = server.jalan_search_url, sites.jalan_ids
+        make_row = lambda hotel_id: {'hotel_name': f'那須高原 犬の宿{hotel_id}', 'url': f"https://www.jalan.net/yad{hotel_id}/kuchikomi/"}
+    url_list = tmp_path / 'search_urls.txt'
+    url_list.write_text(search_url('a') + '\n' + search_url('b') + '\n', encoding='utf-8')
+    output = str(tmp_path / 'master.csv')
+    existing = [make_row(hotel_id) for hotel_id in ids]
+    master_index.write_master_csv(output, existing) # 前回 (インデックス導入前) のマスターリスト
+    monkeypatch.setattr(builder, 'URL_LIST_FILE', str(url_list))
+    monkeypatch.setattr(builder, 'OUTPUT_FILE', output)
+    monkeypatch.setattr(builder, 'INDEX_FILE', str(tmp_path / 'index.json'))
+
+    builder.main()
+    assert server.stats['errors'] > 0
+    assert master_index.read_master_csv(output) == existing
+    # 既存のCSVから作ったインデックスには、失敗した地域のホテルも残っている
+    assert set(master_index.HotelIndex(str(tmp_path / 'index.json')).hotels) == {str(hotel_id) for hotel_id in ids}
+
+
+class NewReviewSites(StubSites):
+    """各ホテルの先頭 (最新側) に new_count 件の新着レビューが増えたサイト。既存のレビューはそのまま後ろにずれる"""
+
+    def __init__(self, base, new_count=5):
+        super().__init__(len(base.rakuten_ids), len(base.jalan_ids), base.review_count, base_date=base.base_date)
+        self.new_count = new_count
+
+    def total_reviews(self, source, hotel_id):
+        return super().total_reviews(source, hotel_id) + self.new_count
+
+    def review(self, source, hotel_id, index):
+        if index >= self.new_count: return super().review(source, hotel_id, index - self.new_count)
+        posted = self.base_date + timedelta(days=self.new_count - index)
+        return posted, f"{source}{hotel_id}-new{index} 新しいクチコミです。"
+
+
+def scrape_into_store(mode, todo, store, known):
+    """指定のモードで取得し、結果をレビューDBに反映する"""
+    on_result = lambda result: review_scraper.apply_scrape_result(result, store, known)
+    if mode == 'pool':
+        review_scraper.run_pool_scrape(todo, on_result, known)
+    else:
+        asyncio.run(review_scraper.run_async_scrape(todo, on_result, known))
+
+
+@pytest.mark.parametrize('mode', ['async', 'pool'])
+def test_delta_scrape_adds_only_new_reviews(offline, tmp_path, monkeypatch, mode):
+    monkeypatch.setattr(review_scraper, 'REQUESTS_PER_SECOND', 1000)
+    sites = make_sites()
+    server = offline(StubServer(sites, etag=False))
+    todo = review_targets(sites)
+    store = ReviewStore(str(tmp_path / 'store'))
+    scrape_into_store(mode, todo, store, {})
+    before = {uid: store.meta(uid)['review_count'] for uid in store}
+
+    # 各ホテルの先頭に5件ずつ新着が増えた状態で再取得する
+    server.sites = NewReviewSites(sites)
+    server.stats['requests'] = 0
+    known = review_scraper.build_known_fingerprints(todo, store)
+    assert len(known) == 2 * sum(1 for n in REVIEW_COUNTS if n)
+    scrape_into_store(mode, todo, store, known)
+
+    # 差分取得したホテルは、新着を含む1ページ目と既知レビューだけの2ページ目 (または終端) で巡回を止める。
+    # 0件だったホテルは全件取得 (async は総数から1ページで終わり、pool は空ページ/404 まで進む)
+    zero_review_hotels = 2 * REVIEW_COUNTS.count(0)
+    assert server.stats['requests'] == 2 * len(known) + zero_review_hotels * (1 if mode == 'async' else 2)
+    for uid, entry in store.items():
+        assert store.meta(uid)['review_count'] == before.get(uid, 0) + 5, uid
+        texts = [r['text'] for r in entry['reviews']]
+        source, hotel_id = uid.split('_')
+        assert texts[:5] == [f"{source}{hotel_id}-new{i} 新しいクチコミです。" for i in range(5)]
+        assert len(set(texts)) == len(texts)
+
+
+def test_resume_appends_older_reviews_after_stored_ones(tmp_path):
+    store = ReviewStore(str(tmp_path / 'store'))
+    data = {'hotel_name': 'R1', 'source': 'rakuten', 'url': StubServer.rakuten_review_url(1)}
+    review = lambda i: {'date': f'2025-09-{30 - i:02d}', 'text': f'r{i}'}
+    newest = [review(i) for i in range(3)]
+    store['rakuten_1'] = dict(data, reviews=newest, last_updated='2025-09-30T00:00:00', resume_page=2)
+
+    # 再開ページから取得した古い側のレビュー (先頭は保存済みと重複)
+    older = [review(i) for i in range(2, 6)]
+    assert review_scraper.merge_reviews(newest, older) == newest + older[1:]
+    # 差分取得の対象でも、再開で取得した古い側のレビューは新着に数えない
+    status, entry, new_reviews = review_scraper.apply_scrape_result(('rakuten_1', data, older, None, None), store, {'rakuten_1'})
+    assert status == 'success' and new_reviews == 0
+    assert [r['text'] for r in entry['reviews']] == ['r0', 'r1', 'r2', 'r3', 'r4', 'r5']
+    assert not store.meta('rakuten_1').get('resume_page')
+
+
+def test_main_replays_journal_after_crash(offline, tmp_path, monkeypatch):
+    # 45件 (3ページ) のホテルを3軒: 前回は 成功 / 途中保存 (1ページ目まで) / エラー で強制終了した
+    sites = StubSites(rakuten_hotels=3, jalan_hotels=0, review_count=lambda i: 45)
+    offline(StubServer(sites))
+    targets = review_targets(sites)
+    success_id, partial_id, error_id = targets
+    master = tmp_path / 'rakuten.csv'
+    master.write_text('hotel_name,url\n' + ''.join(f"{t['hotel_name']},{t['url']}\n" for t in targets.values()),
+                      encoding='utf-8')
+    journal = tmp_path / 'journal.jsonl'
+    for name, value in [('RAKUTEN_MASTER_FILE', str(master)), ('JALAN_MASTER_FILE', str(tmp_path / 'none.csv')),
+                        ('STORE_DIR', str(tmp_path / 'store')), ('DATA_FILE', None), ('JOURNAL_FILE', str(journal))]:
+        monkeypatch.setattr(review_scraper, name, value)
+
+    # 前回の実行: シャードは反映時に書き込まれたが、manifest は書き出されないまま終了した
+    previous = run_scrape({uid: targets[uid] for uid in (success_id, partial_id)})
+    crashed = ReviewStore(str(tmp_path / 'store'))
+    review_scraper.apply_scrape_result(previous[success_id], crashed, set())
+    _, data, reviews, _, _ = previous[partial_id]
+    review_scraper.apply_scrape_result((partial_id, data, reviews[:20], 'timeout', 2), crashed, set())
+    for unique_id, status in [(success_id, 'success'), (partial_id, 'partial'), (error_id, 'error')]:
+        review_scraper.scrape_journal.append_record(str(journal), unique_id, status)
+    assert all('entry' not in record for record in review_scraper.scrape_journal.load_journal(str(journal)).values())
+
+    fetched = []
+    run_async_scrape = review_scraper.run_async_scrape
+    def recording_scrape(todo, *args):
+        fetched.extend(todo)
+        return run_async_scrape(todo, *args)
+    monkeypatch.setattr(review_scraper, 'run_async_scrape', recording_scrape)
+    review_scraper.main(['--mode', 'async'])
+
+    assert sorted(fetched) == sorted([partial_id, error_id]) # 成功したホテルは取得し直さない
+    assert not journal.exists()
+    store = ReviewStore(str(tmp_path / 'store'))
+    assert {uid: store.meta(uid)['review_count'] for uid in targets} == {uid: 45 for uid in targets}
+    assert not any(store.meta(uid)['resume_page'] for uid in targets)
+
+
+def test_pool_and_async_modes_return_the_same_results(offline, monkeypatch):
+    monkeypatch.setattr(review_scraper, 'REQUESTS_PER_SECOND', 1000)
+    sites = make_sites()
+    offline(StubServer(sites))
+    todo = review_targets(sites)
+
+    async_results = run_scrape(todo)
+    pool_results = {}
+    review_scraper.run_pool_scrape(todo, lambda r: pool_results.__setitem__(r[0], r))
+    assert pool_results.keys() == async_results.keys() == todo.keys()
+    for unique_id, result in async_results.items():
+        # (unique_id, data, reviews, error, resume_page) が一致する (0件のホテルはどちらも空)
+        assert result[1:2] + result[3:] == pool_results[unique_id][1:2] + pool_results[unique_id][3:], unique_id
+        assert (result[2] or []) == (pool_results[unique_id][2] or []), unique_id
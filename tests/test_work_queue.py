@@ -0,0 +1,99 @@
+import time
+
+# テスト対象のモジュールをインポート
+try:
+    from src import work_queue
+    from src.work_queue import WorkQueue
+except ImportError:
+    import work_queue
+    from work_queue import WorkQueue
+
+
+def make_queue(tmp_path):
+    return WorkQueue(f"sqlite:///{tmp_path / 'queue.sqlite3'}")
+
+
+def publish(queue, *task_ids):
+    return queue.publish([(task_id, {'n': i}, i) for i, task_id in enumerate(task_ids)])
+
+
+def test_claim_in_priority_order_without_overlap(tmp_path):
+    queue = make_queue(tmp_path)
+    assert publish(queue, 'a', 'b', 'c') == 3
+    assert [t for t, _ in queue.claim('node1', 2)] == ['a', 'b']
+    assert queue.claim('node2', 5) == [('c', {'n': 2})] # 貸出中のタスクは他のノードに渡らない
+    assert queue.claim('node3', 5) == []
+
+
+def test_expired_lease_is_reclaimed_and_late_result_is_dropped(tmp_path):
+    queue = make_queue(tmp_path)
+    publish(queue, 'a')
+    queue.claim('node1', 1, lease_seconds=0.05)
+    time.sleep(0.1) # node1 が落ちた (ハートビートが止まった) 想定
+    assert [t for t, _ in queue.claim('node2', 1)] == ['a']
+    assert not queue.complete('node1', 'a', {'late': True}) # 期限切れ後の結果は捨てる
+    assert queue.complete('node2', 'a', {'ok': True})
+    assert queue.done_results() == [('a', {'n': 0}, {'ok': True})]
+
+
+def test_heartbeat_extends_only_own_leases(tmp_path):
+    queue = make_queue(tmp_path)
+    publish(queue, 'a', 'b')
+    queue.claim('node1', 1, lease_seconds=0.05)
+    queue.claim('node2', 1, lease_seconds=0.05)
+    assert queue.heartbeat('node1', ['a', 'b'], lease_seconds=60) == 1
+    time.sleep(0.1)
+    assert [t for t, _ in queue.claim('node3', 5)] == ['b']
+
+
+def test_release_and_attempt_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(work_queue, 'MAX_ATTEMPTS', 2)
+    queue = make_queue(tmp_path)
+    publish(queue, 'a')
+    for _ in range(3): # 予算切れの返却は試行回数に数えない
+        queue.claim('node1', 1)
+        assert queue.release('node1', 'a', count_attempt=False)
+    for _ in range(2):
+        queue.claim('node1', 1)
+        queue.release('node1', 'a')
+    assert queue.claim('node1', 1) == []
+    assert queue.status_counts() == {'abandoned': 1}
+
+
+def test_publish_reopens_only_merged_tasks(tmp_path):
+    queue = make_queue(tmp_path)
+    publish(queue, 'a', 'b')
+    queue.claim('node1', 2)
+    queue.complete('node1', 'a', {})
+    queue.mark_merged(['a'])
+    # b は処理中なので据え置き、マージ済みの a だけ新しい内容で未着手に戻る
+    assert queue.publish([('a', {'n': 10}, 0), ('b', {'n': 11}, 1)]) == 1
+    assert queue.claim('node2', 5) == [('a', {'n': 10})]
+
+
+def test_publish_refreshes_pending_tasks(tmp_path):
+    queue = make_queue(tmp_path)
+    publish(queue, 'a', 'b')
+    # 未着手のタスクは新しい内容 (既知指紋・再開ページ) と優先順位に置き換わる
+    assert queue.publish([('a', {'n': 10, 'resume_page': 3}, 5), ('b', {'n': 11}, 0)]) == 2
+    assert queue.claim('node1', 5) == [('b', {'n': 11}), ('a', {'n': 10, 'resume_page': 3})]
+
+
+def test_publish_revives_abandoned_tasks(tmp_path, monkeypatch):
+    monkeypatch.setattr(work_queue, 'MAX_ATTEMPTS', 2)
+    queue = make_queue(tmp_path)
+    publish(queue, 'a', 'b')
+    # 障害中に a は試行回数を使い切り、b は1回失敗しただけ
+    for _ in range(2):
+        queue.claim('node1', 1)
+        queue.release('node1', 'a')
+    queue.claim('node1', 1)
+    queue.release('node1', 'b')
+    assert queue.status_counts() == {'abandoned': 1, 'pending': 1}
+
+    assert queue.publish([('a', {'n': 10}, 0), ('b', {'n': 11}, 1)]) == 2
+    assert queue.status_counts() == {'pending': 2}
+    assert queue.claim('node2', 5) == [('a', {'n': 10}), ('b', {'n': 11})]
+    # 使い切っていない b の試行回数はそのまま (あと1回で諦める)
+    queue.release('node2', 'a'); queue.release('node2', 'b')
+    assert [t for t, _ in queue.claim('node2', 5)] == ['a']